@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2014-2017 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Merge records from asyncio code, without blocking the event loop.
+
+This module needs Python 3.6+, unlike the rest of the package which also
+supports Python 2.7.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import asyncio
+import logging
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from inspire_json_merger.api import merge
+from inspire_json_merger.instrumentation import MergeInstrumentation
+
+LOGGER = logging.getLogger(__name__)
+
+_DEFAULT = object()
+
+
+class AsyncMerger(object):
+    """Runs merges on an executor, limiting how many run at the same time.
+
+    The merges run on ``executor``, so that the event loop keeps serving
+    I/O while big records are merged. With a
+    :class:`concurrent.futures.ProcessPoolExecutor` they also run in
+    parallel, the records and results being pickled to and from the
+    worker processes.
+
+    The measurements of each merge are passed to ``instrumentation`` in the
+    event loop thread once the merge is over, also for merges run in other
+    processes.
+
+    Args:
+        executor(concurrent.futures.Executor): the executor running the
+            merges. Defaults to a thread pool owned by the merger, see
+            :meth:`shutdown`.
+        max_concurrency(int): maximum number of merges submitted to the
+            executor at the same time, the others waiting for their turn.
+            Defaults to no limit other than the executor's own.
+        timeout(float): default number of seconds to wait for the result of
+            a merge, see :meth:`merge`. Defaults to waiting forever.
+        instrumentation(MergeInstrumentation): receives the measurements of
+            every merge.
+        budget(MergeBudget): limits on the work done by every merge.
+    """
+
+    def __init__(self, executor=None, max_concurrency=None, timeout=None,
+                 instrumentation=None, budget=None):
+        self._owns_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(max_concurrency)
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.instrumentation = instrumentation
+        self.budget = budget
+        self._semaphore = None
+
+    async def merge(self, root, head, update, head_source=None, timeout=_DEFAULT):
+        """Merge a record, like :func:`inspire_json_merger.api.merge`.
+
+        Cancelling the call cancels the merge if it didn't start yet.
+        Otherwise, its result is discarded when it's over, as a merge can't
+        be interrupted: until then, it still counts towards
+        ``max_concurrency``.
+
+        Args:
+            timeout(float): seconds to wait for the result of the merge,
+                including the time spent waiting for its turn. Defaults to
+                the ``timeout`` of the merger.
+
+        Raises:
+            asyncio.TimeoutError: if the merge took longer than ``timeout``.
+        """
+        if timeout is _DEFAULT:
+            timeout = self.timeout
+        return await asyncio.wait_for(
+            self._merge(root, head, update, head_source), timeout
+        )
+
+    async def merge_many(self, triples, on_error=None, max_in_flight=None):
+        """Merge many records, like :func:`inspire_json_merger.api.merge_many`.
+
+        Args:
+            triples(Iterable[tuple]): the records to merge, either an
+                iterable or an asynchronous iterable of ``(root, head,
+                update)`` or ``(root, head, update, head_source)`` tuples.
+            on_error(callable): called as ``on_error(index, triple,
+                exception)`` when merging the ``index``-th triple fails or
+                times out.
+            max_in_flight(int): maximum number of records being merged and
+                not yet yielded. ``triples`` is consumed only as fast as the
+                results are, which bounds the memory used. Defaults to twice
+                ``max_concurrency``, or to twice the number of CPUs.
+
+        Returns:
+            An asynchronous iterator over the ``(merged, conflicts)`` tuples,
+            in the same order as ``triples``. A record which failed to merge
+            yields ``(None, None)``.
+        """
+        max_in_flight = max_in_flight or 2 * (self.max_concurrency or os.cpu_count() or 1)
+        pending = deque()
+        try:
+            index = 0
+            async for triple in _aiterate(triples):
+                pending.append((index, triple, asyncio.ensure_future(self._merge_triple(triple))))
+                index += 1
+                if len(pending) >= max_in_flight:
+                    yield await _get_result(pending.popleft(), on_error)
+            while pending:
+                yield await _get_result(pending.popleft(), on_error)
+        finally:
+            for _, _, task in pending:
+                task.cancel()
+
+    def shutdown(self, wait=True):
+        """Shut down the executor, if it was created by the merger."""
+        if self._owns_executor:
+            self.executor.shutdown(wait)
+
+    async def _merge_triple(self, triple):
+        return await self.merge(*triple)
+
+    async def _merge(self, root, head, update, head_source):
+        loop = asyncio.get_event_loop()
+        semaphore = self._get_semaphore()
+        if semaphore is not None:
+            await semaphore.acquire()
+        try:
+            future = self.executor.submit(
+                _merge_in_executor, root, head, update, head_source,
+                self.budget, self.instrumentation is not None,
+            )
+        except BaseException:
+            if semaphore is not None:
+                semaphore.release()
+            raise
+
+        if semaphore is not None:
+            future.add_done_callback(
+                lambda _: loop.call_soon_threadsafe(semaphore.release)
+            )
+        result, calls = await asyncio.wrap_future(future)
+        if self.instrumentation is not None:
+            for method, args in calls:
+                getattr(self.instrumentation, method)(*args)
+        return result
+
+    def _get_semaphore(self):
+        if self.max_concurrency and self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+
+async def amerge(root, head, update, head_source=None, executor=None,
+                 timeout=None, instrumentation=None, budget=None):
+    """Merge a record without blocking the event loop.
+
+    See :class:`AsyncMerger` for the arguments, and use it directly to
+    limit the number of merges running at the same time.
+    """
+    merger = AsyncMerger(executor, timeout=timeout, instrumentation=instrumentation, budget=budget)
+    try:
+        return await merger.merge(root, head, update, head_source)
+    finally:
+        merger.shutdown(wait=False)
+
+
+async def amerge_many(triples, on_error=None, executor=None, max_concurrency=None,
+                      max_in_flight=None, timeout=None, instrumentation=None, budget=None):
+    """Merge many records without blocking the event loop.
+
+    See :class:`AsyncMerger` and :meth:`AsyncMerger.merge_many` for the
+    arguments, ``timeout`` applying to each merge.
+    """
+    merger = AsyncMerger(executor, max_concurrency, timeout, instrumentation, budget)
+    try:
+        async for result in merger.merge_many(triples, on_error, max_in_flight):
+            yield result
+    finally:
+        merger.shutdown(wait=False)
+
+
+class _RecordedCalls(MergeInstrumentation):
+    """Instrumentation keeping its calls, to replay them in another process."""
+
+    def __init__(self):
+        self.calls = []
+
+    def on_configuration(self, configuration):
+        self.calls.append(('on_configuration', (configuration,)))
+
+    def on_record_sizes(self, sizes):
+        self.calls.append(('on_record_sizes', (sizes,)))
+
+    def on_pre_filter(self, pre_filter, duration):
+        self.calls.append(('on_pre_filter', (pre_filter, duration)))
+
+    def on_stage(self, stage, duration):
+        self.calls.append(('on_stage', (stage, duration)))
+
+    def on_conflicts(self, unfiltered, filtered):
+        self.calls.append(('on_conflicts', (unfiltered, filtered)))
+
+    def on_merge(self, duration):
+        self.calls.append(('on_merge', (duration,)))
+
+    def on_degraded(self, reason, details):
+        self.calls.append(('on_degraded', (reason, details)))
+
+
+def _merge_in_executor(root, head, update, head_source, budget, record_calls):
+    recorded = _RecordedCalls() if record_calls else None
+    result = merge(root, head, update, head_source, recorded, budget)
+    return result, recorded.calls if recorded else []
+
+
+async def _aiterate(iterable):
+    if hasattr(iterable, '__aiter__'):
+        async for item in iterable:
+            yield item
+    else:
+        for item in iterable:
+            yield item
+
+
+async def _get_result(pending_merge, on_error):
+    index, triple, task = pending_merge
+    try:
+        return await task
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        error = e
+
+    LOGGER.error('Failed to merge record number %d of the batch: %r', index, error)
+    if on_error:
+        on_error(index, triple, error)
+    return None, None
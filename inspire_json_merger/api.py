@@ -22,23 +22,43 @@
 
 from __future__ import absolute_import, division, print_function
 
+import logging
+from contextlib import contextmanager
+
 from inspire_utils.record import get_value
 from inspire_utils.helpers import force_list
 from json_merger.merger import MergeError, Merger
 
+from inspire_json_merger.budget import BudgetTracker, BudgetedMerger, active_budget
 from inspire_json_merger.config import (
     ArxivOnArxivOperations,
     ArxivOnPublisherOperations,
     ManualMergeOperations,
     PublisherOnArxivOperations,
     PublisherOnPublisherOperations,
+    get_merge_plan,
+)
+from inspire_json_merger.instrumentation import (
+    NO_INSTRUMENTATION,
+    StageTimer,
+    get_record_sizes,
+)
+from inspire_json_merger.postprocess import (
+    add_ordering_to_authors_head,
+    postprocess_results,
+)
+
+from inspire_json_merger.utils import (
+    copy_shared_values,
+    filter_conflicts_by_paths,
+    filter_records,
+    split_unchanged_fields,
 )
-from inspire_json_merger.postprocess import postprocess_results
 
-from inspire_json_merger.utils import filter_conflicts, filter_records
+LOGGER = logging.getLogger(__name__)
 
 
-def merge(root, head, update, head_source=None):
+def merge(root, head, update, head_source=None, instrumentation=None, budget=None):
     """
     This function instantiate a ``Merger`` object using a configuration in
     according to the ``source`` value of head and update params.
@@ -52,31 +72,144 @@ def merge(root, head, update, head_source=None):
             heuristics are used to derive it from the metadata. This is useful
             if the HEAD came from legacy and the acquisition_source does not
             reflect the state of the record.
+        instrumentation(MergeInstrumentation): receives the measurements of
+            the merge, see :mod:`inspire_json_merger.instrumentation`.
+        budget(MergeBudget): limits on the work done by the merge, see
+            :mod:`inspire_json_merger.budget`. When exceeded, the merge
+            degrades instead of taking too long, and a ``DEGRADED_MERGE``
+            entry is added to the conflicts for every degraded list.
 
     Return
         A tuple containing the resulted merged record in json format and a
-        an object containing all generated conflicts.
+        an object containing all generated conflicts. The merged record can
+        share the values of the fields which didn't need merging with the
+        input records, so changing them also changes the inputs.
+    """
+    instrumentation = instrumentation or NO_INSTRUMENTATION
+    timer = StageTimer(instrumentation)
+    plan = get_merge_plan(get_configuration(head, update, head_source))
+    timer.stage('get_configuration')
+
+    tracker = None
+    if budget is not None:
+        tracker = BudgetTracker(budget, instrumentation)
+    return _merge_with_plan(root, head, update, plan, timer, tracker)
+
+
+def merge_many(triples, on_error=None, instrumentation=None, budget=None):
+    """
+    Merge many records lazily, sharing the per-configuration setup.
+
+    This is the batch counterpart of :func:`merge`: a failure while merging
+    one record doesn't stop the others from being merged.
+
+    Params
+        triples(Iterable[tuple]): the records to merge, each one being either
+            ``(root, head, update)`` or ``(root, head, update, head_source)``,
+            with the same meaning as the parameters of :func:`merge`.
+        on_error(callable): called as ``on_error(index, triple, exception)``
+            when merging the ``index``-th triple raises an exception.
+        instrumentation(MergeInstrumentation): receives the measurements of
+            every merge.
+        budget(MergeBudget): limits on the work done by every merge.
+
+    Return
+        An iterator over the ``(merged, conflicts)`` tuples, in the same order
+        as ``triples``. A record which failed to merge yields
+        ``(None, None)``, so that the results stay aligned with the input.
     """
-    configuration = get_configuration(head, update, head_source)
+    for index, triple in enumerate(triples):
+        try:
+            root, head, update, head_source = _unpack_triple(triple)
+            result = merge(
+                root, head, update, head_source, instrumentation, budget
+            )
+        except Exception as e:
+            LOGGER.exception('Failed to merge record number %d of the batch', index)
+            if on_error:
+                on_error(index, triple, e)
+            result = None, None
+        yield result
+
+
+def _unpack_triple(triple):
+    if len(triple) == 3:
+        root, head, update = triple
+        return root, head, update, None
+
+    return tuple(triple)
+
+
+def _merge_with_plan(root, head, update, plan, timer, tracker=None):
+    instrumentation = timer.instrumentation
+    on_filter = None
+    if timer.enabled:
+        instrumentation.on_configuration(plan.configuration)
+        instrumentation.on_record_sizes(get_record_sizes(root, head, update))
+        on_filter = instrumentation.on_pre_filter
+
     conflicts = []
-    root, head, update = filter_records(root, head, update, filters=configuration.pre_filters)
-    merger = Merger(
+    root, head, update = filter_records(
+        root, head, update, filters=plan.pre_filter_pipeline, on_filter=on_filter,
+    )
+    timer.stage('pre_filters')
+    merged, root, head, update = split_unchanged_fields(
+        root, head, update, ordered_fields=('authors',), comparators=plan.comparators,
+    )
+    timer.stage('split_unchanged_fields')
+    if not (root or head or update):
+        instrumentation.on_conflicts(0, 0)
+        return _postprocess(merged, conflicts, timer)
+
+    merger_kwargs = dict(
         root=root, head=head, update=update,
-        default_dict_merge_op=configuration.default_dict_merge_op,
-        default_list_merge_op=configuration.default_list_merge_op,
-        list_dict_ops=configuration.list_dict_ops,
-        list_merge_ops=configuration.list_merge_ops,
-        comparators=configuration.comparators,
+        default_dict_merge_op=plan.default_dict_merge_op,
+        default_list_merge_op=plan.default_list_merge_op,
+        list_dict_ops=plan.list_dict_ops,
+        list_merge_ops=plan.list_merge_ops,
+        comparators=plan.comparators,
     )
+    if tracker is None:
+        merger = Merger(**merger_kwargs)
+    else:
+        merger = BudgetedMerger(tracker, **merger_kwargs)
+    for record in (merger.root, merger.head, merger.update):
+        copy_shared_values(record)
+    add_ordering_to_authors_head(merger)
 
     try:
-        merger.merge()
+        with _budget_context(tracker):
+            merger.merge()
     except MergeError as e:
         conflicts = e.content
-    conflicts = filter_conflicts(conflicts, configuration.conflict_filters)
-    merged = merger.merged_root
+    timer.stage('merger')
+    unfiltered_count = len(conflicts)
+    conflicts = filter_conflicts_by_paths(conflicts, plan.conflict_filters)
+    instrumentation.on_conflicts(unfiltered_count, len(conflicts))
+    merged.update(merger.merged_root)
+    timer.stage('conflict_filters')
+
+    merged, conflicts = _postprocess(merged, conflicts, timer)
+    if tracker is not None:
+        conflicts.extend(tracker.get_degradation_conflicts())
+    return merged, conflicts
+
+
+@contextmanager
+def _budget_context(tracker):
+    if tracker is None:
+        yield
+        return
+
+    with active_budget(tracker):
+        yield
+
 
-    return postprocess_results(merged, conflicts)
+def _postprocess(merged, conflicts, timer):
+    result = postprocess_results(merged, conflicts)
+    timer.stage('postprocess')
+    timer.finish()
+    return result
 
 
 def get_configuration(head, update, head_source=None):
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2014-2017 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Budgets limiting the work done by a merge."""
+
+from __future__ import absolute_import, division, print_function
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from json_merger.merger import Merger
+
+LOGGER = logging.getLogger(__name__)
+
+_ACTIVE = threading.local()
+
+
+class MergeBudget(object):
+    """Limits on the work done by a merge.
+
+    When one of them is exceeded, the authors left unmatched by their
+    identifiers and normalized names are matched by position instead of by
+    distance, which is much cheaper but only right for lists in the same
+    order. Once ``max_duration`` is exceeded, the other list entries aren't
+    compared one by one either, so that only the ones with the same primary
+    keys are matched. Every degradation is reported to the
+    :meth:`~inspire_json_merger.instrumentation.MergeInstrumentation.on_degraded`
+    method of the instrumentation of the merge, logged as a warning, and
+    marked in the conflicts of the merge by a ``DEGRADED_MERGE`` entry
+    giving the path of the list.
+
+    Args:
+        max_duration(float): seconds after the start of the merge after
+            which list entries aren't compared one by one any more.
+        max_list_size(int): maximum length of an author list matched by
+            distance.
+        max_author_pairs(int): maximum number of pairs of authors compared by
+            distance during the whole merge.
+    """
+
+    def __init__(self, max_duration=None, max_list_size=None, max_author_pairs=None):
+        self.max_duration = max_duration
+        self.max_list_size = max_list_size
+        self.max_author_pairs = max_author_pairs
+
+    def __repr__(self):
+        return '%s(max_duration=%r, max_list_size=%r, max_author_pairs=%r)' % (
+            self.__class__.__name__,
+            self.max_duration,
+            self.max_list_size,
+            self.max_author_pairs,
+        )
+
+
+class BudgetTracker(object):
+    """Keeps track of the budget spent by a single merge.
+
+    Args:
+        budget(MergeBudget): the limits of the merge.
+        instrumentation(MergeInstrumentation): the instrumentation told
+            about the degradations.
+    """
+
+    def __init__(self, budget, instrumentation):
+        self.budget = budget
+        self.instrumentation = instrumentation
+        self.deadline = None
+        if budget.max_duration is not None:
+            self.deadline = time.time() + budget.max_duration
+        self.author_pairs = 0
+        self.degradations = []
+        self.path = None
+
+    def allow_author_matching(self, l1_size, l2_size, pairs):
+        """Spend ``pairs`` pairs of authors compared by distance, if possible.
+
+        Args:
+            l1_size(int): the length of the first author list.
+            l2_size(int): the length of the second author list.
+            pairs(int): the number of pairs of authors left to compare.
+
+        Returns:
+            bool: whether the authors can be matched by distance.
+        """
+        budget = self.budget
+        if self.deadline is not None and time.time() > self.deadline:
+            reason = 'max_duration'
+        elif budget.max_list_size is not None and \
+                max(l1_size, l2_size) > budget.max_list_size:
+            reason = 'max_list_size'
+        elif budget.max_author_pairs is not None and \
+                self.author_pairs + pairs > budget.max_author_pairs:
+            reason = 'max_author_pairs'
+        else:
+            self.author_pairs += pairs
+            return True
+
+        self._degrade(reason, l1_size, l2_size, pairs)
+        return False
+
+    def allow_comparisons(self, l1_size, l2_size, pairs):
+        """Tell if ``pairs`` pairs of list entries can be compared one by one.
+
+        Only ``max_duration`` limits them.
+
+        Args:
+            l1_size(int): the length of the first list.
+            l2_size(int): the length of the second list.
+            pairs(int): the number of pairs of entries left to compare.
+
+        Returns:
+            bool: whether the entries can be compared.
+        """
+        if self.deadline is None or time.time() <= self.deadline:
+            return True
+
+        self._degrade('max_duration', l1_size, l2_size, pairs)
+        return False
+
+    def get_degradation_conflicts(self):
+        """Return the entries marking the lists whose merge degraded.
+
+        There is one for every list, with its path and the details of its
+        first degradation. They are not json-patch operations.
+
+        Returns:
+            list: the ``DEGRADED_MERGE`` entries, like the conflicts of
+            :func:`~inspire_json_merger.api.merge`.
+        """
+        conflicts = []
+        paths = set()
+        for reason, details in self.degradations:
+            if details['path'] in paths:
+                continue
+            paths.add(details['path'])
+            value = dict(details, reason=reason)
+            del value['path']
+            conflicts.append({
+                'path': details['path'],
+                'value': value,
+                '$type': 'DEGRADED_MERGE',
+            })
+        return conflicts
+
+    def _degrade(self, reason, l1_size, l2_size, pairs):
+        path = None
+        if self.path is not None:
+            path = '/' + '/'.join(str(key) for key in self.path)
+        details = {'path': path, 'l1_size': l1_size, 'l2_size': l2_size, 'pairs': pairs}
+        self.degradations.append((reason, details))
+        LOGGER.warning(
+            'Merge budget %s exceeded, not comparing %d pairs of entries of %s one by one',
+            reason, pairs, path,
+        )
+        self.instrumentation.on_degraded(reason, details)
+
+
+class BudgetedMerger(Merger):
+    """Merger telling its budget tracker the path of the list it unifies.
+
+    Args:
+        tracker(BudgetTracker): the budget of the merge.
+
+    The other arguments are the ones of ``Merger``.
+    """
+
+    def __init__(self, tracker, *args, **kwargs):
+        super(BudgetedMerger, self).__init__(*args, **kwargs)
+        self.tracker = tracker
+
+    def _unify_lists(self, root, head, update, key_path):
+        previous_path = self.tracker.path
+        self.tracker.path = key_path
+        try:
+            return super(BudgetedMerger, self)._unify_lists(root, head, update, key_path)
+        finally:
+            self.tracker.path = previous_path
+
+
+@contextmanager
+def active_budget(tracker):
+    """Make ``tracker`` the budget of the merges run in this thread."""
+    previous = get_active_budget()
+    _ACTIVE.tracker = tracker
+    try:
+        yield tracker
+    finally:
+        _ACTIVE.tracker = previous
+
+
+def get_active_budget():
+    """Return the :class:`BudgetTracker` of the running merge, if any."""
+    return getattr(_ACTIVE, 'tracker', None)
@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2014-2017 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Cache of merge results, keyed by the content of the merged records."""
+
+from __future__ import absolute_import, division, print_function
+
+import errno
+import functools
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import six
+
+from inspire_json_merger.api import get_configuration, merge
+from inspire_json_merger.config import get_merge_plan
+
+_PACKAGE_NAME = 'inspire-json-merger'
+_NOT_COMPUTED = object()
+_package_version = _NOT_COMPUTED
+_configuration_descriptions = {}
+
+
+def merge_cache_key(root, head, update, configuration, budget=None):
+    """Compute a stable hash of the inputs of a merge.
+
+    Besides the records, the key depends on the installed version of this
+    package and on the content of the merge plan of the configuration, so
+    that results stored in a persistent backend aren't returned any more
+    once either of them changes. When the package isn't installed, e.g.
+    when running from a source checkout, its version is unknown and changes
+    to the code which don't change the configuration keep the same keys.
+
+    Args:
+        root(dict): the root record.
+        head(dict): the head record.
+        update(dict): the update record.
+        configuration(type): the ``MergerConfigurationOperations`` subclass
+            used for the merge.
+        budget(MergeBudget): the budget of the merge, if any.
+
+    Returns:
+        str: the hexadecimal SHA-256 of the canonical JSON serialization of
+        the records, of the package version, of the configuration and of the
+        budget.
+    """
+    if budget is not None:
+        budget = [budget.max_duration, budget.max_list_size, budget.max_author_pairs]
+    canonical = json.dumps(
+        [
+            get_package_version(),
+            describe_configuration(configuration),
+            budget,
+            root,
+            head,
+            update,
+        ],
+        sort_keys=True,
+        separators=(',', ':'),
+    )
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def get_package_version():
+    """Return the installed version of this package.
+
+    Returns:
+        str: the version, or ``None`` if the package isn't installed.
+    """
+    global _package_version
+    if _package_version is _NOT_COMPUTED:
+        _package_version = _read_package_version()
+    return _package_version
+
+
+def _read_package_version():
+    try:
+        from importlib.metadata import PackageNotFoundError, version
+    except ImportError:  # Python < 3.8
+        import pkg_resources
+        try:
+            return pkg_resources.get_distribution(_PACKAGE_NAME).version
+        except pkg_resources.DistributionNotFound:
+            return None
+
+    try:
+        return version(_PACKAGE_NAME)
+    except PackageNotFoundError:
+        return None
+
+
+def describe_configuration(configuration):
+    """Describe the merge plan of a configuration with plain JSON values.
+
+    Operations, conflict filters and field names are kept as they are,
+    while functions and comparators are replaced by their qualified names,
+    together with the primary keys of the comparators, which are all
+    created by the same factory.
+
+    Args:
+        configuration(type): a subclass of
+            :class:`MergerConfigurationOperations`.
+
+    Returns:
+        list: the description of the plan of ``configuration``.
+    """
+    description = _configuration_descriptions.get(configuration)
+    if description is None:
+        plan = get_merge_plan(configuration)
+        description = _describe([
+            _describe_callable(configuration),
+            plan.default_dict_merge_op,
+            plan.default_list_merge_op,
+            plan.list_dict_ops,
+            plan.list_merge_ops,
+            plan.comparators,
+            plan.pre_filters,
+            configuration.conflict_filters,
+        ])
+        _configuration_descriptions[configuration] = description
+    return description
+
+
+def _describe(value):
+    if isinstance(value, dict):
+        return sorted(
+            [_describe(key), _describe(item)] for key, item in value.items()
+        )
+    if isinstance(value, (list, tuple)):
+        return [_describe(item) for item in value]
+    if isinstance(value, functools.partial):
+        return [
+            _describe_callable(value.func),
+            _describe(value.args),
+            _describe(value.keywords or {}),
+        ]
+    if callable(value):
+        return _describe_callable(value)
+    return value
+
+
+def _describe_callable(value):
+    name = '%s.%s' % (
+        value.__module__,
+        getattr(value, '__qualname__', value.__name__),
+    )
+    if not hasattr(value, 'primary_key_fields'):
+        return name
+    return [
+        name,
+        _describe(value.primary_key_fields),
+        _describe(value.normalization_functions),
+    ]
+
+
+class MergeCache(object):
+    """Wrapper around :func:`inspire_json_merger.api.merge` caching results.
+
+    Merging the same ``root``, ``head`` and ``update`` with the same
+    configuration returns the stored result, without running the merger.
+
+    Attributes:
+        backend: where the results are stored, an object with ``get(key)``
+            returning the stored string or ``None`` and ``set(key, value)``.
+        hits(int): number of merges answered from the cache.
+        misses(int): number of merges which had to run the merger.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend if backend is not None else LRUCacheBackend()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def hit_rate(self):
+        """float: fraction of the merges answered from the cache."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def merge(self, root, head, update, head_source=None, instrumentation=None, budget=None):
+        """Same as :func:`inspire_json_merger.api.merge`, but cached.
+
+        The ``instrumentation`` only gets the measurements of the merges
+        which are not in the cache. Merges with different budgets are cached
+        separately, as a degraded merge can give a different result.
+        """
+        configuration = get_configuration(head, update, head_source)
+        key = merge_cache_key(root, head, update, configuration, budget)
+
+        cached = self.backend.get(key)
+        if cached is not None:
+            self._count(hit=True)
+            merged, conflicts = json.loads(cached)
+            return merged, conflicts
+
+        self._count(hit=False)
+        merged, conflicts = merge(
+            root, head, update, head_source, instrumentation, budget
+        )
+        self.backend.set(key, json.dumps([merged, conflicts]))
+        return merged, conflicts
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+
+class LRUCacheBackend(object):
+    """In-process cache backend evicting the least recently used results.
+
+    Args:
+        max_size(int): maximum total length of the stored results, in
+            characters of their JSON serialization.
+    """
+
+    def __init__(self, max_size=256 * 1024 * 1024):
+        self.max_size = max_size
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.pop(key, None)
+            if value is not None:
+                self._entries[key] = value
+            return value
+
+    def set(self, key, value):
+        if len(value) > self.max_size:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self._entries[key] = value
+            self.size += len(value)
+            while self.size > self.max_size:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+
+class DirectoryCacheBackend(object):
+    """Cache backend storing every result in a file of a directory.
+
+    Args:
+        path(str): the directory where the results are stored. It's created
+            if it doesn't exist.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def get(self, key):
+        try:
+            with io.open(self._get_path(key), encoding='utf-8') as cached_file:
+                return cached_file.read()
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                return None
+            raise
+
+    def set(self, key, value):
+        path = self._get_path(key)
+        directory = os.path.dirname(path)
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        # Write to a temporary file first, so that concurrent readers never
+        # see a partially written result.
+        fd, temporary_path = tempfile.mkstemp(dir=directory)
+        with io.open(fd, 'w', encoding='utf-8') as cached_file:
+            cached_file.write(six.text_type(value))
+        os.rename(temporary_path, path)
+
+    def _get_path(self, key):
+        return os.path.join(self.path, key[:2], key)
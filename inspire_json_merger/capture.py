@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2014-2017 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Capture of slow merges, and their replay under a profiler.
+
+Wrapping the merges in a :class:`SlowMergeCapture` saves the inputs of the
+ones exceeding a duration or memory threshold, together with the
+measurements of the merge. Every captured case can then be merged again
+offline under :mod:`cProfile`::
+
+    inspire-json-merger-replay /path/to/captures --sort tottime --limit 30
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import cProfile
+import errno
+import io
+import json
+import os
+import pstats
+import sys
+import tempfile
+import time
+import uuid
+
+import six
+
+from inspire_json_merger.api import merge
+from inspire_json_merger.instrumentation import (
+    CompositeInstrumentation,
+    RecordingInstrumentation,
+)
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+
+class SlowMergeCapture(object):
+    """Wrapper around :func:`inspire_json_merger.api.merge` saving slow merges.
+
+    A merge lasting more than ``min_duration`` seconds, or whose peak memory
+    usage is more than ``min_memory`` bytes, is saved as a JSON file in
+    ``directory``, with its inputs, the configuration used, the number of
+    conflicts and the measurements of its stages. The memory is traced with
+    :mod:`tracemalloc`, which slows the merge down, so only set
+    ``min_memory`` when needed; it isn't available on Python 2. See
+    :class:`PeakMemoryTracer` for how the peak is measured.
+
+    Args:
+        directory(str): where the cases are saved. It's created if it
+            doesn't exist.
+        min_duration(float): duration in seconds above which a merge is
+            saved.
+        min_memory(int): peak memory usage in bytes above which a merge is
+            saved.
+
+    Attributes:
+        captured(list): the paths of the cases saved so far.
+    """
+
+    def __init__(self, directory, min_duration=None, min_memory=None):
+        if min_memory is not None and tracemalloc is None:
+            raise ValueError('Capturing merges by memory usage needs tracemalloc')
+        self.directory = directory
+        self.min_duration = min_duration
+        self.min_memory = min_memory
+        self.captured = []
+
+    def merge(self, root, head, update, head_source=None, instrumentation=None):
+        """Same as :func:`inspire_json_merger.api.merge`, capturing it if slow."""
+        recording = RecordingInstrumentation()
+        instrumentation = CompositeInstrumentation([recording, instrumentation])
+
+        peak_memory = None
+        if self.min_memory is None:
+            merged, conflicts = merge(root, head, update, head_source, instrumentation)
+        else:
+            with PeakMemoryTracer() as tracer:
+                merged, conflicts = merge(root, head, update, head_source, instrumentation)
+            peak_memory = tracer.peak_memory
+
+        duration = recording.durations[-1]
+        if self._is_slow(duration, peak_memory):
+            case = {
+                'root': root,
+                'head': head,
+                'update': update,
+                'head_source': head_source,
+                'configuration': recording.configurations[-1].__name__,
+                'duration': duration,
+                'peak_memory': peak_memory,
+                'stages': recording.stages,
+                'pre_filters': recording.pre_filters,
+                'conflicts': recording.conflicts[-1],
+                'sizes': recording.sizes[-1],
+                'captured_at': time.time(),
+            }
+            self.captured.append(save_case(self.directory, case))
+
+        return merged, conflicts
+
+    def _is_slow(self, duration, peak_memory):
+        if self.min_duration is not None and duration > self.min_duration:
+            return True
+        return self.min_memory is not None and peak_memory > self.min_memory
+
+
+class PeakMemoryTracer(object):
+    """Context manager measuring the peak memory allocated in its block.
+
+    The memory is traced with :mod:`tracemalloc`, which is started and
+    stopped around the block unless it was already tracing. The peak is
+    counted from the memory traced when entering the block, so that what
+    was allocated before isn't included. If :mod:`tracemalloc` was already
+    tracing and can't reset its peak (before Python 3.9), the peak may have
+    been reached before the block, so the measure is only an upper bound.
+
+    Attributes:
+        peak_memory(int): after the block, the peak memory allocated in it,
+            in bytes.
+    """
+
+    def __init__(self):
+        self.peak_memory = None
+        self._started_tracing = False
+        self._baseline = 0
+
+    def __enter__(self):
+        self._started_tracing = not tracemalloc.is_tracing()
+        if self._started_tracing:
+            tracemalloc.start()
+        elif hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        self._baseline = tracemalloc.get_traced_memory()[0]
+        return self
+
+    def __exit__(self, *exc_info):
+        peak = tracemalloc.get_traced_memory()[1]
+        self.peak_memory = max(peak - self._baseline, 0)
+        if self._started_tracing:
+            tracemalloc.stop()
+
+
+def save_case(directory, case):
+    """Save a captured case in the directory and return its path."""
+    try:
+        os.makedirs(directory)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+    name = '%s-%s-%s.json' % (
+        time.strftime('%Y%m%dT%H%M%S'), case['configuration'], uuid.uuid4().hex[:8]
+    )
+    path = os.path.join(directory, name)
+    # Write to a temporary file first, so that the replay never reads a
+    # partially written case.
+    fd, temporary_path = tempfile.mkstemp(dir=directory)
+    with io.open(fd, 'w', encoding='utf-8') as case_file:
+        case_file.write(six.text_type(json.dumps(case, sort_keys=True)))
+    os.rename(temporary_path, path)
+    return path
+
+
+def load_case(path):
+    """Load a case saved by :class:`SlowMergeCapture`."""
+    with io.open(path, encoding='utf-8') as case_file:
+        return json.load(case_file)
+
+
+def replay_case(case, sort='cumulative', limit=20, stream=None):
+    """Merge a captured case again under the profiler and report on it.
+
+    Args:
+        case(dict): the case, as returned by :func:`load_case`.
+        sort(str): the :mod:`pstats` key to sort the functions by.
+        limit(int): number of functions reported.
+        stream: where the report is written, the standard output by default.
+
+    Returns:
+        RecordingInstrumentation: the measurements of the replayed merge.
+    """
+    stream = stream or sys.stdout
+    recording = RecordingInstrumentation()
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        merge(case['root'], case['head'], case['update'], case['head_source'], recording)
+    finally:
+        profile.disable()
+
+    configuration = recording.configurations[-1].__name__
+    print('Configuration: %s' % configuration, file=stream)
+    if configuration != case['configuration']:
+        print('Captured with configuration %s' % case['configuration'], file=stream)
+    print('Duration: %.3fs, captured %.3fs' % (recording.durations[-1], case['duration']), file=stream)
+    for stage, duration in sorted(recording.stages.items(), key=lambda item: -item[1]):
+        print('  %-24s %.3fs, captured %.3fs' % (
+            stage, duration, case['stages'].get(stage, 0.0)
+        ), file=stream)
+    pstats.Stats(profile, stream=stream).sort_stats(sort).print_stats(limit)
+
+    return recording
+
+
+def main(argv=None):
+    """Replay the captured cases given as files or directories."""
+    parser = argparse.ArgumentParser(
+        prog='inspire-json-merger-replay',
+        description='Merge again captured slow merges under the profiler.',
+    )
+    parser.add_argument(
+        'paths', nargs='+',
+        help='captured cases, or directories containing them',
+    )
+    parser.add_argument(
+        '--sort', default='cumulative',
+        help='key to sort the functions by, as in pstats (default: cumulative)',
+    )
+    parser.add_argument(
+        '--limit', type=int, default=20,
+        help='number of functions reported for each case (default: 20)',
+    )
+    args = parser.parse_args(argv)
+
+    for path in _find_cases(args.paths):
+        print('=== %s' % path)
+        replay_case(load_case(path), sort=args.sort, limit=args.limit)
+
+    return 0
+
+
+def _find_cases(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith('.json'):
+                    yield os.path.join(path, name)
+        else:
+            yield path
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2014-2017 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Command line interface merging records streamed as JSON lines."""
+
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import io
+import json
+import sys
+from collections import deque
+
+from inspire_json_merger.api import merge_many
+from inspire_json_merger.parallel import merge_parallel
+
+
+def main(argv=None):
+    """Merge the records read from a JSONL file, one JSON line per record.
+
+    Every input line is an object with the ``root``, ``head``, ``update`` and
+    optionally ``head_source`` keys. For every input line, a line with the
+    ``merged`` and ``conflicts`` keys is written to the standard output, in
+    the same order. If a record can't be merged, both are ``null`` and the
+    reason is given in the ``error`` key.
+
+    Returns:
+        int: the exit status, ``1`` if any of the records failed to merge.
+    """
+    parser = argparse.ArgumentParser(
+        prog='inspire-json-merger',
+        description='Merge records read as JSON lines.',
+    )
+    parser.add_argument(
+        'input', nargs='?', default='-',
+        help='JSONL file to read the records from, "-" for the standard input',
+    )
+    parser.add_argument(
+        '-w', '--workers', type=int, default=1,
+        help='number of worker processes merging the records',
+    )
+    parser.add_argument(
+        '--max-in-flight', type=int, default=None,
+        help='maximum number of records being merged by the workers at once',
+    )
+    args = parser.parse_args(argv)
+
+    if args.input == '-':
+        return _merge_stream(sys.stdin, sys.stdout, args.workers, args.max_in_flight)
+
+    with io.open(args.input, encoding='utf-8') as input_stream:
+        return _merge_stream(input_stream, sys.stdout, args.workers, args.max_in_flight)
+
+
+def _merge_stream(input_stream, output_stream, workers=1, max_in_flight=None):
+    errors = {}
+    # Lines read and not written yet, the valid ones waiting for their result.
+    lines = deque()
+
+    def on_error(index, triple, exception):
+        errors.setdefault(index, str(exception))
+
+    def valid_triples():
+        for line in _read_triples(input_stream):
+            lines.append(line)
+            if not isinstance(line, _InvalidLine):
+                yield line
+
+    if workers > 1:
+        results = merge_parallel(
+            valid_triples(), processes=workers, max_in_flight=max_in_flight, on_error=on_error
+        )
+    else:
+        results = merge_many(valid_triples(), on_error=on_error)
+
+    failed = False
+    for index, (merged, conflicts) in enumerate(results):
+        failed = _write_invalid_lines(lines, output_stream) or failed
+        lines.popleft()
+        output = {'merged': merged, 'conflicts': conflicts}
+        if index in errors:
+            output['error'] = errors.pop(index)
+            failed = True
+        output_stream.write(json.dumps(output) + '\n')
+    failed = _write_invalid_lines(lines, output_stream) or failed
+
+    return 1 if failed else 0
+
+
+class _InvalidLine(object):
+    """Input line which can't be merged, only reported in the output."""
+
+    def __init__(self, error):
+        self.error = error
+
+
+def _read_triples(input_stream):
+    for line in input_stream:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            triple = (
+                record.get('root', {}),
+                record['head'],
+                record['update'],
+                record.get('head_source'),
+            )
+        except (ValueError, KeyError, AttributeError) as e:
+            triple = _InvalidLine('Invalid input line: %r' % e)
+        yield triple
+
+
+def _write_invalid_lines(lines, output_stream):
+    """Write the errors of the invalid lines before the next valid one.
+
+    Returns:
+        bool: whether there were any.
+    """
+    written = False
+    while lines and isinstance(lines[0], _InvalidLine):
+        output = {'merged': None, 'conflicts': None, 'error': lines.popleft().error}
+        output_stream.write(json.dumps(output) + '\n')
+        written = True
+    return written
+
+
+if __name__ == '__main__':
+    sys.exit(main())
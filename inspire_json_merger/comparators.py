@@ -22,6 +22,9 @@
 
 from __future__ import absolute_import, division, print_function
 
+import operator
+from functools import partial
+
 from json_merger.comparator import PrimaryKeyComparator
 from json_merger.contrib.inspirehep.author_util import (
     AuthorNameDistanceCalculator,
@@ -32,7 +35,11 @@ from json_merger.contrib.inspirehep.author_util import (
 from json_merger.contrib.inspirehep.comparators import \
     DistanceFunctionComparator
 
-from inspire_json_merger.utils import scan_author_string_for_phrases
+from inspire_json_merger.budget import get_active_budget
+from inspire_json_merger.distance_matrix import HAS_NUMPY, AuthorNameDistanceMatrix
+from inspire_json_merger.matching import blocked_distance_function_match
+from inspire_json_merger.utils import LRUCache, scan_author_string_for_phrases
+from json_merger.nothing import NOTHING
 from json_merger.utils import get_obj_at_key_path
 
 
@@ -65,24 +72,277 @@ class IDNormalizer(object):
         return None
 
 
-class AuthorComparator(DistanceFunctionComparator):
+# Value of the primary key fields which are not set.
+_NO_VALUE = object()
+
+# Tokens and normalized keys of the author names, shared by all the merges.
+# Its ``max_size`` can be changed and its ``hits``, ``misses`` and
+# ``hit_rate`` tell how useful it is.
+AUTHOR_NAMES_CACHE = LRUCache(max_size=100000)
+
+
+def memoized_author_tokenize(name):
+    """Same as :func:`author_tokenize`, but computed once per name.
+
+    The tokens are shared between all the callers, so they must not be
+    modified.
+    """
+    return AUTHOR_NAMES_CACHE.get_or_compute(
+        ('tokens', name), lambda: author_tokenize(name)
+    )
+
+
+class MemoizedAuthorNameNormalizer(AuthorNameNormalizer):
+    """Same as ``AuthorNameNormalizer``, but computed once per name."""
+    def __init__(self, tokenize_function, first_names_number=None,
+                 first_name_to_initial=False, asciify=False, cache=AUTHOR_NAMES_CACHE):
+        super(MemoizedAuthorNameNormalizer, self).__init__(
+            tokenize_function,
+            first_names_number=first_names_number,
+            first_name_to_initial=first_name_to_initial,
+            asciify=asciify,
+        )
+        self.cache = cache
+        self._cache_key = (tokenize_function, first_names_number, first_name_to_initial, asciify)
+
+    def __call__(self, author):
+        normalize = super(MemoizedAuthorNameNormalizer, self).__call__
+        return self.cache.get_or_compute(
+            (self._cache_key, author.get('full_name', '')),
+            lambda: normalize(author),
+        )
+
+
+class MemoizedAuthorNameDistanceCalculator(AuthorNameDistanceCalculator):
+    """Same as ``AuthorNameDistanceCalculator``, but computed once per name
+    for authors with the same name.
+
+    The distance only depends on the names, and the authors matched by ids
+    or normalized names mostly have the same name on both sides.
+    """
+    def __init__(self, tokenize_function, match_on_initial_penalization=0.05,
+                 full_name_field='full_name', cache=AUTHOR_NAMES_CACHE):
+        super(MemoizedAuthorNameDistanceCalculator, self).__init__(
+            tokenize_function,
+            match_on_initial_penalization=match_on_initial_penalization,
+            full_name_field=full_name_field,
+        )
+        self.cache = cache
+        self._cache_key = (tokenize_function, match_on_initial_penalization, full_name_field)
+
+    def __call__(self, author1, author2):
+        distance = super(MemoizedAuthorNameDistanceCalculator, self).__call__
+        name = author1.get(self.name_field)
+        if name is None or name != author2.get(self.name_field):
+            return distance(author1, author2)
+        return self.cache.get_or_compute(
+            ('distance', self._cache_key, name),
+            lambda: distance(author1, author2),
+        )
+
+
+class IndexedMatchesMixin(object):
+    """Look up the matches of a comparator in an index of ``self.matches``.
+
+    ``BaseComparator.get_matches`` goes through the whole other list at
+    every call, which is quadratic for long lists.
+    """
+    def get_matches(self, src, src_idx):
+        if src not in ('l1', 'l2'):
+            raise ValueError('Must have one of "l1" or "l2" as src')
+        matches_index = getattr(self, '_matches_index', None)
+        if matches_index is None:
+            matches_index = self._matches_index = _index_matches(self.matches)
+        target_list = self.l2 if src == 'l1' else self.l1
+        return [
+            (trg_idx, target_list[trg_idx])
+            for trg_idx in matches_index[src].get(src_idx, ())
+        ]
+
+
+class LastNameInitialBlocker(object):
+    """Callable giving the initial of the first last name of an author."""
+    def __init__(self, tokenize_function):
+        self.normalize = MemoizedAuthorNameNormalizer(
+            tokenize_function, first_names_number=0, asciify=True
+        )
+
+    def __call__(self, author):
+        lastnames = self.normalize(author)
+        if not lastnames or not lastnames[0]:
+            return None
+        return lastnames[0][0]
+
+
+class AuthorComparator(IndexedMatchesMixin, DistanceFunctionComparator):
+    """Matches authors by ids, normalized names, then by name distance.
+
+    The authors with the same ids or normalized names are matched first,
+    using a hash index. For the remaining ones, if there are more than
+    ``max_unblocked_pairs`` pairs to compare, as for big collaborations,
+    only the authors whose first last name starts with the same letter are
+    compared, instead of every head author with every update author.
+    The matches are indexed as well, so that looking them up doesn't go
+    through the whole lists. When NumPy is installed, the distances between
+    the remaining authors are computed all at once by
+    ``distance_matrix_function`` if they are at least ``min_matrix_pairs``.
+    If the merge has a :class:`~inspire_json_merger.budget.MergeBudget`
+    which doesn't allow to compare them, they are matched by position.
+    """
     threshold = 0.12
-    distance_function = AuthorNameDistanceCalculator(author_tokenize)
+    distance_function = MemoizedAuthorNameDistanceCalculator(memoized_author_tokenize)
     norm_functions = [
         IDNormalizer('ORCID'),
         IDNormalizer('INSPIRE ID'),
         IDNormalizer('INSPIRE BAI'),
-        AuthorNameNormalizer(author_tokenize),
-        AuthorNameNormalizer(author_tokenize, asciify=True),
-        AuthorNameNormalizer(author_tokenize, first_names_number=1),
-        AuthorNameNormalizer(author_tokenize, first_names_number=1, asciify=True),
-        AuthorNameNormalizer(author_tokenize, first_names_number=1, first_name_to_initial=True),
-        AuthorNameNormalizer(author_tokenize, first_names_number=1, first_name_to_initial=True, asciify=True),
+        MemoizedAuthorNameNormalizer(author_tokenize),
+        MemoizedAuthorNameNormalizer(author_tokenize, asciify=True),
+        MemoizedAuthorNameNormalizer(author_tokenize, first_names_number=1),
+        MemoizedAuthorNameNormalizer(author_tokenize, first_names_number=1, asciify=True),
+        MemoizedAuthorNameNormalizer(author_tokenize, first_names_number=1, first_name_to_initial=True),
+        MemoizedAuthorNameNormalizer(author_tokenize, first_names_number=1, first_name_to_initial=True, asciify=True),
     ]
+    block_function = LastNameInitialBlocker(author_tokenize)
+    max_unblocked_pairs = 10000
+    distance_matrix_function = AuthorNameDistanceMatrix(memoized_author_tokenize) if HAS_NUMPY else None
+    min_matrix_pairs = 100
+
+    def process_lists(self):
+        # Get the unbound version of the distance function.
+        dist_fn = self.__class__.__dict__['distance_function']
+        allow_pairs = None
+        tracker = get_active_budget()
+        if tracker is not None:
+            allow_pairs = partial(tracker.allow_author_matching, len(self.l1), len(self.l2))
+        self.matches = set(blocked_distance_function_match(
+            self.l1,
+            self.l2,
+            self.threshold,
+            dist_fn,
+            self.norm_functions,
+            self.block_function,
+            self.max_unblocked_pairs,
+            self.distance_matrix_function,
+            self.min_matrix_pairs,
+            allow_pairs,
+        ))
+
+
+def _index_matches(matches):
+    """Index the matching pairs by each of their sides."""
+    index = {'l1': {}, 'l2': {}}
+    for l1_idx, l2_idx in matches:
+        index['l1'].setdefault(l1_idx, []).append(l2_idx)
+        index['l2'].setdefault(l2_idx, []).append(l1_idx)
+    for indices in index['l1'].values():
+        indices.sort()
+    for indices in index['l2'].values():
+        indices.sort()
+    return index
+
+
+class HashedPrimaryKeyComparator(IndexedMatchesMixin, PrimaryKeyComparator):
+    """Same as ``PrimaryKeyComparator``, but joining the lists on their keys.
+
+    The normalized values of the primary key fields of every object are
+    computed once, and the objects of both lists are matched through a hash
+    map of these values instead of comparing all the pairs of objects. The
+    objects with the same values are then compared pairwise, as well as the
+    ones with values which can't be hashed. The latter comparisons stop if
+    the merge has a :class:`~inspire_json_merger.budget.MergeBudget` whose
+    ``max_duration`` is exceeded.
+    """
+    def _get_field_key(self, obj, field):
+        """Return the normalized value of ``field`` and whether it's set."""
+        key_path = tuple(k for k in field.split('.') if k)
+        value = get_obj_at_key_path(obj, key_path, NOTHING)
+        if value == NOTHING:
+            return _NO_VALUE, False
+        fn = self.normalization_functions.get(field, lambda x: x)
+        return fn(value), True
+
+    def _get_keys(self, obj, field_sets):
+        return tuple(
+            tuple(zip(*(self._get_field_key(obj, field) for field in field_set)))
+            for field_set in field_sets
+        )
+
+    def process_lists(self):
+        field_sets = [
+            field_set if isinstance(field_set, list) else [field_set]
+            for field_set in self.primary_key_fields
+        ]
+        keys1 = [self._get_keys(obj, field_sets) for obj in self.l1]
+        keys2 = [self._get_keys(obj, field_sets) for obj in self.l2]
+        unhashable1 = set(idx for idx, keys in enumerate(keys1) if not _is_hashable(keys))
+        unhashable2 = set(idx for idx, keys in enumerate(keys2) if not _is_hashable(keys))
+
+        for field_set_idx in range(len(field_sets)):
+            buckets = {}
+            for l2_idx, keys in enumerate(keys2):
+                values, are_set = keys[field_set_idx]
+                if l2_idx not in unhashable2 and any(are_set):
+                    buckets.setdefault(values, []).append(l2_idx)
+            for l1_idx, keys in enumerate(keys1):
+                values, are_set = keys[field_set_idx]
+                if l1_idx in unhashable1 or not any(are_set):
+                    continue
+                for l2_idx in buckets.get(values, ()):
+                    # At least one of the fields must be set in both objects.
+                    other_are_set = keys2[l2_idx][field_set_idx][1]
+                    if any(is_set and other_is_set for is_set, other_is_set in zip(are_set, other_are_set)):
+                        self.matches.add((l1_idx, l2_idx))
+
+        # Equal objects also match, which the keys miss only when none of
+        # the primary key fields is set.
+        unset1 = [idx for idx, keys in enumerate(keys1) if idx not in unhashable1 and not _has_set_field(keys)]
+        unset2 = [idx for idx, keys in enumerate(keys2) if idx not in unhashable2 and not _has_set_field(keys)]
+        if not self._match_pairwise(unset1, unset2, operator.eq):
+            return
+
+        if not self._match_pairwise(sorted(unhashable1), range(len(self.l2)), self.equal):
+            return
+        hashable1 = [idx for idx in range(len(self.l1)) if idx not in unhashable1]
+        self._match_pairwise(hashable1, sorted(unhashable2), self.equal)
+
+    def _match_pairwise(self, l1_indices, l2_indices, equal):
+        """Match the given objects by comparing all their pairs.
+
+        If the merge has a :class:`~inspire_json_merger.budget.MergeBudget`
+        whose ``max_duration`` is exceeded, the remaining pairs are left
+        unmatched.
+
+        Returns:
+            bool: whether all the pairs were compared.
+        """
+        if not l1_indices or not l2_indices:
+            return True
+
+        tracker = get_active_budget()
+        for count, l1_idx in enumerate(l1_indices):
+            pairs = (len(l1_indices) - count) * len(l2_indices)
+            if tracker is not None and not tracker.allow_comparisons(len(self.l1), len(self.l2), pairs):
+                return False
+            for l2_idx in l2_indices:
+                if equal(self.l1[l1_idx], self.l2[l2_idx]):
+                    self.matches.add((l1_idx, l2_idx))
+        return True
+
+
+def _is_hashable(value):
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
+
+
+def _has_set_field(keys):
+    return any(any(are_set) for _, are_set in keys)
 
 
 def get_pk_comparator(primary_key_fields, normalization_functions=None):
-    class Ret(PrimaryKeyComparator):
+    class Ret(HashedPrimaryKeyComparator):
         __doc__ = (
             'primary_key_fields:%s, normalization_functions:%s' % (
                 primary_key_fields,
@@ -95,7 +355,7 @@ def get_pk_comparator(primary_key_fields, normalization_functions=None):
 
 
 def get_pk_comparator_ignore_if_both_empty(primary_key_fields, normalization_functions=None):
-    class Ret(PrimaryKeyComparator):
+    class Ret(HashedPrimaryKeyComparator):
         __doc__ = (
             'primary_key_fields:%s, normalization_functions:%s' % (
                 primary_key_fields,
@@ -111,6 +371,14 @@ def get_pk_comparator_ignore_if_both_empty(primary_key_fields, normalization_fun
             fn = self.normalization_functions.get(field, lambda x: x)
             return fn(o1) == fn(o2)
 
+        def _get_field_key(self, obj, field):
+            key_path = tuple(k for k in field.split('.') if k)
+            value = get_obj_at_key_path(obj, key_path, "")
+            is_set = get_obj_at_key_path(obj, key_path, NOTHING) != NOTHING
+
+            fn = self.normalization_functions.get(field, lambda x: x)
+            return fn(value), is_set
+
     Ret.primary_key_fields = primary_key_fields
     Ret.normalization_functions = normalization_functions or {}
     return Ret
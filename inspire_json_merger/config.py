@@ -22,14 +22,17 @@
 
 from __future__ import absolute_import, division, print_function
 
+from collections import namedtuple
+
 from json_merger.config import DictMergerOps as D, UnifierOps as U
 
 from inspire_json_merger.pre_filters import (
     filter_documents_same_source,
     filter_figures_same_source,
     filter_curated_references,
-    filter_publisher_references, update_authors_with_ordering_info, remove_duplicated_titles
+    filter_publisher_references, remove_duplicated_titles
 )
+from inspire_json_merger.utils import compile_conflict_filters, compile_pre_filters
 from .comparators import COMPARATORS
 
 """
@@ -53,7 +56,6 @@ class ArxivOnArxivOperations(MergerConfigurationOperations):
         filter_documents_same_source,
         filter_figures_same_source,
         filter_curated_references,
-        update_authors_with_ordering_info,
         remove_duplicated_titles
     ]
     conflict_filters = [
@@ -124,7 +126,6 @@ class ArxivOnPublisherOperations(MergerConfigurationOperations):
         filter_documents_same_source,
         filter_figures_same_source,
         filter_publisher_references,
-        update_authors_with_ordering_info,
         remove_duplicated_titles
     ]
     default_list_merge_op = U.KEEP_ONLY_HEAD_ENTITIES
@@ -179,7 +180,7 @@ class ArxivOnPublisherOperations(MergerConfigurationOperations):
 class ManualMergeOperations(MergerConfigurationOperations):
     default_list_merge_op = U.KEEP_UPDATE_AND_HEAD_ENTITIES_HEAD_FIRST
     comparators = COMPARATORS
-    pre_filters = [update_authors_with_ordering_info, remove_duplicated_titles]  # don't delete files with the same source
+    pre_filters = [remove_duplicated_titles]  # don't delete files with the same source
     conflict_filters = [
         '_collections',
         '_desy_bookkeeping',
@@ -202,7 +203,6 @@ class PublisherOnArxivOperations(MergerConfigurationOperations):
         filter_documents_same_source,
         filter_figures_same_source,
         filter_curated_references,
-        update_authors_with_ordering_info,
         remove_duplicated_titles
     ]
     conflict_filters = [
@@ -252,7 +252,6 @@ class PublisherOnPublisherOperations(MergerConfigurationOperations):
         filter_documents_same_source,
         filter_figures_same_source,
         filter_curated_references,
-        update_authors_with_ordering_info,
         remove_duplicated_titles
     ]
     conflict_filters = [
@@ -305,3 +304,68 @@ class PublisherOnPublisherOperations(MergerConfigurationOperations):
         'license': D.FALLBACK_KEEP_UPDATE,
         'number_of_pages': D.FALLBACK_KEEP_UPDATE,
     }
+
+
+class MergePlan(namedtuple('MergePlan', [
+    'configuration',
+    'default_dict_merge_op',
+    'default_list_merge_op',
+    'list_dict_ops',
+    'list_merge_ops',
+    'comparators',
+    'pre_filters',
+    'pre_filter_pipeline',
+    'conflict_filters',
+])):
+    """Everything a merge needs from a configuration, computed once.
+
+    The mappings are copies shared by all the merges using the plan, they
+    must not be modified. The comparators are the classes of the
+    configuration, as the merger instantiates them for each pair of lists.
+    """
+    __slots__ = ()
+
+
+_MERGE_PLANS = {}
+
+
+def compile_merge_plan(configuration):
+    """Compile a configuration into a :class:`MergePlan`.
+
+    Args:
+        configuration(type): a subclass of
+            :class:`MergerConfigurationOperations`.
+
+    Returns:
+        MergePlan: the plan of ``configuration``.
+    """
+    pre_filters = tuple(configuration.pre_filters or ())
+    return MergePlan(
+        configuration=configuration,
+        default_dict_merge_op=configuration.default_dict_merge_op,
+        default_list_merge_op=configuration.default_list_merge_op,
+        list_dict_ops=dict(configuration.list_dict_ops or {}),
+        list_merge_ops=dict(configuration.list_merge_ops or {}),
+        comparators=dict(configuration.comparators or {}),
+        pre_filters=pre_filters,
+        pre_filter_pipeline=compile_pre_filters(pre_filters),
+        conflict_filters=compile_conflict_filters(configuration.conflict_filters),
+    )
+
+
+def get_merge_plan(configuration):
+    """Return the :class:`MergePlan` of a configuration.
+
+    The plan is compiled the first time it is needed and then cached.
+
+    Args:
+        configuration(type): a subclass of
+            :class:`MergerConfigurationOperations`.
+
+    Returns:
+        MergePlan: the plan of ``configuration``.
+    """
+    plan = _MERGE_PLANS.get(configuration)
+    if plan is None:
+        plan = _MERGE_PLANS.setdefault(configuration, compile_merge_plan(configuration))
+    return plan
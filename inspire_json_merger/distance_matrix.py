@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2014-2017 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Distance matrices between lists of authors, computed with NumPy.
+
+NumPy is an optional dependency, installed with the ``numpy`` extra. When it
+is missing, ``HAS_NUMPY`` is ``False`` and the authors are compared one pair
+at a time.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+from itertools import permutations
+
+from json_merger.contrib.inspirehep.author_util import (
+    AuthorNameDistanceCalculator,
+    NameInitial,
+    _asciify,
+    _decode_if_not_unicode,
+    token_distance,
+)
+
+try:
+    import numpy
+    HAS_NUMPY = True
+except ImportError:
+    numpy = None
+    HAS_NUMPY = False
+
+# Maximum number of array elements computed at once, to bound the memory.
+_CHUNK_SIZE = 2 ** 21
+
+_ONE = numpy.uint64(1) if HAS_NUMPY else None
+
+
+class AuthorNameDistanceMatrix(object):
+    """Callable computing the distances between all the pairs of authors.
+
+    Every name is tokenized once, then the distances between all the tokens
+    and the best assignments of tokens for all the pairs of authors are
+    computed with array operations. The distances are the same as the ones of
+    ``AuthorNameDistanceCalculator``, except between names having several
+    best assignments of tokens, some of them matching only initials: those
+    names are never considered as matching only on initials.
+
+    Args:
+        tokenize_function(callable): the tokenizer of the names, as for
+            ``AuthorNameDistanceCalculator``.
+        match_on_initial_penalization(float): distance between an initial
+            and a name starting with it.
+        full_name_field(str): the field of the authors holding the name.
+        max_assignments(int): maximum number of assignments of tokens
+            computed for a pair of authors. Pairs of authors with more tokens
+            are compared by ``AuthorNameDistanceCalculator``.
+    """
+
+    def __init__(self, tokenize_function, match_on_initial_penalization=0.05,
+                 full_name_field='full_name', max_assignments=720):
+        self.tokenize_function = tokenize_function
+        self.match_on_initial_penalization = match_on_initial_penalization
+        self.name_field = full_name_field
+        self.max_assignments = max_assignments
+        self.distance_function = AuthorNameDistanceCalculator(
+            tokenize_function, match_on_initial_penalization, full_name_field
+        )
+
+    def __call__(self, authors1, authors2):
+        """Return the ``numpy.ndarray`` of distances between the authors."""
+        vocabulary1, tokens1 = self._encode(authors1)
+        vocabulary2, tokens2 = self._encode(authors2)
+        token_distances = _token_distances(
+            vocabulary1, vocabulary2, self.match_on_initial_penalization
+        )
+        initials1 = numpy.array([isinstance(token, NameInitial) for token in vocabulary1], dtype=bool)
+        initials2 = numpy.array([isinstance(token, NameInitial) for token in vocabulary2], dtype=bool)
+
+        distances = numpy.ones((len(authors1), len(authors2)))
+        groups1 = _group_by_number_of_tokens(tokens1)
+        groups2 = _group_by_number_of_tokens(tokens2)
+        for size1, (indices1, token_indices1) in groups1.items():
+            for size2, (indices2, token_indices2) in groups2.items():
+                if size1 and size2 and _count_assignments(size1, size2) <= self.max_assignments:
+                    distances[numpy.ix_(indices1, indices2)] = _assignment_distances(
+                        token_distances, initials1, initials2, token_indices1, token_indices2
+                    )
+                    continue
+                for idx1 in indices1:
+                    for idx2 in indices2:
+                        distances[idx1, idx2] = self.distance_function(
+                            authors1[idx1], authors2[idx2]
+                        )
+        return distances
+
+    def _encode(self, authors):
+        """Tokenize the names, giving the index of every token in a vocabulary.
+
+        Authors without a name have ``None`` instead of their tokens.
+        """
+        vocabulary = {}
+        encoded = []
+        for author in authors:
+            if self.name_field not in author:
+                encoded.append(None)
+                continue
+            name = _asciify(_decode_if_not_unicode(author[self.name_field]))
+            tokens = self.tokenize_function(name)
+            encoded.append([
+                vocabulary.setdefault(
+                    (token.token, isinstance(token, NameInitial)),
+                    (len(vocabulary), token),
+                )[0]
+                for token in tokens['lastnames'] + tokens['nonlastnames']
+            ])
+        tokens = [token for _, token in sorted(vocabulary.values(), key=lambda entry: entry[0])]
+        return tokens, encoded
+
+
+def _group_by_number_of_tokens(encoded):
+    groups = {}
+    for idx, token_indices in enumerate(encoded):
+        if token_indices is not None:
+            groups.setdefault(len(token_indices), []).append(idx)
+    return {
+        size: (indices, numpy.array([encoded[idx] for idx in indices], dtype=int).reshape(len(indices), size))
+        for size, indices in groups.items()
+    }
+
+
+def _count_assignments(size1, size2):
+    count = 1
+    for factor in range(max(size1, size2) - min(size1, size2) + 1, max(size1, size2) + 1):
+        count *= factor
+    return count
+
+
+def _assignment_distances(token_distances, initials1, initials2, token_indices1, token_indices2):
+    """Distances between two groups of authors, each with a number of tokens.
+
+    Every assignment of the tokens of the author with fewer of them to the
+    tokens of the other one is tried, as names only have a few tokens.
+    """
+    size1 = token_indices1.shape[1]
+    size2 = token_indices2.shape[1]
+    if size1 <= size2:
+        rows = numpy.arange(size1)[numpy.newaxis, :]
+        columns = numpy.array(list(permutations(range(size2), size1)))
+    else:
+        rows = numpy.array(list(permutations(range(size1), size2)))
+        columns = numpy.arange(size2)[numpy.newaxis, :]
+    assigned = min(size1, size2)
+    assignments = max(len(rows), len(columns))
+
+    count1 = len(token_indices1)
+    count2 = len(token_indices2)
+    row_size = count2 * max(size1 * size2, assignments * assigned)
+    chunk = max(1, _CHUNK_SIZE // row_size)
+    distances = numpy.empty((count1, count2))
+    both_initials = initials1[:, numpy.newaxis] & initials2[numpy.newaxis, :]
+    for start in range(0, count1, chunk):
+        pairs = (
+            token_indices1[start:start + chunk, numpy.newaxis, :, numpy.newaxis],
+            token_indices2[numpy.newaxis, :, numpy.newaxis, :],
+        )
+        costs = token_distances[pairs][..., rows, columns].sum(axis=-1)
+        only_initials = both_initials[pairs][..., rows, columns].all(axis=-1)
+
+        best = costs.min(axis=-1)
+        is_best = costs <= best[..., numpy.newaxis] + 1e-9
+        # Johnny, D will not be equal with Donny, J
+        matches_names = (is_best & ~only_initials).any(axis=-1)
+        distances[start:start + chunk] = numpy.where(matches_names, best / assigned, 1.0)
+
+    return distances
+
+
+def _token_distances(tokens1, tokens2, initial_match_penalization):
+    """Distances between all the tokens, as computed by ``token_distance``."""
+    initials1 = [idx for idx, token in enumerate(tokens1) if isinstance(token, NameInitial)]
+    initials2 = [idx for idx, token in enumerate(tokens2) if isinstance(token, NameInitial)]
+    names1 = [idx for idx, token in enumerate(tokens1) if not isinstance(token, NameInitial)]
+    names2 = [idx for idx, token in enumerate(tokens2) if not isinstance(token, NameInitial)]
+
+    distances = numpy.empty((len(tokens1), len(tokens2)))
+    distances[numpy.ix_(names1, names2)] = _normalized_edit_distances(
+        [tokens1[idx] for idx in names1],
+        [tokens2[idx] for idx in names2],
+    )
+    # An initial matches a token starting with it, ``NameInitial.__eq__``
+    # being used whenever one of the tokens is an initial.
+    for idx1 in initials1:
+        initial = tokens1[idx1].token
+        distances[idx1, :] = [
+            _initial_distance(initial, token.token, initial_match_penalization)
+            for token in tokens2
+        ]
+    for idx2 in initials2:
+        initial = tokens2[idx2].token
+        distances[names1, idx2] = [
+            _initial_distance(initial, tokens1[idx1].token, initial_match_penalization)
+            for idx1 in names1
+        ]
+
+    return distances
+
+
+def _initial_distance(initial, token, initial_match_penalization):
+    if initial == token:
+        return 0
+    if initial == token[:len(initial)]:
+        return initial_match_penalization
+    return 1.0
+
+
+def _normalized_edit_distances(tokens1, tokens2):
+    """Levenshtein distances between all the tokens, over their lengths."""
+    distances = numpy.empty((len(tokens1), len(tokens2)))
+    if not tokens1 or not tokens2:
+        return distances
+
+    # The bit-parallel algorithm handles tokens fitting in 64 bits, longer
+    # ones are compared one pair at a time.
+    short = [idx for idx, token in enumerate(tokens1) if len(token.token) <= 64]
+    for idx1 in sorted(set(range(len(tokens1))) - set(short)):
+        distances[idx1, :] = [token_distance(tokens1[idx1], token2, 0) for token2 in tokens2]
+    if not short:
+        return distances
+
+    strings1 = [tokens1[idx].token for idx in short]
+    strings2 = [token.token for token in tokens2]
+    alphabet = {}
+    for string in strings1 + strings2:
+        for char in string:
+            alphabet.setdefault(char, len(alphabet))
+    masks1 = _encode_masks(strings1, alphabet)
+    codes2 = _encode_codes(strings2, alphabet)
+    lengths1 = numpy.array([len(string) for string in strings1])
+    lengths2 = numpy.array([len(string) for string in strings2])
+
+    chunk = max(1, _CHUNK_SIZE // (8 * len(strings2)))
+    short_distances = numpy.empty((len(strings1), len(strings2)))
+    for start in range(0, len(strings1), chunk):
+        short_distances[start:start + chunk] = _edit_distances(
+            masks1[start:start + chunk], lengths1[start:start + chunk], codes2, lengths2
+        )
+
+    longest = numpy.maximum(lengths1[:, numpy.newaxis], lengths2[numpy.newaxis, :])
+    distances[short] = short_distances / numpy.maximum(longest, 1)
+    return distances
+
+
+def _encode_masks(strings, alphabet):
+    """Bit masks of the positions of every character in every string."""
+    masks = numpy.zeros((len(strings), len(alphabet) + 1), dtype=numpy.uint64)
+    for idx, string in enumerate(strings):
+        for position, char in enumerate(string):
+            masks[idx, alphabet[char]] |= _ONE << numpy.uint64(position)
+    return masks
+
+
+def _encode_codes(strings, alphabet):
+    """Characters of the strings, padded with a character matching nothing."""
+    width = max(max(len(string) for string in strings), 1)
+    codes = numpy.full((len(strings), width), len(alphabet), dtype=numpy.intp)
+    for idx, string in enumerate(strings):
+        codes[idx, :len(string)] = [alphabet[char] for char in string]
+    return codes
+
+
+def _edit_distances(masks1, lengths1, codes2, lengths2):
+    """Myers' bit-parallel algorithm run on all the pairs of strings at once.
+
+    See Hyyrö, "Explaining and extending the bit-parallel approximate string
+    matching algorithm of Myers" (2001), for the global edit distance.
+    """
+    shape = (len(masks1), len(codes2))
+    last_bits = (_ONE << (numpy.maximum(lengths1, 1) - 1).astype(numpy.uint64))[:, numpy.newaxis]
+    positive_vertical = numpy.full(shape, ~numpy.uint64(0), dtype=numpy.uint64)
+    negative_vertical = numpy.zeros(shape, dtype=numpy.uint64)
+    scores = numpy.repeat(lengths1[:, numpy.newaxis], len(codes2), axis=1)
+
+    distances = numpy.empty(shape)
+    distances[:, lengths2 == 0] = lengths1[:, numpy.newaxis]
+    for column in range(codes2.shape[1]):
+        equal = masks1[:, codes2[:, column]]
+        vertical = equal | negative_vertical
+        horizontal = (((equal & positive_vertical) + positive_vertical) ^ positive_vertical) | equal
+        positive_horizontal = negative_vertical | ~(horizontal | positive_vertical)
+        negative_horizontal = positive_vertical & horizontal
+        scores += (positive_horizontal & last_bits) != 0
+        scores -= (negative_horizontal & last_bits) != 0
+
+        positive_horizontal = (positive_horizontal << _ONE) | _ONE
+        negative_horizontal <<= _ONE
+        positive_vertical = negative_horizontal | ~(vertical | positive_horizontal)
+        negative_vertical = positive_horizontal & vertical
+
+        ending = lengths2 == column + 1
+        distances[:, ending] = scores[:, ending]
+
+    distances[lengths1 == 0] = lengths2
+    return distances
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2014-2017 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Instrumentation of the merge, to find out where its time is spent."""
+
+from __future__ import absolute_import, division, print_function
+
+import time
+from functools import partial
+
+STAGES = (
+    'get_configuration',
+    'pre_filters',
+    'split_unchanged_fields',
+    'merger',
+    'conflict_filters',
+    'postprocess',
+)
+"""Stages of :func:`inspire_json_merger.api.merge`, in order."""
+
+
+class MergeInstrumentation(object):
+    """Receives the measurements of a merge.
+
+    All the methods do nothing: subclass it and override the ones giving
+    the measurements you need, for example to send them to a metrics
+    system. Durations are in seconds.
+    """
+
+    def on_configuration(self, configuration):
+        """Called with the configuration class chosen for the merge."""
+
+    def on_record_sizes(self, sizes):
+        """Called with the sizes of the records, before the merge.
+
+        Args:
+            sizes(dict): for each of ``root``, ``head`` and ``update``, the
+                number of top-level fields, in the ``fields`` key, and the
+                length of each of its top-level lists.
+        """
+
+    def on_pre_filter(self, pre_filter, duration):
+        """Called after running each of the pre-filters."""
+
+    def on_stage(self, stage, duration):
+        """Called after each of the :data:`STAGES` of the merge."""
+
+    def on_conflicts(self, unfiltered, filtered):
+        """Called with the number of conflicts before and after filtering."""
+
+    def on_merge(self, duration):
+        """Called at the end of the merge, with its total duration."""
+
+    def on_degraded(self, reason, details):
+        """Called when the merge exceeds its budget and degrades.
+
+        Args:
+            reason(str): the exceeded limit of the
+                :class:`~inspire_json_merger.budget.MergeBudget`.
+            details(dict): the sizes of the author lists, ``l1_size`` and
+                ``l2_size``, and the number of ``pairs`` of authors matched
+                by position instead of by distance.
+        """
+
+
+class RecordingInstrumentation(MergeInstrumentation):
+    """Instrumentation keeping the measurements of the merges.
+
+    The durations are summed over all the merges it instruments.
+
+    Attributes:
+        configurations(list): the configuration of each merge.
+        sizes(list): the sizes of the records of each merge.
+        stages(dict): total duration of each stage.
+        pre_filters(dict): total duration of each pre-filter, by the name
+            given by :func:`get_pre_filter_name`.
+        conflicts(list): ``(unfiltered, filtered)`` number of conflicts of
+            each merge.
+        durations(list): duration of each merge.
+        degradations(list): ``(reason, details)`` of each degradation.
+    """
+
+    def __init__(self):
+        self.configurations = []
+        self.sizes = []
+        self.stages = {}
+        self.pre_filters = {}
+        self.conflicts = []
+        self.durations = []
+        self.degradations = []
+
+    def on_configuration(self, configuration):
+        self.configurations.append(configuration)
+
+    def on_record_sizes(self, sizes):
+        self.sizes.append(sizes)
+
+    def on_pre_filter(self, pre_filter, duration):
+        name = get_pre_filter_name(pre_filter)
+        self.pre_filters[name] = self.pre_filters.get(name, 0.0) + duration
+
+    def on_stage(self, stage, duration):
+        self.stages[stage] = self.stages.get(stage, 0.0) + duration
+
+    def on_conflicts(self, unfiltered, filtered):
+        self.conflicts.append((unfiltered, filtered))
+
+    def on_merge(self, duration):
+        self.durations.append(duration)
+
+    def on_degraded(self, reason, details):
+        self.degradations.append((reason, details))
+
+
+class CompositeInstrumentation(MergeInstrumentation):
+    """Instrumentation passing the measurements to several others.
+
+    Args:
+        instrumentations(list): the instrumentations getting the
+            measurements, ``None`` ones are skipped.
+    """
+
+    def __init__(self, instrumentations):
+        self.instrumentations = [
+            instrumentation for instrumentation in instrumentations
+            if instrumentation is not None
+        ]
+
+    def on_configuration(self, configuration):
+        for instrumentation in self.instrumentations:
+            instrumentation.on_configuration(configuration)
+
+    def on_record_sizes(self, sizes):
+        for instrumentation in self.instrumentations:
+            instrumentation.on_record_sizes(sizes)
+
+    def on_pre_filter(self, pre_filter, duration):
+        for instrumentation in self.instrumentations:
+            instrumentation.on_pre_filter(pre_filter, duration)
+
+    def on_stage(self, stage, duration):
+        for instrumentation in self.instrumentations:
+            instrumentation.on_stage(stage, duration)
+
+    def on_conflicts(self, unfiltered, filtered):
+        for instrumentation in self.instrumentations:
+            instrumentation.on_conflicts(unfiltered, filtered)
+
+    def on_merge(self, duration):
+        for instrumentation in self.instrumentations:
+            instrumentation.on_merge(duration)
+
+    def on_degraded(self, reason, details):
+        for instrumentation in self.instrumentations:
+            instrumentation.on_degraded(reason, details)
+
+
+NO_INSTRUMENTATION = MergeInstrumentation()
+
+
+class StageTimer(object):
+    """Times consecutive stages, reporting them to an instrumentation.
+
+    With :data:`NO_INSTRUMENTATION`, nothing is measured at all.
+    """
+
+    def __init__(self, instrumentation):
+        self.instrumentation = instrumentation
+        self.enabled = instrumentation is not NO_INSTRUMENTATION
+        self.start = self.last = time.time() if self.enabled else None
+
+    def stage(self, stage):
+        """Report the time elapsed since the previous stage as ``stage``."""
+        if self.enabled:
+            now = time.time()
+            self.instrumentation.on_stage(stage, now - self.last)
+            self.last = now
+
+    def finish(self):
+        """Report the total duration of the merge."""
+        if self.enabled:
+            self.instrumentation.on_merge(time.time() - self.start)
+
+
+def get_pre_filter_name(pre_filter):
+    """Return a readable name of a pre-filter, also for partial functions."""
+    if isinstance(pre_filter, partial):
+        return '%s(%s)' % (
+            get_pre_filter_name(pre_filter.func),
+            ', '.join(repr(arg) for arg in pre_filter.args),
+        )
+    return getattr(pre_filter, '__name__', repr(pre_filter))
+
+
+def get_record_sizes(root, head, update):
+    """Return the sizes reported to :meth:`MergeInstrumentation.on_record_sizes`."""
+    sizes = {}
+    for name, record in (('root', root), ('head', head), ('update', update)):
+        record_sizes = {
+            key: len(value) for key, value in (record or {}).items()
+            if isinstance(value, list)
+        }
+        record_sizes['fields'] = len(record or {})
+        sizes[name] = record_sizes
+    return sizes
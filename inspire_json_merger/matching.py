@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2014-2017 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Matching of list entries for big lists."""
+
+from __future__ import absolute_import, division, print_function
+
+from json_merger.contrib.inspirehep.match import (
+    BipartiteConnectedComponents,
+    distance_function_match,
+)
+from munkres import Munkres
+
+
+def blocked_distance_function_match(l1, l2, thresh, dist_fn, norm_funcs=(),
+                                    block_fn=None, max_unblocked_pairs=None,
+                                    dist_matrix_fn=None, min_matrix_pairs=0,
+                                    allow_pairs=None):
+    """Returns pairs of matching indices from l1 and l2.
+
+    This gives the same matches as
+    :func:`json_merger.contrib.inspirehep.match.distance_function_match`
+    as long as the entries left unmatched by the normalization functions
+    form at most ``max_unblocked_pairs`` pairs. Above that, those entries
+    are partitioned into blocks according to ``block_fn`` and only entries
+    in the same block are compared, avoiding to compute the distance between
+    all the pairs and to run the assignment on a huge matrix.
+
+    Args:
+        l1(list): the first list of entries.
+        l2(list): the second list of entries.
+        thresh(float): maximum distance between two matching entries.
+        dist_fn(callable): distance function between two entries.
+        norm_funcs(list): normalization functions, each one used in turn to
+            match the entries having the same unambiguous normalized value.
+        block_fn(callable): function giving the block of an entry. Entries
+            in the ``None`` block are never matched by distance.
+        max_unblocked_pairs(int): number of pairs of remaining entries above
+            which they are partitioned in blocks. Never partition if
+            ``None``.
+        dist_matrix_fn(callable): function returning the ``numpy.ndarray``
+            of distances between all the entries of two lists, used instead
+            of ``dist_fn`` for the remaining entries.
+        min_matrix_pairs(int): number of pairs of remaining entries in a
+            block below which ``dist_fn`` is used anyway.
+        allow_pairs(callable): called with the number of pairs of entries
+            of every block before comparing them by distance. Once it returns
+            ``False``, the entries of this block and of the following ones
+            are matched by position instead, see :func:`match_by_position`.
+
+    Returns:
+        list: pairs of ``(l1_index, l2_index)`` of matching entries.
+    """
+    common, l1_only, l2_only = match_by_norm_funcs(l1, l2, thresh, dist_fn, norm_funcs)
+
+    if max_unblocked_pairs is None or block_fn is None or \
+            len(l1_only) * len(l2_only) <= max_unblocked_pairs:
+        blocks = [(l1_only, l2_only)]
+    else:
+        blocks = _partition_in_blocks(l1, l2, l1_only, l2_only, block_fn)
+
+    degraded_l1 = []
+    degraded_l2 = []
+    for l1_indices, l2_indices in blocks:
+        pairs = len(l1_indices) * len(l2_indices)
+        if degraded_l1 or (pairs and allow_pairs is not None and not allow_pairs(pairs)):
+            degraded_l1.extend(l1_indices)
+            degraded_l2.extend(l2_indices)
+            continue
+
+        block_l1 = [l1[i] for i in l1_indices]
+        block_l2 = [l2[i] for i in l2_indices]
+        if dist_matrix_fn is not None and len(block_l1) * len(block_l2) >= min_matrix_pairs:
+            block_common = distance_matrix_match(dist_matrix_fn(block_l1, block_l2), thresh)
+        else:
+            block_common = distance_function_match(block_l1, block_l2, thresh, dist_fn)
+        common.extend(
+            (l1_indices[l1_idx], l2_indices[l2_idx]) for l1_idx, l2_idx in block_common
+        )
+
+    if degraded_l1:
+        common.extend(match_by_position(
+            l1, l2, sorted(degraded_l1), sorted(degraded_l2), thresh, dist_fn
+        ))
+    return common
+
+
+def match_by_norm_funcs(l1, l2, thresh, dist_fn, norm_funcs):
+    """Returns pairs of indices of entries with the same normalized value.
+
+    Every normalization function is used in turn on the entries not matched
+    yet, and only the entries whose normalized value is not ambiguous are
+    matched, the same way as json-merger does.
+
+    Args:
+        l1(list): the first list of entries.
+        l2(list): the second list of entries.
+        thresh(float): maximum distance between two matching entries.
+        dist_fn(callable): distance function between two entries.
+        norm_funcs(list): normalization functions.
+
+    Returns:
+        tuple: ``(common, l1_only, l2_only)`` where ``common`` are the pairs
+        of ``(l1_index, l2_index)`` of matching entries, and ``l1_only`` and
+        ``l2_only`` the indices of the entries left unmatched.
+    """
+    common = []
+    l1_only = list(range(len(l1)))
+    l2_only = list(range(len(l2)))
+
+    for norm_fn in norm_funcs:
+        if not (l1_only and l2_only):
+            break
+        new_common, l1_only, l2_only = _match_by_norm_func(
+            l1, l2, l1_only, l2_only, norm_fn, dist_fn, thresh
+        )
+        common.extend(new_common)
+
+    return common, l1_only, l2_only
+
+
+def match_by_position(l1, l2, l1_indices, l2_indices, thresh, dist_fn):
+    """Returns pairs of indices of entries at the same position.
+
+    The n-th entry of ``l1_indices`` is matched with the n-th entry of
+    ``l2_indices`` if they are at most at ``thresh`` from each other. This
+    only needs a distance per entry, and works for lists in the same order.
+
+    Args:
+        l1(list): the first list of entries.
+        l2(list): the second list of entries.
+        l1_indices(list): indices of the entries of ``l1`` to match.
+        l2_indices(list): indices of the entries of ``l2`` to match.
+        thresh(float): maximum distance between two matching entries.
+        dist_fn(callable): distance function between two entries.
+
+    Returns:
+        list: pairs of ``(l1_index, l2_index)`` of matching entries.
+    """
+    return [
+        (l1_idx, l2_idx) for l1_idx, l2_idx in zip(l1_indices, l2_indices)
+        if dist_fn(l1[l1_idx], l2[l2_idx]) <= thresh
+    ]
+
+
+def distance_matrix_match(dist_matrix, thresh):
+    """Returns pairs of matching indices given the distances between entries.
+
+    The entries are matched by the Munkres algorithm on the connected
+    components of entries at most at ``thresh`` from each other, the same way
+    as :func:`json_merger.contrib.inspirehep.match.distance_function_match`.
+
+    Args:
+        dist_matrix(numpy.ndarray): the distances between the entries of the
+            two lists.
+        thresh(float): maximum distance between two matching entries.
+
+    Returns:
+        list: pairs of ``(l1_index, l2_index)`` of matching entries.
+    """
+    components = BipartiteConnectedComponents()
+    for l1_idx, l2_idx in zip(*(dist_matrix <= thresh).nonzero()):
+        components.add_edge(int(l1_idx), int(l2_idx))
+
+    common = []
+    for l1_indices, l2_indices in components.get_connected_components():
+        part_dist_matrix = [
+            [float(dist_matrix[l1_idx, l2_idx]) for l2_idx in l2_indices]
+            for l1_idx in l1_indices
+        ]
+        common.extend(
+            (l1_indices[l1_idx], l2_indices[l2_idx])
+            for l1_idx, l2_idx in _match_munkres(part_dist_matrix, thresh)
+        )
+    return common
+
+
+def _match_munkres(dist_matrix, thresh):
+    """Matches with the Munkres algorithm, keeping the equally good pairs."""
+    equal_dist_matches = set()
+    for l1_idx, l2_idx in Munkres().compute(dist_matrix):
+        dist = dist_matrix[l1_idx][l2_idx]
+        if dist > thresh:
+            continue
+        for eq_l2_idx, eq_dist in enumerate(dist_matrix[l1_idx]):
+            if abs(dist - eq_dist) < 1e-9:
+                equal_dist_matches.add((l1_idx, eq_l2_idx))
+        for eq_l1_idx, eq_row in enumerate(dist_matrix):
+            if abs(dist - eq_row[l2_idx]) < 1e-9:
+                equal_dist_matches.add((eq_l1_idx, l2_idx))
+    return equal_dist_matches
+
+
+def _match_by_norm_func(l1, l2, l1_indices, l2_indices, norm_fn, dist_fn, thresh):
+    """Matches the entries of l1 and l2 having the same normalized value.
+
+    Only buckets of entries with the same normalized value which are not
+    ambiguous are considered, the same way as json-merger does.
+    """
+    buckets_l1 = _group_by_fn(l1_indices, lambda idx: norm_fn(l1[idx]))
+    buckets_l2 = _group_by_fn(l2_indices, lambda idx: norm_fn(l2[idx]))
+
+    common = []
+    l1_matched = set()
+    l2_matched = set()
+    for normed, l1_bucket in buckets_l1.items():
+        l2_bucket = buckets_l2.get(normed)
+        if not l2_bucket or len(l1_bucket) != len(l2_bucket):
+            continue
+        first_l1 = l1[l1_bucket[0]]
+        first_l2 = l2[l2_bucket[0]]
+        match_is_ambiguous = not (
+            all(l2[idx] == first_l2 for idx in l2_bucket) or
+            all(l1[idx] == first_l1 for idx in l1_bucket)
+        )
+        if match_is_ambiguous:
+            continue
+        for l1_idx, l2_idx in zip(l1_bucket, l2_bucket):
+            if dist_fn(l1[l1_idx], l2[l2_idx]) > thresh:
+                continue
+            l1_matched.add(l1_idx)
+            l2_matched.add(l2_idx)
+            common.append((l1_idx, l2_idx))
+
+    l1_only = [idx for idx in l1_indices if idx not in l1_matched]
+    l2_only = [idx for idx in l2_indices if idx not in l2_matched]
+    return common, l1_only, l2_only
+
+
+def _partition_in_blocks(l1, l2, l1_indices, l2_indices, block_fn):
+    blocks_l1 = _group_by_fn(l1_indices, lambda idx: block_fn(l1[idx]))
+    blocks_l2 = _group_by_fn(l2_indices, lambda idx: block_fn(l2[idx]))
+
+    return [
+        (l1_block, blocks_l2[key])
+        for key, l1_block in blocks_l1.items()
+        if key is not None and key in blocks_l2
+    ]
+
+
+def _group_by_fn(iterable, fn):
+    buckets = {}
+    for elem in iterable:
+        buckets.setdefault(fn(elem), []).append(elem)
+    return buckets
@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2014-2017 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+"""Merge records in parallel on a pool of worker processes."""
+
+from __future__ import absolute_import, division, print_function
+
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+try:
+    from concurrent.futures.process import BrokenProcessPool
+except ImportError:
+    # The Python 2 backport of concurrent.futures never breaks its pools.
+    class BrokenProcessPool(RuntimeError):
+        pass
+
+LOGGER = logging.getLogger(__name__)
+
+
+def merge_parallel(triples, processes=None, max_in_flight=None, timeout=None,
+                   maxtasksperchild=None, on_error=None):
+    """Merge many records on a pool of worker processes.
+
+    This behaves like :func:`inspire_json_merger.api.merge_many`, but the
+    merges run in separate processes, so that they are not serialized by the
+    GIL. The results are yielded in the same order as ``triples``.
+
+    A worker process dying, for instance killed by a signal, breaks its
+    pool, and all the records it was merging or which were waiting for a
+    worker are merged again on a fresh pool. As the record which killed the
+    worker can't be told apart from the others, each of them is retried
+    once with the others, then alone in its own worker process if it
+    breaks a pool again. Only a record breaking the pool it's merged alone
+    on is reported as failed.
+
+    Args:
+        triples(Iterable[tuple]): the records to merge, each one being either
+            ``(root, head, update)`` or ``(root, head, update, head_source)``.
+        processes(int): number of worker processes. Defaults to the number
+            of CPUs.
+        max_in_flight(int): maximum number of records submitted to the
+            workers and not yet yielded. ``triples`` is consumed only as
+            fast as the results are, which bounds the memory used. Defaults
+            to twice the number of workers.
+        timeout(float): seconds to wait for the result of each record. A
+            record exceeding it is reported as failed, and the workers are
+            killed and replaced so that it doesn't keep one busy. The other
+            records they were merging are submitted again. Defaults to
+            waiting forever.
+        maxtasksperchild(int): number of records per worker process after
+            which the pool of workers is replaced by a fresh one. Defaults
+            to never replacing workers.
+        on_error(callable): called as ``on_error(index, triple, exception)``
+            when merging the ``index``-th triple fails.
+
+    Returns:
+        An iterator over the ``(merged, conflicts)`` tuples, in the same
+        order as ``triples``. A record which failed to merge yields
+        ``(None, None)``.
+    """
+    processes = processes or multiprocessing.cpu_count()
+    max_in_flight = max_in_flight or 2 * processes
+    pool = _WorkerPool(processes, maxtasksperchild)
+    pending = deque()
+    finished = False
+    try:
+        for index, triple in enumerate(triples):
+            pending.append(pool.submit(index, triple))
+            if len(pending) >= max_in_flight:
+                yield _get_result(pending, pool, timeout, on_error)
+        while pending:
+            yield _get_result(pending, pool, timeout, on_error)
+        finished = True
+    finally:
+        if finished:
+            pool.shutdown()
+        else:
+            pool.terminate()
+
+
+class _WorkerPool(object):
+    """Process pool executor, replaced when it can't be used anymore.
+
+    Merges can also be submitted alone, each one on an executor of its own
+    which is shut down once its result is read.
+
+    Args:
+        processes(int): number of worker processes.
+        maxtasksperchild(int): number of records per worker process after
+            which the executor is replaced, never if ``None``.
+    """
+
+    def __init__(self, processes, maxtasksperchild=None):
+        self.processes = processes
+        self.max_tasks = processes * maxtasksperchild if maxtasksperchild else None
+        self._executor = None
+        self._tasks = 0
+        self._alone = set()
+
+    def submit(self, index, triple, alone=False):
+        """Submits a triple to merge and returns its pending merge.
+
+        Args:
+            index(int): the position of the triple in the batch.
+            triple(tuple): the records to merge.
+            alone(bool): whether to merge the triple on an executor of its
+                own, with a single worker process.
+
+        Returns:
+            list: ``[index, triple, future, executor, breaks]``, where
+            ``breaks`` counts the pools broken while merging the triple.
+        """
+        if alone:
+            executor = _make_executor(1)
+            self._alone.add(executor)
+            return [index, triple, executor.submit(_merge_in_worker, triple), executor, 0]
+
+        if self._executor is None or (self.max_tasks and self._tasks >= self.max_tasks):
+            self._replace()
+        try:
+            future = self._executor.submit(_merge_in_worker, triple)
+        except BrokenProcessPool:
+            # A worker died since the last submission.
+            self._replace()
+            future = self._executor.submit(_merge_in_worker, triple)
+        self._tasks += 1
+        return [index, triple, future, self._executor, 0]
+
+    def resubmit(self, pending_merge, alone=False):
+        """Submits again a merge whose workers were killed."""
+        index, triple, _, _, breaks = pending_merge
+        pending_merge[:] = self.submit(index, triple, alone)
+        pending_merge[4] = breaks
+
+    def kill(self, executor):
+        """Kills the worker processes of ``executor``."""
+        if executor is self._executor:
+            self._executor = None
+        self._alone.discard(executor)
+        _terminate_executor(executor)
+
+    def release(self, executor):
+        """Shuts down ``executor`` if it was merging a single triple."""
+        if executor in self._alone:
+            self._alone.discard(executor)
+            executor.shutdown(wait=False)
+
+    def shutdown(self):
+        for executor in self._alone:
+            executor.shutdown()
+        self._alone.clear()
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def terminate(self):
+        for executor in list(self._alone):
+            self.kill(executor)
+        if self._executor is not None:
+            self.kill(self._executor)
+
+    def _replace(self):
+        if self._executor is not None:
+            # Let the workers finish the records they already got.
+            self._executor.shutdown(wait=False)
+        self._executor = _make_executor(self.processes)
+        self._tasks = 0
+
+
+def _make_executor(processes):
+    try:
+        return ProcessPoolExecutor(processes, initializer=_initialize_worker)
+    except TypeError:
+        # Executors take an initializer only from Python 3.7.
+        return ProcessPoolExecutor(processes)
+
+
+def _terminate_executor(executor):
+    terminate_workers = getattr(executor, 'terminate_workers', None)
+    if terminate_workers is not None:
+        terminate_workers()
+        return
+
+    # Executors can terminate their workers only from Python 3.14.
+    workers = list((getattr(executor, '_processes', None) or {}).values())
+    executor.shutdown(wait=False)
+    for worker in workers:
+        worker.terminate()
+    for worker in workers:
+        worker.join()
+
+
+def _initialize_worker():
+    """Import the merger and its configuration once per worker process."""
+    import inspire_json_merger.api  # noqa: F401
+
+
+def _merge_in_worker(triple):
+    from inspire_json_merger.api import merge
+
+    try:
+        return True, merge(*triple)
+    except Exception as e:
+        LOGGER.exception('Failed to merge record in worker process')
+        return False, e
+
+
+def _get_result(pending, pool, timeout, on_error):
+    while True:
+        pending_merge = pending.popleft()
+        index, triple, future, executor, breaks = pending_merge
+        try:
+            succeeded, result = future.result(timeout)
+        except FutureTimeoutError as e:
+            _kill_workers(executor, pending, pool)
+            succeeded, result = False, e
+        except BrokenProcessPool as e:
+            if breaks < _MAX_BREAKS:
+                pending.appendleft(pending_merge)
+                _retry_broken_merges(executor, pending, pool)
+                continue
+            pool.kill(executor)
+            succeeded, result = False, e
+        except Exception as e:
+            succeeded, result = False, e
+        break
+
+    pool.release(executor)
+    if succeeded:
+        return result
+
+    LOGGER.error('Failed to merge record number %d of the batch: %r', index, result)
+    if on_error:
+        on_error(index, triple, result)
+    return None, None
+
+
+# Number of broken pools after which a merge fails: the first one is retried
+# with the other merges, the second one alone.
+_MAX_BREAKS = 2
+
+
+def _retry_broken_merges(executor, pending, pool):
+    """Resubmits the merges which were on the broken pool of ``executor``."""
+    broken = [
+        pending_merge for pending_merge in pending
+        if pending_merge[3] is executor and _is_broken(pending_merge[2])
+    ]
+    pool.kill(executor)
+    for pending_merge in broken:
+        pending_merge[4] += 1
+        LOGGER.warning(
+            'Merging record number %d of the batch again after its worker died',
+            pending_merge[0],
+        )
+        pool.resubmit(pending_merge, alone=pending_merge[4] == _MAX_BREAKS)
+
+
+def _is_broken(future):
+    if not future.done() or future.cancelled():
+        return True
+    return isinstance(future.exception(), BrokenProcessPool)
+
+
+def _kill_workers(executor, pending, pool):
+    """Kills the workers of a timed out merge and resubmits their other merges."""
+    unfinished = [
+        pending_merge for pending_merge in pending
+        if pending_merge[3] is executor and not pending_merge[2].done()
+    ]
+    pool.kill(executor)
+    for pending_merge in unfinished:
+        pool.resubmit(pending_merge)
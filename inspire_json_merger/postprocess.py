@@ -23,10 +23,13 @@ from __future__ import absolute_import, division, print_function
 
 import itertools
 import json
+import math
+from bisect import bisect_left, bisect_right
 from collections import Iterable
 
+import six
 from json_merger.conflict import Conflict
-from pyrsistent import thaw
+from pyrsistent import PMap, PSet, PVector, freeze, thaw
 
 from inspire_json_merger.utils import ORDER_KEY
 
@@ -44,15 +47,83 @@ def postprocess_results(merged, conflicts):
     """
 
     conflicts, merged = postprocess_conflicts(conflicts, merged)
-    conflicts_as_json = [json.loads(c.to_json()) for c in conflicts]
-    flat_conflicts_as_json = remove_ordering_from_conflicts(
-        list(itertools.chain.from_iterable(conflicts_as_json))
+    flat_conflicts_as_json = list(
+        itertools.chain.from_iterable(conflict_to_json(c) for c in conflicts)
     )
     merged = remove_ordering_from_authors_merged(merged)
 
     return merged, flat_conflicts_as_json
 
 
+def conflict_to_json(conflict):
+    """Converts a conflict to json-patch operations without ordering information.
+
+    This gives the same operations as ``json.loads(conflict.to_json())``
+    followed by :func:`remove_ordering_from_conflicts`, but builds them
+    directly from the frozen body of the conflict.
+
+    Args:
+        conflict(Conflict): the conflict to convert
+
+    Returns:
+        list: the json-patch operations of the conflict.
+    """
+    conflict_type, path, body = conflict
+    if conflict_type in ('REORDER', 'SET_FIELD'):
+        op = 'replace'
+    elif conflict_type in ('MANUAL_MERGE', 'ADD_BACK_TO_HEAD'):
+        op = 'add'
+        path += ('-',)
+    elif conflict_type == 'REMOVE_FIELD':
+        op = 'remove'
+    elif conflict_type == 'INSERT':
+        op = 'add'
+    else:
+        raise ValueError(
+            'Conflict Type %s can not be mapped to a json-patch operation'
+            % conflict_type
+        )
+
+    json_pointer = '/' + '/'.join(str(el) for el in path)
+    if isinstance(body, (list, tuple, set, PVector, PSet)):
+        values = body
+    else:
+        values = [body]
+
+    return [
+        {
+            'path': json_pointer,
+            'op': op,
+            'value': _to_json_value(value, strip_ordering=True),
+            '$type': conflict_type,
+        }
+        for value in values
+        if value is not None or conflict_type == 'REMOVE_FIELD'
+    ]
+
+
+def _to_json_value(value, strip_ordering=False):
+    """Copies a frozen or thawed value as it would be read back from JSON."""
+    if isinstance(value, (dict, PMap)):
+        return {
+            _to_json_key(key): _to_json_value(item)
+            for key, item in value.items()
+            if not (strip_ordering and key == ORDER_KEY)
+        }
+    if isinstance(value, (list, tuple, PVector)):
+        return [_to_json_value(item) for item in value]
+    if six.PY2 and isinstance(value, str):
+        return value.decode('utf-8')
+    return value
+
+
+def _to_json_key(key):
+    if isinstance(key, six.string_types):
+        return _to_json_value(key)
+    # JSON objects only have string keys.
+    return json.loads(json.dumps({key: None})).popitem()[0]
+
+
 def remove_ordering_from_conflicts(conflicts):
     """Cleans up ordering information in conflicts."""
     for conflict in conflicts:
@@ -61,15 +132,31 @@ def remove_ordering_from_conflicts(conflicts):
     return conflicts
 
 
+def add_ordering_to_authors_head(merger):
+    """Adds the position of each head author of ``merger`` under ``ORDER_KEY``.
+
+    This way equal head authors are not unified together and the head
+    authors differ from the ones of the root and of the update, as curated
+    entries. Only the merger's own copies of the authors are changed, and
+    :func:`remove_ordering_from_authors_merged` removes the key again.
+
+    Args:
+        merger(Merger): a merger which didn't run yet, whose head doesn't
+            share values, see :func:`~inspire_json_merger.utils.copy_shared_values`.
+    """
+    head_authors = (merger.head or {}).get("authors")
+    if not isinstance(head_authors, list):
+        return
+    for position, author in enumerate(head_authors):
+        if isinstance(author, dict):
+            author[ORDER_KEY] = position
+
+
 def remove_ordering_from_authors_merged(merged):
     """Cleans up ordering information in merged record."""
-    authors = []
-    if "authors" in merged:
-        for author in merged["authors"]:
-            author = thaw(author)
+    for author in merged.get("authors", ()):
+        if isinstance(author, dict):
             author.pop(ORDER_KEY, None)
-            authors.append(author)
-        merged["authors"] = authors
     return merged
 
 
@@ -92,7 +179,12 @@ def postprocess_conflicts(conflicts, merged):
         an list containing all generated conflicts.
     """
     new_conflicts = []
+    # Positions in ``new_conflicts`` of the conflicts pointing to an author,
+    # with the number of insertions in the authors which happened before
+    # they were added: their position is shifted only once at the end.
+    author_conflicts = []
     possible_duplicates = set()
+    authors = _AuthorsIndex(merged)
     conflicts = sorted(conflicts, key=lambda conflict: conflict[0])
     # Sort by conflict type so we could process "ADD_BACK_TO_HEAD" after "MANUAL_MERGE"
     while conflicts:
@@ -100,24 +192,118 @@ def postprocess_conflicts(conflicts, merged):
         conflict_type, conflict_location, conflict_content = conflict
         if conflict_type == "MANUAL_MERGE" and conflict_location[0] == "authors":
             new_conflict, merged, head = _process_author_manual_merge_conflict(
-                conflict, merged
+                conflict, merged, authors
             )
             if new_conflict:
-                new_conflicts, conflicts = add_conflict(
-                    new_conflict, new_conflicts, conflicts
-                )
+                author_conflicts.append((len(new_conflicts), len(authors.insertions)))
+                new_conflicts.append(new_conflict)
                 possible_duplicates.add(head)
         elif not _is_conflict_duplicated(conflict, possible_duplicates):
             if conflict_type == "ADD_BACK_TO_HEAD":
-                new_conflict, merged = _process_add_back_to_head(conflict, merged)
-                new_conflicts, conflicts = add_conflict(
-                    new_conflict, new_conflicts, conflicts
+                new_conflict, merged = _process_add_back_to_head(
+                    conflict, merged, authors
                 )
+                if conflict_location[0] == "authors":
+                    author_conflicts.append((len(new_conflicts), len(authors.insertions)))
+                    new_conflicts.append(new_conflict)
+                else:
+                    new_conflicts, conflicts = add_conflict(
+                        new_conflict, new_conflicts, conflicts
+                    )
             else:
+                if _is_author_position(conflict_location):
+                    author_conflicts.append((len(new_conflicts), 0))
                 new_conflicts.append(conflict)
+
+    if author_conflicts and authors.insertions:
+        _shift_author_conflicts(new_conflicts, author_conflicts, authors.insertions)
     return new_conflicts, merged
 
 
+def _is_author_position(path):
+    return path[0] == "authors" and len(path) > 1 and \
+        isinstance(path[1], six.integer_types) and not isinstance(path[1], bool) and \
+        path[1] >= 0
+
+
+def _shift_author_conflicts(conflicts, author_conflicts, insertions):
+    """Shifts the conflicts pointing to an author after the insertions.
+
+    Each conflict is moved the same way as by :func:`update_conflicts_list`
+    for every insertion in the authors which happened after it was added.
+
+    Args:
+        conflicts(list): List of conflicts, updated in place
+        author_conflicts(list): pairs of ``(index, step)`` of the conflicts
+            pointing to an author in ``conflicts``, where ``step`` is the
+            number of insertions done before the conflict was added
+        insertions(list): positions of the insertions in the authors
+    """
+    positions = [conflicts[idx][1][1] for idx, _ in author_conflicts]
+    steps = [step for _, step in author_conflicts]
+    shifted = _shift_positions(positions, steps, insertions)
+    for (idx, _), position in zip(author_conflicts, shifted):
+        conflict_type, path, body = conflicts[idx]
+        if path[1] != position:
+            conflicts[idx] = Conflict(
+                conflict_type, (path[0], position) + path[2:], body
+            )
+
+
+def _shift_positions(positions, steps, insertions):
+    """Returns the positions after the insertions which followed them.
+
+    Inserting at ``insertion`` moves every position at or after it by one.
+    Instead of doing it for all the positions at every insertion, the
+    insertions are replayed backwards: the ones from ``step`` on leave
+    holes in the final list, so the final position of ``position`` is the
+    one of the ``position``-th slot which is not a hole.
+
+    Args:
+        positions(list): positions to shift
+        steps(list): for every position, the index of the first insertion
+            which happened after it was taken
+        insertions(list): positions of the insertions, in order
+
+    Returns:
+        list: the shifted positions
+    """
+    size = max(max(positions), max(insertions)) + len(insertions) + 1
+    # Fenwick tree counting the slots which are not holes, all of them
+    # at first.
+    tree = [idx & -idx for idx in range(size + 1)]
+    top_bit = 1 << (size.bit_length() - 1)
+
+    def nth_slot(nth):
+        slot = 0
+        bit = top_bit
+        while bit:
+            next_slot = slot + bit
+            if next_slot <= size and tree[next_slot] <= nth:
+                slot = next_slot
+                nth -= tree[next_slot]
+            bit >>= 1
+        return slot
+
+    def make_hole(slot):
+        slot += 1
+        while slot <= size:
+            tree[slot] -= 1
+            slot += slot & -slot
+
+    by_step = {}
+    for idx, step in enumerate(steps):
+        by_step.setdefault(step, []).append(idx)
+
+    shifted = list(positions)
+    for step in range(len(insertions), -1, -1):
+        for idx in by_step.get(step, ()):
+            shifted[idx] = nth_slot(positions[idx])
+        if step:
+            make_hole(nth_slot(insertions[step - 1]))
+    return shifted
+
+
 def add_conflict(conflict, processed_conflicts, unprocessed_conflicts):
     """Adds conflict which added something to `merged` dict so positions for other conflicts should be updated
 
@@ -153,7 +339,7 @@ def update_conflicts_list(conflict, conflict_list):
     return conflict_list
 
 
-def _process_add_back_to_head(conflict, merged):
+def _process_add_back_to_head(conflict, merged, authors=None):
     """Process ADD_BACK_TO_HEAD conflicts differently than other conflicts.
 
     Replace all ADD_BACK_TO_HEAD conflicts to became REMOVE_FIELD conflicts
@@ -162,9 +348,9 @@ def _process_add_back_to_head(conflict, merged):
     """
     conflict_type, conflict_location, conflict_content = conflict
     if conflict_location[0] == "authors":
-        position, merged["authors"] = _insert_to_list(
-            conflict_content, merged["authors"]
-        )
+        if authors is None:
+            authors = _AuthorsIndex(merged)
+        position = authors.insert(conflict_content)
         insert_path = ("authors", position)
         new_conflict = Conflict("REMOVE_FIELD", insert_path, None)
         return new_conflict, merged
@@ -219,7 +405,7 @@ def _is_conflict_duplicated(conflict, possible_duplicates):
     return False
 
 
-def _process_author_manual_merge_conflict(conflict, merged):
+def _process_author_manual_merge_conflict(conflict, merged, authors=None):
     """Process author `MANUAL_MERGE` conflict.
 
     Conflict object is an tuple containing:
@@ -227,8 +413,10 @@ def _process_author_manual_merge_conflict(conflict, merged):
     where `conflict_data` is a tuple of: (ROOT, HEAD, UPDATE).
     """
     _, _, (root, head, update) = conflict
-    if head and head not in merged["authors"]:
-        position, merged["authors"] = _insert_to_list(head, merged["authors"])
+    if authors is None:
+        authors = _AuthorsIndex(merged)
+    if head and head not in authors:
+        position = authors.insert(head)
         new_conflict = Conflict("SET_FIELD", ("authors", position), update)
         return new_conflict, merged, head
     return None, merged, head
@@ -259,3 +447,125 @@ def _insert_to_list(item, objects_list, position=None):
                 return idx, objects_list
     objects_list.append(item)
     return len(objects_list) - 1, objects_list
+
+
+def _get_order_key(element):
+    if isinstance(element, Iterable) and ORDER_KEY in element:
+        return element[ORDER_KEY]
+    return None
+
+
+class _AuthorsIndex(object):
+    """Authors of the merged record, indexed for the insertions.
+
+    Inserts the authors at the same position as :func:`_insert_to_list` and
+    checks if an author is already there without comparing it with all the
+    others.
+
+    The index is built the first time it is needed.
+
+    Args:
+        merged(dict): the merged record, whose authors are updated in place.
+    """
+
+    def __init__(self, merged):
+        self.merged = merged
+        self.insertions = []
+        self._positions = None
+        self._members = None
+
+    @property
+    def authors(self):
+        return self.merged["authors"]
+
+    def _build(self):
+        if self._positions is not None:
+            return
+        self._positions = _OrderIndex(_get_order_key(author) for author in self.authors)
+        try:
+            self._members = set(freeze(thaw(author)) for author in self.authors)
+        except TypeError:
+            self._members = None
+
+    def __contains__(self, author):
+        self._build()
+        if self._members is not None:
+            try:
+                return freeze(thaw(author)) in self._members
+            except TypeError:
+                pass
+        return author in self.authors
+
+    def insert(self, author):
+        """Inserts the author and returns its position."""
+        self._build()
+        author = thaw(author)
+        head_position = _get_order_key(author)
+        position = None
+        if head_position is not None:
+            position = self._positions.find(head_position)
+        if position is None:
+            position = len(self.authors)
+
+        self.authors.insert(position, author)
+        self._positions.insert(position, head_position)
+        self.insertions.append(position)
+        if self._members is not None:
+            try:
+                self._members.add(freeze(author))
+            except TypeError:
+                self._members = None
+        return position
+
+
+class _OrderIndex(object):
+    """Finds where :func:`_insert_to_list` would insert in a list.
+
+    For every element of the list, it keeps the greatest ``ORDER_KEY`` up to
+    it, which never decreases along the list, so that the first element with
+    an ``ORDER_KEY`` greater than a position is found by bisection, and
+    whether the element has no ``ORDER_KEY``.
+
+    Args:
+        keys(iterable): the ``ORDER_KEY`` of the elements of the list, or
+            ``None`` for the elements without it.
+    """
+
+    _NO_KEY = float('-inf')
+
+    def __init__(self, keys):
+        self._max_keys = []
+        self._keyless = []
+        max_key = self._NO_KEY
+        for key in keys:
+            if key is not None and key > max_key:
+                max_key = key
+            self._max_keys.append(max_key)
+            self._keyless.append(key is None)
+
+    def __len__(self):
+        return len(self._max_keys)
+
+    def find(self, position):
+        """Returns where an element with ``ORDER_KEY`` ``position`` goes.
+
+        That is, the first element with a greater ``ORDER_KEY``, or the first
+        element without ``ORDER_KEY`` after the index ``position``, whichever
+        comes first, or ``None`` if there is none.
+        """
+        greater = bisect_right(self._max_keys, position)
+        start = max(int(math.floor(position)) + 1, 0)
+        try:
+            return self._keyless.index(True, start, greater)
+        except ValueError:
+            pass
+        return greater if greater < len(self) else None
+
+    def insert(self, idx, key):
+        previous = self._max_keys[idx - 1] if idx else self._NO_KEY
+        max_key = key if key is not None and key > previous else previous
+        self._max_keys.insert(idx, max_key)
+        self._keyless.insert(idx, key is None)
+        if max_key > previous:
+            end = bisect_left(self._max_keys, max_key, idx + 1)
+            self._max_keys[idx + 1:end] = [max_key] * (end - idx - 1)
@@ -24,14 +24,33 @@
 
 from __future__ import absolute_import, division, print_function
 
+import hashlib
+import json
+from collections import Counter
 from functools import partial
 
 import pyrsistent
-from inspire_utils.record import get_value
-from pyrsistent import freeze, thaw
+from pyrsistent import freeze
 from six.moves import zip
 
-from inspire_json_merger.utils import ORDER_KEY
+from inspire_json_merger.utils import CopyOnWriteRecord
+
+_MISSING = object()
+
+
+def operates_on(*fields):
+    """Declare the top-level fields that a pre-filter reads and writes.
+
+    When all the pre-filters of a merge declare their fields,
+    :func:`inspire_json_merger.utils.filter_records` passes them records
+    containing only those fields, and all the others are left untouched.
+    A pre-filter is skipped when none of its fields are in the records, so
+    it must do nothing in that case.
+    """
+    def decorator(pre_filter):
+        pre_filter.fields = frozenset(fields)
+        return pre_filter
+    return decorator
 
 
 def remove_elements_with_source(source, field):
@@ -61,25 +80,25 @@ def keep_only_update_source_in_field(field, root, head, update):
         tuple: ``(root, head, update)`` with some elements filtered out from
             ``root`` and ``head``.
     """
-    update_thawed = thaw(update)
-    update_sources = {source.lower() for source in get_value(update_thawed, '.'.join([field, 'source']), [])}
+    update_sources = {
+        source.lower() for source in peek_value(update, '.'.join([field, 'source']), [])
+    }
     if not update_sources:
         # If there is no field or source then fallback for source to `aquisition_source.source`
-        source = get_value(update_thawed, "acquisition_source.source")
+        source = peek_value(update, 'acquisition_source.source')
         if source:
             update_sources = {source.lower()}
     if len(update_sources) != 1:
         return root, head, update
     source = update_sources.pop()
 
-    if field in root:
-        root = root.set(field, remove_elements_with_source(source, root[field]))
-    if field in head:
-        head = head.set(field, remove_elements_with_source(source, head[field]))
+    root = _remove_elements_with_source_if_any(root, field, source)
+    head = _remove_elements_with_source_if_any(head, field, source)
 
     return root, head, update
 
 
+@operates_on('references')
 def filter_curated_references(root, head, update):
     """Remove references from either ``head`` or ``update`` depending on curation.
 
@@ -99,7 +118,9 @@ def filter_curated_references(root, head, update):
     if 'references' not in head or 'references' not in update:
         return root, head, update
 
-    references_curated = are_references_curated(root.get('references', []), head.get('references', []))
+    references_curated = are_references_curated(
+        _peek(root, 'references', []), _peek(head, 'references', [])
+    )
     if 'references' in root:
         root = root.remove('references')
     if references_curated:
@@ -110,6 +131,7 @@ def filter_curated_references(root, head, update):
     return root, head, update
 
 
+@operates_on('references')
 def filter_publisher_references(root, head, update):
     """Remove references from ``update`` if there are any in ``head``.
 
@@ -123,30 +145,19 @@ def filter_publisher_references(root, head, update):
     return root, head, update
 
 
-def update_authors_with_ordering_info(root, head, update):
-    """Adds ordering information into authors entries.
+def are_references_curated(root_refs, head_refs):
+    """Tell whether ``head_refs`` were curated since ``root_refs``.
+
+    The references are compared through their fingerprints, see
+    :func:`get_reference_fingerprint`.
 
-    This is helpful so we won't loose correct ordering on conflicts.
     Args:
-        root (pmap): the root record.
-        head (pmap): the head record.
-        update (pmap): the update record.
-
-    Returns: A tuple containing root, head and update with authors data
-        enriched with ordering information
+        root_refs (list): the references of the root.
+        head_refs (list): the references of the head.
 
+    Returns:
+        bool: whether the references were curated.
     """
-    if 'authors' in head:
-        head = head.update({"authors": _update_authors_list_with_ordering_data(head["authors"])})
-    return root, head, update
-
-
-def _update_authors_list_with_ordering_data(input_list):
-    positions = iter(range(len(input_list)))
-    return input_list.transform([pyrsistent.ny], lambda element: element.set(ORDER_KEY, (next(positions))))
-
-
-def are_references_curated(root_refs, head_refs):
     if not root_refs:
         return any('legacy_curated' in head_ref for head_ref in head_refs)
 
@@ -160,16 +171,99 @@ def are_references_curated(root_refs, head_refs):
 
 
 def ref_almost_equal(root_ref, head_ref):
-    return _normalize_ref(root_ref) == _normalize_ref(head_ref)
+    return get_reference_fingerprint(root_ref) == get_reference_fingerprint(head_ref)
+
+
+def get_reference_fingerprint(ref):
+    """Compute a stable hash of the content of a reference.
+
+    The ``record``, ``raw_refs``, ``reference.misc`` and ``reference.authors``
+    fields and a falsy ``curated_relation`` are ignored, as they're not
+    changed by curation of the reference.
+
+    Args:
+        ref (Mapping): the reference, either a ``dict`` or a ``pmap``.
+
+    Returns:
+        str: the hexadecimal SHA-256 of the canonical JSON serialization of
+        the reference.
+    """
+    normalized = {
+        key: value for key, value in ref.items()
+        if key not in ('record', 'raw_refs') and (key != 'curated_relation' or value)
+    }
+    reference = ref.get('reference', {})
+    if hasattr(reference, 'items'):
+        normalized['reference'] = {
+            key: value for key, value in reference.items()
+            if key not in ('misc', 'authors')
+        }
+    serialized = json.dumps(
+        normalized, sort_keys=True, separators=(',', ':'), default=_to_json
+    )
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
 
 
-def _normalize_ref(ref):
-    ref = _remove_if_present(ref, 'record')
-    ref = _remove_if_falsy(ref, 'curated_relation')
-    ref = _remove_if_present(ref, 'raw_refs')
-    ref = ref.transform(['reference'], lambda reference: _remove_if_present(reference, 'misc'))
-    ref = ref.transform(['reference'], lambda reference: _remove_if_present(reference, 'authors'))
-    return ref
+def _to_json(value):
+    if isinstance(value, pyrsistent.PMap):
+        return dict(value)
+    if isinstance(value, pyrsistent.PVector):
+        return list(value)
+    raise TypeError('%r is not JSON serializable' % (value,))
+
+
+def _remove_elements_with_source_if_any(record, field, source):
+    elements = _peek(record, field)
+    if elements is None:
+        return record
+    filtered = remove_elements_with_source(source, elements)
+    if len(filtered) == len(elements):
+        return record
+    return record.set(field, filtered)
+
+
+def peek_value(record, path, default=None):
+    """Read the value at ``path`` in a record, without thawing or freezing it.
+
+    It gives the same value as :func:`inspire_utils.record.get_value` on the
+    thawed record, for paths made of keys separated by dots, lists being
+    traversed element by element. Only the values on the path are read, so
+    the cost doesn't depend on the rest of the record.
+
+    Args:
+        record (Mapping): the record, either a ``dict``, a ``pmap`` or a
+            :class:`~inspire_json_merger.utils.CopyOnWriteRecord`.
+        path (str): the path to read, like ``'documents.source'``.
+        default: the value returned if there is nothing at ``path``.
+
+    Returns:
+        the value at ``path``, frozen if the record is, or ``default``.
+    """
+    keys = path.split('.')
+    value = _peek(record, keys[0], _MISSING)
+    if value is _MISSING:
+        return default
+    value = _get_value_at_keys(value, keys[1:])
+    return default if value is _MISSING else value
+
+
+def _get_value_at_keys(value, keys):
+    for index, key in enumerate(keys):
+        if isinstance(value, (list, pyrsistent.PVector)):
+            values = (_get_value_at_keys(element, keys[index:]) for element in value)
+            return [element for element in values if element is not _MISSING]
+        try:
+            value = value[key]
+        except (KeyError, TypeError):
+            return _MISSING
+    return value
+
+
+def _peek(record, key, default=None):
+    """Read a field only to compare it, without freezing it if possible."""
+    if isinstance(record, CopyOnWriteRecord):
+        return record.peek(key, default)
+    return record.get(key, default)
 
 
 def _remove_if_present(pmap, key):
@@ -179,40 +273,61 @@ def _remove_if_present(pmap, key):
         return pmap
 
 
-def _remove_if_falsy(pmap, key):
-    try:
-        if not pmap[key]:
-            return pmap.remove(key)
-        return pmap
-    except KeyError:
-        return pmap
+@operates_on('titles')
+def remove_duplicated_titles(root, head, update):
+    """Remove the titles with the same title and subtitle as a previous one.
 
+    Of two duplicated titles, the one not from arXiv is kept, or the first
+    one if both or none are from arXiv. The titles to drop are removed by
+    value, each time the first title equal to it.
 
-def remove_duplicated_titles(root, head, update):
-    new_elements = []
-    for data in (root, head, update):
-        titles = data.get('titles')
-        if not titles:
-            new_elements.append(data)
-            continue
-        titles_dict = dict()
-        to_delete = []
-        for title in titles:
-            title_data = (title['title'], title.get('subtitle'))
-            if title_data not in titles_dict:
-                titles_dict[title_data] = title
-            else:
-                if title['source'].lower() != 'arxiv':
-                    to_delete.append(titles_dict[title_data])
-                    titles_dict[title_data] = title
-                else:
-                    to_delete.append(title)
-        for object_to_remove in to_delete:
-            titles = titles.remove(object_to_remove)
-        new_elements.append(data.update({'titles': titles}))
-    print(new_elements)
-    return new_elements
-
-
-filter_documents_same_source = partial(keep_only_update_source_in_field, 'documents')
-filter_figures_same_source = partial(keep_only_update_source_in_field, 'figures')
+    Args:
+        root (pmap): the root record.
+        head (pmap): the head record.
+        update (pmap): the update record.
+
+    Returns:
+        tuple: ``(root, head, update)``, each record only changed if it has
+        duplicated titles.
+    """
+    return tuple(_remove_duplicated_titles(record) for record in (root, head, update))
+
+
+def _remove_duplicated_titles(record):
+    titles = _peek(record, 'titles')
+    if not titles:
+        return record
+
+    # The titles are compared by value.
+    titles = freeze(titles)
+    kept = {}
+    to_delete = Counter()
+    for title in titles:
+        title_data = (title['title'], title.get('subtitle'))
+        if title_data not in kept:
+            kept[title_data] = title
+        elif title.get('source', '').lower() != 'arxiv':
+            to_delete[kept[title_data]] += 1
+            kept[title_data] = title
+        else:
+            to_delete[title] += 1
+
+    if not to_delete:
+        return record
+    # Removing a title by value drops the first title equal to it, so the
+    # titles removed are the first ones of each value.
+    remaining = []
+    for title in titles:
+        if to_delete[title]:
+            to_delete[title] -= 1
+        else:
+            remaining.append(title)
+    return record.set('titles', freeze(remaining))
+
+
+filter_documents_same_source = operates_on('documents', 'acquisition_source')(
+    partial(keep_only_update_source_in_field, 'documents')
+)
+filter_figures_same_source = operates_on('figures', 'acquisition_source')(
+    partial(keep_only_update_source_in_field, 'figures')
+)
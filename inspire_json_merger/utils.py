@@ -25,14 +25,24 @@
 from __future__ import absolute_import, division, print_function
 
 import re
+import threading
+import time
+from collections import OrderedDict
+from copy import copy
+
 import six
+from json_merger.contrib.inspirehep.comparators import DistanceFunctionComparator
 from pyrsistent import freeze, thaw
 from six.moves import zip
 
+from inspire_json_merger.matching import match_by_norm_funcs
+
 split_on_re = re.compile(r'[\.\s-]')
 
 ORDER_KEY = "__pos"
 
+_MISSING = object()
+
 
 def scan_author_string_for_phrases(s):
     """Scan a name string and output an object representing its structure.
@@ -97,6 +107,64 @@ def scan_author_string_for_phrases(s):
     return retval
 
 
+class LRUCache(object):
+    """Thread-safe cache keeping the most recently used values.
+
+    Args:
+        max_size(int): maximum number of values kept. It can be changed
+            afterwards, the exceeding values are dropped at the next
+            insertion.
+
+    Attributes:
+        hits(int): number of lookups which found the value in the cache.
+        misses(int): number of lookups which had to compute the value.
+    """
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._values = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._values)
+
+    @property
+    def hit_rate(self):
+        """float: fraction of the lookups which found the value."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def get_or_compute(self, key, compute):
+        """Return the value of ``key``, calling ``compute()`` if missing.
+
+        The value is shared between all the callers, so it must not be
+        modified.
+        """
+        with self._lock:
+            value = self._values.pop(key, _MISSING)
+            if value is not _MISSING:
+                self._values[key] = value
+                self.hits += 1
+                return value
+            self.misses += 1
+
+        value = compute()
+        with self._lock:
+            self._values[key] = value
+            while len(self._values) > self.max_size:
+                self._values.popitem(last=False)
+        return value
+
+    def clear(self):
+        """Remove all the values and reset the statistics."""
+        with self._lock:
+            self._values.clear()
+            self.hits = 0
+            self.misses = 0
+
+
 def filter_conflicts(conflicts_list, fields):
     """Use this function to automatically filter all the entries defined for a
     given rule.
@@ -109,10 +177,102 @@ def filter_conflicts(conflicts_list, fields):
     Return:
         List[Conflict]: the given list filtered by `fields`
     """
-    for field in fields:
-        conflicts_list = filter_conflicts_by_path(conflicts_list, field)
+    return filter_conflicts_by_paths(conflicts_list, compile_conflict_filters(fields))
 
-    return conflicts_list
+
+def compile_conflict_filters(fields):
+    """Compile the filter paths once, so that they can be reused across merges.
+
+    Params:
+        fields(List[str]): fields to filter out, using an accessor syntax of
+            the form ``field.subfield.subsubfield``.
+
+    Return:
+        ConflictFilterTrie: the prefix trie of the paths of ``fields``.
+    """
+    return ConflictFilterTrie(tuple(field.split('.')) for field in fields or ())
+
+
+class ConflictFilterTrie(object):
+    """Prefix trie of the paths of the conflicts to filter out.
+
+    A conflict matches if the keys of its path, ignoring the list indices,
+    start with one of the paths. Checking a conflict walks its path once,
+    whatever the number of paths in the trie.
+
+    Args:
+        paths(Iterable[tuple]): the paths to filter out, each one as a tuple
+            of keys.
+    """
+
+    _END = object()
+
+    def __init__(self, paths=()):
+        self.paths = tuple(tuple(path) for path in paths)
+        self._root = {}
+        for path in self.paths:
+            node = self._root
+            for key in path:
+                if self._END in node:
+                    break
+                node = node.setdefault(key, {})
+            else:
+                node.clear()
+                node[self._END] = True
+
+    def __bool__(self):
+        return bool(self.paths)
+
+    __nonzero__ = __bool__
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, self.paths)
+
+    def matches(self, conflict_path):
+        """Tell whether a conflict path starts with one of the paths.
+
+        Params:
+            conflict_path(tuple): the path of the conflict, list indices
+                included.
+
+        Return:
+            bool: whether the conflict should be filtered out.
+        """
+        node = self._root
+        if self._END in node:
+            return True
+        for key in conflict_path:
+            if isinstance(key, int):
+                continue
+            node = node.get(key)
+            if node is None:
+                return False
+            if self._END in node:
+                return True
+        return False
+
+
+def filter_conflicts_by_paths(conflicts_list, paths):
+    """Filter a list of conflicts for all the given paths in a single pass.
+
+    Params:
+        conflicts_list(List[Conflict]): the list of conflicts to filter.
+        paths(ConflictFilterTrie): paths to filter out, as returned by
+            :func:`compile_conflict_filters`. A sequence of paths, each one
+            as a tuple of keys, is compiled on the fly.
+
+    Return:
+        List[Conflict]: the conflicts not matching any of ``paths``.
+    """
+    if not isinstance(paths, ConflictFilterTrie):
+        paths = ConflictFilterTrie(paths)
+    if not paths:
+        return list(conflicts_list)
+
+    return [
+        conflict for conflict in conflicts_list
+        if conflict[0] == 'MANUAL_MERGE' or not paths.matches(conflict[1])
+    ]
 
 
 def filter_conflicts_by_path(conflict_list, to_delete_path):
@@ -146,10 +306,432 @@ def conflict_to_list(conflict):
     return [p for p in path if not isinstance(p, int)]
 
 
-def filter_records(root, head, update, filters=()):
-    """Apply the filters to the records."""
-    root, head, update = freeze(root), freeze(head), freeze(update)
+def filter_records(root, head, update, filters=(), on_filter=None):
+    """Apply the filters to the records.
+
+    The filters get a :class:`CopyOnWriteRecord` view of each record: only
+    the fields they read are frozen, and only the fields they change are
+    copied back into the filtered records. All the other fields are passed
+    through as they are. If all the filters declare the fields they operate
+    on, the views only expose those fields, see :class:`PreFilterPipeline`.
+
+    ``filters`` can be a :class:`PreFilterPipeline` already compiled by
+    :func:`compile_pre_filters`. If given, ``on_filter`` is called as
+    ``on_filter(filter_, duration)`` after running each filter.
+    """
+    if not isinstance(filters, PreFilterPipeline):
+        filters = compile_pre_filters(filters)
+    return filters(root, head, update, on_filter)
+
+
+def compile_pre_filters(filters):
+    """Compile the pre-filters into a :class:`PreFilterPipeline`.
+
+    Params:
+        filters(list): the pre-filters.
+
+    Return:
+        PreFilterPipeline: the pipeline applying the filters.
+    """
+    return PreFilterPipeline(filters)
+
+
+class PreFilterPipeline(object):
+    """Pre-filters grouped by the fields they operate on.
+
+    Filters sharing some fields are in the same group, in their original
+    order, so that the groups operate on disjoint sets of fields and can be
+    applied independently. The records are traversed once to find the
+    fields they have, the groups whose fields are in none of the records are
+    skipped, and each group only sees its own fields. The changes of all the
+    groups are then copied into the filtered records at once.
+
+    Filters declaring their fields with
+    :func:`inspire_json_merger.pre_filters.operates_on` must do nothing when
+    none of those fields are in the records. If any filter doesn't declare
+    its fields, all the filters are applied in turn to the whole records.
+
+    Args:
+        filters(list): the pre-filters.
+    """
+
+    def __init__(self, filters):
+        self.filters = tuple(filters or ())
+        self.fields = get_filtered_fields(self.filters)
+        self.groups = None
+        if self.fields is not None:
+            self.groups = _group_filters_by_fields(self.filters)
+
+    def __repr__(self):
+        return 'PreFilterPipeline(%r)' % (list(self.filters),)
+
+    def __call__(self, root, head, update, on_filter=None):
+        records = root, head, update
+        if self.groups is None:
+            views = [CopyOnWriteRecord(record) for record in records]
+            views = _apply_filters(self.filters, views, on_filter)
+            return tuple(_materialize(view) for view in views)
+
+        present = set()
+        for record in records:
+            present.update(key for key in record if key in self.fields)
+
+        changes = ({}, {}, {})
+        for fields, filters in self.groups:
+            if fields.isdisjoint(present):
+                continue
+            views = [CopyOnWriteRecord(record, fields) for record in records]
+            views = _apply_filters(filters, views, on_filter)
+            for record_changes, view in zip(changes, views):
+                record_changes.update(_get_changes(view, fields))
+
+        return tuple(
+            _apply_changes(record, record_changes)
+            for record, record_changes in zip(records, changes)
+        )
+
+
+def _group_filters_by_fields(filters):
+    groups = []
+    for position, filter_ in enumerate(filters):
+        fields = set(filter_.fields)
+        group = [(position, filter_)]
+        disjoint_groups = []
+        for group_fields, group_filters in groups:
+            if fields.isdisjoint(group_fields):
+                disjoint_groups.append((group_fields, group_filters))
+            else:
+                fields.update(group_fields)
+                group.extend(group_filters)
+        groups = disjoint_groups + [(fields, group)]
+
+    return [
+        (frozenset(fields), tuple(filter_ for _, filter_ in sorted(group, key=lambda item: item[0])))
+        for fields, group in groups
+    ]
+
+
+def _apply_filters(filters, views, on_filter):
+    root, head, update = views
     for filter_ in filters:
-        root, head, update = filter_(root, head, update)
+        if on_filter is None:
+            root, head, update = filter_(root, head, update)
+        else:
+            start = time.time()
+            root, head, update = filter_(root, head, update)
+            on_filter(filter_, time.time() - start)
+    return root, head, update
+
+
+def _get_changes(view, fields):
+    if isinstance(view, CopyOnWriteRecord):
+        return view._changes
+
+    changes = dict.fromkeys(fields, _MISSING)
+    changes.update(view)
+    return changes
+
+
+def _apply_changes(record, changes):
+    record = {
+        key: value for key, value in record.items()
+        if key not in changes
+    }
+    for key, value in changes.items():
+        if value is not _MISSING:
+            record[key] = thaw(value)
+    return record
+
+
+def _materialize(filtered):
+    if isinstance(filtered, CopyOnWriteRecord):
+        return filtered.to_dict()
+    return thaw(filtered)
+
+
+def get_filtered_fields(filters):
+    """Return the fields the filters operate on.
+
+    Params:
+        filters(list): the pre-filters.
+
+    Return:
+        frozenset: the fields declared by the filters, or ``None`` if any of
+        them doesn't declare its fields.
+    """
+    fields = set()
+    for filter_ in filters or ():
+        filter_fields = getattr(filter_, 'fields', None)
+        if filter_fields is None:
+            return None
+        fields.update(filter_fields)
+    return frozenset(fields)
+
+
+def split_unchanged_fields(root, head, update, ordered_fields=(), comparators=None):
+    """Resolve upfront the top-level fields whose merge result is known.
+
+    A field is resolved without going through the merger when its value is
+    the same in ``root``, ``head`` and ``update`` or, for fields in which
+    ``head`` and ``update`` don't have lists at the same path, when it's the
+    same in ``head`` and ``update`` or when only one of them changed it with
+    respect to ``root``. In all these cases the merger would take the value
+    as is, without any conflict. This is not the case for a value the same
+    everywhere with a list whose entries match each other, which the merger
+    unifies together, so such a value is left to the merger.
+    The entries of a non empty list in ``head`` for one of ``ordered_fields``
+    are told apart by their position in the merger, so apart from the first
+    case such a value is always taken as changed in ``head``.
+
+    Args:
+        root (dict): the root record.
+        head (dict): the head record.
+        update (dict): the update record.
+        ordered_fields (iterable): the fields whose ``head`` entries carry
+            their position in the merger.
+        comparators (dict): the comparator classes of the merger, by dotted
+            path of the lists.
+
+    Returns:
+        tuple: ``(resolved, root, head, update)`` where ``resolved`` contains
+        the merged value of the resolved fields, and ``root``, ``head`` and
+        ``update`` contain only the fields which still need to be merged.
+    """
+    resolved = {}
+    diverged = []
+    for field in set(root) | set(head) | set(update):
+        root_value = root.get(field, _MISSING)
+        head_value = head.get(field, _MISSING)
+        update_value = update.get(field, _MISSING)
+        head_ordered = field in ordered_fields and isinstance(head_value, list) and bool(head_value)
+
+        if update_value == root_value and head_value == root_value:
+            if isinstance(head_value, (dict, list)) and \
+                    _has_matching_entries(head_value, comparators or {}, field):
+                diverged.append(field)
+                continue
+            merged_value = head_value
+        elif _have_list_in_common(head_value, update_value):
+            diverged.append(field)
+            continue
+        elif update_value == root_value or (not head_ordered and head_value == update_value):
+            merged_value = head_value
+        elif not head_ordered and head_value == root_value:
+            merged_value = update_value
+        else:
+            diverged.append(field)
+            continue
+
+        if merged_value is not _MISSING:
+            resolved[field] = merged_value
+
+    return (
+        resolved,
+        _select_fields(root, diverged),
+        _select_fields(head, diverged),
+        _select_fields(update, diverged),
+    )
+
+
+def _select_fields(record, fields):
+    return {field: record[field] for field in fields if field in record}
+
+
+def _has_matching_entries(value, comparators, dotted_path):
+    """Check if the merger would match entries of a list in ``value`` together.
+
+    The entries of the lists without a comparator match when they are equal.
+    For the lists with a comparator matching by distance, like the authors,
+    only the normalization functions are run, as the distances are costly:
+    if they leave entries unmatched, for example authors with the same
+    identifiers or names, these entries could match each other.
+    """
+    if isinstance(value, dict):
+        return any(
+            _has_matching_entries(item, comparators, dotted_path + '.' + key)
+            for key, item in value.items() if isinstance(item, (dict, list))
+        )
+
+    if len(value) > 1:
+        comparator_cls = comparators.get(dotted_path)
+        if comparator_cls is None:
+            entries = [_to_hashable(entry) for entry in value]
+            if len(set(entries)) != len(entries):
+                return True
+        elif issubclass(comparator_cls, DistanceFunctionComparator):
+            _, unmatched, _ = match_by_norm_funcs(
+                value,
+                value,
+                comparator_cls.threshold,
+                comparator_cls.__dict__['distance_function'],
+                comparator_cls.norm_functions,
+            )
+            if unmatched:
+                return True
+        else:
+            matches = comparator_cls(value, value).matches
+            if any(l1_idx != l2_idx for l1_idx, l2_idx in matches):
+                return True
+
+    return any(
+        _has_matching_entries(entry, comparators, dotted_path)
+        for entry in value if isinstance(entry, (dict, list))
+    )
+
+
+def _to_hashable(value):
+    if isinstance(value, dict):
+        return frozenset((key, _to_hashable(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return tuple(_to_hashable(item) for item in value)
+    return value
+
+
+def _have_list_in_common(head_value, update_value):
+    """Check if the merger would unify lists found at the same path in both."""
+    if isinstance(head_value, list) and isinstance(update_value, list):
+        return True
+    if isinstance(head_value, dict) and isinstance(update_value, dict):
+        return any(
+            _have_list_in_common(value, update_value[key])
+            for key, value in head_value.items() if key in update_value
+        )
+    return False
+
+
+def copy_shared_values(value):
+    """Copy in place the dicts and lists found more than once in ``value``.
+
+    The merger changes some of the entries of its records in place, so an
+    entry found twice in a record, which a deep copy keeps shared, would be
+    changed twice. Only the shared values are copied.
+
+    Params:
+        value(dict): the record, changed in place.
+    """
+    seen = set([id(value)])
+    stack = [value]
+    while stack:
+        container = stack.pop()
+        keys = list(container) if isinstance(container, dict) else range(len(container))
+        for key in keys:
+            item = container[key]
+            if not isinstance(item, (dict, list)):
+                continue
+            if id(item) in seen:
+                item = container[key] = copy(item)
+            seen.add(id(item))
+            stack.append(item)
+
+
+class CopyOnWriteRecord(object):
+    """Immutable view of a record, copying only the fields that change.
+
+    It offers the part of the ``pmap`` interface used by the pre-filters.
+    Every field is frozen the first time it's read, and setting or removing
+    fields returns a new view sharing all the other fields with this one.
+    The record itself is never modified.
+
+    Args:
+        record(dict): the record to wrap.
+        fields(Iterable[str]): the only fields exposed by the view. All of
+            them if ``None``.
+    """
+
+    def __init__(self, record, fields=None):
+        self._record = record
+        self._fields = fields
+        self._changes = {}
+        self._frozen = {}
+
+    def _with_changes(self, changes):
+        view = CopyOnWriteRecord(self._record, self._fields)
+        view._frozen = self._frozen
+        view._changes = changes
+        return view
+
+    def _is_exposed(self, key):
+        return self._fields is None or key in self._fields
+
+    def __getitem__(self, key):
+        if key in self._changes:
+            value = self._changes[key]
+            if value is _MISSING:
+                raise KeyError(key)
+            return value
+        if not self._is_exposed(key):
+            raise KeyError(key)
+        if key not in self._frozen:
+            self._frozen[key] = freeze(self._record[key])
+        return self._frozen[key]
+
+    def __contains__(self, key):
+        if key in self._changes:
+            return self._changes[key] is not _MISSING
+        return self._is_exposed(key) and key in self._record
+
+    def __iter__(self):
+        for key in self._record:
+            if key not in self._changes and self._is_exposed(key):
+                yield key
+        for key, value in self._changes.items():
+            if value is not _MISSING:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return 'CopyOnWriteRecord(%r)' % (self.to_dict(),)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def peek(self, key, default=None):
+        """Return the value of ``key`` without freezing it.
+
+        The value is the one of the wrapped record if it didn't change, so it
+        must not be modified.
+        """
+        if key in self._changes or key in self._frozen:
+            return self.get(key, default)
+        if not self._is_exposed(key):
+            return default
+        return self._record.get(key, default)
+
+    def keys(self):
+        return list(self)
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+    def set(self, key, value):
+        changes = dict(self._changes)
+        changes[key] = value
+        return self._with_changes(changes)
+
+    def update(self, mapping):
+        changes = dict(self._changes)
+        changes.update(mapping)
+        return self._with_changes(changes)
+
+    def remove(self, key):
+        if key not in self:
+            raise KeyError(key)
+        changes = dict(self._changes)
+        changes[key] = _MISSING
+        return self._with_changes(changes)
 
-    return thaw(root), thaw(head), thaw(update)
+    def to_dict(self):
+        """Build the changed record, sharing the unchanged fields with it."""
+        record = {
+            key: value for key, value in self._record.items()
+            if key not in self._changes
+        }
+        for key, value in self._changes.items():
+            if value is not _MISSING:
+                record[key] = thaw(value)
+        return record
@@ -36,6 +36,7 @@ setup_requires = [
 ]
 
 install_requires = [
+    'futures~=3.0,>=3.2.0;python_version=="2.7"',
     # newer munkres is Python 3 only
     'munkres==1.0.12',
     'inspire-schemas~=61.0',
@@ -46,6 +47,10 @@ install_requires = [
 
 docs_require = []
 
+numpy_require = [
+    'numpy>=1.13.0',
+]
+
 tests_require = [
     'decorator~=4.0,>=4.1.2',
     'flake8-future-import~=0.0,>=0.4.3',
@@ -56,6 +61,7 @@ tests_require = [
 
 extras_require = {
     'docs': docs_require,
+    'numpy': numpy_require,
     'tests': tests_require,
 }
 
@@ -84,6 +90,14 @@ setup(
     install_requires=install_requires,
     tests_require=tests_require,
     extras_require=extras_require,
+    entry_points={
+        'console_scripts': [
+            'inspire-json-merger = inspire_json_merger.cli:main',
+            'inspire-json-merger-replay = inspire_json_merger.capture:main',
+        ],
+    },
+    # inspire_json_merger.aio, the asyncio front-end, needs Python 3.6+ and
+    # isn't importable on Python 2.7, where the rest of the package works.
     classifiers=[
         'Development Status :: 4 - Beta',
         'Environment :: Web Environment',
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2014-2017 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Benchmark of :func:`inspire_json_merger.api.merge` on synthetic records.
+
+Run it from the root of the repository, for example::
+
+    python -m tests.benchmarks.benchmark_merge --size large --repeat 3
+
+For every configuration path, it reports the wall time of the merge, its
+peak memory usage and the time spent in each of its stages. The results
+can be saved with ``--save`` and compared with saved results with
+``--baseline``, in which case the exit status is ``1`` if any merge got
+slower than the tolerance allows.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import gc
+import json
+import sys
+import time
+
+from inspire_json_merger import api
+from inspire_json_merger.capture import PeakMemoryTracer
+from inspire_json_merger.instrumentation import STAGES, RecordingInstrumentation
+
+from .generators import CONFIGURATION_PATHS, generate_triple
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+SIZES = {
+    'small': {'authors': 100, 'references': 50, 'figures': 10, 'documents': 5},
+    'medium': {'authors': 1000, 'references': 500, 'figures': 100, 'documents': 50},
+    'large': {'authors': 5000, 'references': 3000, 'figures': 300, 'documents': 200},
+}
+
+
+def run_benchmark(path, repeat=3, measure_memory=True, **generator_kwargs):
+    """Benchmark the merge of a synthetic triple.
+
+    Args:
+        path(str): one of
+            :data:`tests.benchmarks.generators.CONFIGURATION_PATHS`.
+        repeat(int): number of merges timed.
+        measure_memory(bool): whether to run one more merge tracing the
+            memory allocations.
+        generator_kwargs: passed to
+            :func:`tests.benchmarks.generators.generate_triple`.
+
+    Returns:
+        dict: the results, with the median and minimum wall time in seconds,
+        the peak memory in bytes, the median time of each stage and of each
+        pre-filter in seconds and the number of conflicts.
+    """
+    root, head, update = generate_triple(path, **generator_kwargs)
+
+    wall_times = []
+    instrumentations = []
+    for _ in range(repeat):
+        instrumentation = RecordingInstrumentation()
+        gc.collect()
+        start = time.time()
+        _, conflicts = api.merge(root, head, update, instrumentation=instrumentation)
+        wall_times.append(time.time() - start)
+        instrumentations.append(instrumentation)
+
+    peak_memory = None
+    if measure_memory and tracemalloc is not None:
+        gc.collect()
+        with PeakMemoryTracer() as tracer:
+            api.merge(root, head, update)
+        peak_memory = tracer.peak_memory
+
+    stages = {
+        stage: _median([
+            instrumentation.stages.get(stage, 0.0) for instrumentation in instrumentations
+        ])
+        for stage in STAGES
+    }
+    pre_filters = {
+        name: _median([
+            instrumentation.pre_filters[name] for instrumentation in instrumentations
+        ])
+        for name in instrumentations[0].pre_filters
+    }
+
+    return {
+        'path': path,
+        'parameters': generator_kwargs,
+        'wall_time': _median(wall_times),
+        'min_wall_time': min(wall_times),
+        'peak_memory': peak_memory,
+        'stages': stages,
+        'pre_filters': pre_filters,
+        'conflicts': len(conflicts),
+    }
+
+
+def find_regressions(results, baseline, tolerance):
+    """Return the results slower than in the baseline, beyond the tolerance.
+
+    Args:
+        results(list): results of :func:`run_benchmark`.
+        baseline(list): results of a previous run.
+        tolerance(float): allowed relative slowdown, ``0.2`` meaning 20%.
+
+    Returns:
+        list: ``(path, wall_time, baseline_wall_time)`` tuples.
+    """
+    baseline_times = {
+        _scenario_key(result): result['wall_time'] for result in baseline
+    }
+    regressions = []
+    for result in results:
+        baseline_time = baseline_times.get(_scenario_key(result))
+        if baseline_time is not None and result['wall_time'] > baseline_time * (1 + tolerance):
+            regressions.append((result['path'], result['wall_time'], baseline_time))
+    return regressions
+
+
+def format_results(results):
+    header = ['path', 'wall (s)', 'min (s)', 'peak (MiB)', 'conflicts'] + \
+        ['%s (s)' % stage for stage in STAGES]
+    rows = [header]
+    for result in results:
+        peak_memory = result['peak_memory']
+        rows.append([
+            result['path'],
+            '%.3f' % result['wall_time'],
+            '%.3f' % result['min_wall_time'],
+            'n/a' if peak_memory is None else '%.1f' % (peak_memory / 2 ** 20),
+            str(result['conflicts']),
+        ] + ['%.3f' % result['stages'][stage] for stage in STAGES])
+
+    widths = [max(len(row[column]) for row in rows) for column in range(len(header))]
+    return '\n'.join(
+        '  '.join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip()
+        for row in rows
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--size', choices=sorted(SIZES), default='medium')
+    parser.add_argument(
+        '--paths', nargs='+', choices=sorted(CONFIGURATION_PATHS),
+        default=sorted(CONFIGURATION_PATHS),
+    )
+    for field in ('authors', 'references', 'figures', 'documents'):
+        parser.add_argument(
+            '--%s' % field, type=int,
+            help='number of %s, overriding the size' % field,
+        )
+    parser.add_argument('--overlap', type=float, default=0.9)
+    parser.add_argument('--edit-rate', type=float, default=0.05)
+    parser.add_argument('--head-edit-rate', type=float, default=0.02)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-memory', action='store_true', help="don't measure the peak memory")
+    parser.add_argument('--save', help='file to save the results to, as JSON')
+    parser.add_argument('--baseline', help='file with the results to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    generator_kwargs = dict(SIZES[args.size])
+    for field in generator_kwargs:
+        if getattr(args, field) is not None:
+            generator_kwargs[field] = getattr(args, field)
+    generator_kwargs.update(
+        overlap=args.overlap,
+        edit_rate=args.edit_rate,
+        head_edit_rate=args.head_edit_rate,
+        seed=args.seed,
+    )
+
+    results = [
+        run_benchmark(
+            path, repeat=args.repeat, measure_memory=not args.no_memory,
+            **generator_kwargs
+        )
+        for path in args.paths
+    ]
+    print(format_results(results))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance)
+        for path, wall_time, baseline_time in regressions:
+            print(
+                'Regression on %s: %.3fs instead of %.3fs' % (path, wall_time, baseline_time),
+                file=sys.stderr,
+            )
+        if regressions:
+            return 1
+
+    return 0
+
+
+def _median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2
+
+
+def _scenario_key(result):
+    return result['path'], json.dumps(result['parameters'], sort_keys=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2014-2017 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""Generators of synthetic records for the benchmarks.
+
+The records look like the INSPIRE literature records the merger gets in
+production: authors with identifiers and affiliations, references with
+publication information, figures and documents, and the metadata which
+decides the configuration used to merge them.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import copy
+import random
+
+from inspire_json_merger.config import (
+    ArxivOnArxivOperations,
+    ArxivOnPublisherOperations,
+    ManualMergeOperations,
+    PublisherOnArxivOperations,
+    PublisherOnPublisherOperations,
+)
+
+CONFIGURATION_PATHS = {
+    'arxiv-on-arxiv': ('arxiv', 'arxiv', ArxivOnArxivOperations),
+    'publisher-on-arxiv': ('arxiv', 'publisher', PublisherOnArxivOperations),
+    'arxiv-on-publisher': ('publisher', 'arxiv', ArxivOnPublisherOperations),
+    'publisher-on-publisher': ('publisher', 'publisher', PublisherOnPublisherOperations),
+    'manual-merge': ('arxiv', 'arxiv', ManualMergeOperations),
+}
+"""Sources of the head and of the update, and expected configuration."""
+
+_SYLLABLES = [
+    'ba', 'ch', 'de', 'en', 'fa', 'gi', 'ho', 'iv', 'ka', 'li', 'mo', 'no',
+    'ov', 'pe', 'ra', 'si', 'ta', 'ul', 'va', 'wa', 'xi', 'ya', 'zh', 'ng',
+]
+_INSTITUTIONS = [
+    'CERN', 'DESY', 'Fermilab', 'SLAC', 'KEK', 'IHEP, Beijing', 'INFN, Rome',
+    'Oxford U.', 'MIT', 'Tokyo U.', 'Sao Paulo U.', 'Cape Town U.',
+]
+_JOURNALS = [
+    'Phys.Rev.D', 'Phys.Lett.B', 'JHEP', 'Nucl.Phys.B', 'Eur.Phys.J.C',
+    'Phys.Rev.Lett.',
+]
+_PUBLISHER = 'Elsevier'
+
+
+def generate_triple(path, authors=500, references=300, figures=50,
+                    documents=20, overlap=0.9, edit_rate=0.05,
+                    head_edit_rate=0.02, seed=0):
+    """Generate a ``(root, head, update)`` triple merged with a configuration.
+
+    The update keeps a fraction ``overlap`` of the entries of the root, in
+    the same order, and replaces the others with new ones. A fraction
+    ``edit_rate`` of the kept entries is changed in the update and a
+    fraction ``head_edit_rate`` of all the entries is curated in the head.
+
+    Args:
+        path(str): one of :data:`CONFIGURATION_PATHS`.
+        authors(int): number of authors in the root.
+        references(int): number of references in the root.
+        figures(int): number of figures in the root.
+        documents(int): number of documents in the root.
+        overlap(float): fraction of entries of the root kept in the update.
+        edit_rate(float): fraction of the kept entries changed in the update.
+        head_edit_rate(float): fraction of the entries curated in the head.
+        seed(int): seed of the random generator.
+
+    Returns:
+        tuple: the root, head and update records.
+    """
+    head_source, update_source, _ = CONFIGURATION_PATHS[path]
+    rng = random.Random(seed)
+    generator = _EntriesGenerator(rng, update_source)
+
+    content = {
+        'authors': [generator.author() for _ in range(authors)],
+        'references': [generator.reference() for _ in range(references)],
+        'figures': [generator.figure() for _ in range(figures)],
+        'documents': [generator.document() for _ in range(documents)],
+        'titles': [{'title': generator.sentence(8), 'source': update_source}],
+        'abstracts': [{'value': generator.sentence(120), 'source': update_source}],
+    }
+    root = _make_record(rng, content, update_source, control_number=1)
+
+    head_content = copy.deepcopy(content)
+    for field, edit in generator.editors.items():
+        _edit_entries(rng, head_content[field], edit, head_edit_rate)
+    head = _make_record(rng, head_content, head_source, control_number=1)
+
+    update_content = copy.deepcopy(content)
+    for field, new_entry in generator.makers.items():
+        update_content[field] = [
+            entry if rng.random() < overlap else new_entry()
+            for entry in update_content[field]
+        ]
+        _edit_entries(rng, update_content[field], generator.editors[field], edit_rate)
+    update_content['titles'][0]['title'] += ' (v2)'
+    control_number = 2 if path == 'manual-merge' else 1
+    update = _make_record(rng, update_content, update_source, control_number)
+
+    return root, head, update
+
+
+def _make_record(rng, content, source, control_number):
+    record = {
+        '$schema': 'https://inspirehep.net/schemas/records/hep.json',
+        '_collections': ['Literature'],
+        'control_number': control_number,
+        'document_type': ['article'],
+        'arxiv_eprints': [{'categories': ['hep-ph'], 'value': '2101.%05d' % control_number}],
+    }
+    if source == 'arxiv':
+        record['acquisition_source'] = {'method': 'hepcrawl', 'source': 'arXiv'}
+    else:
+        record['acquisition_source'] = {'method': 'hepcrawl', 'source': _PUBLISHER}
+        record['dois'] = [{'source': _PUBLISHER, 'value': '10.1016/j.nuclphysb.2021.%06d' % control_number}]
+        record['publication_info'] = [{
+            'journal_title': rng.choice(_JOURNALS),
+            'journal_volume': str(rng.randint(1, 999)),
+            'artid': str(rng.randint(100000, 999999)),
+            'year': 2021,
+        }]
+    record.update(content)
+    return record
+
+
+def _edit_entries(rng, entries, edit, rate):
+    for entry in entries:
+        if rng.random() < rate:
+            edit(entry)
+
+
+class _EntriesGenerator(object):
+    """Generates the entries of the lists of a record, and changes them."""
+
+    def __init__(self, rng, source):
+        self.rng = rng
+        self.source = source
+        self.counter = 0
+        self.makers = {
+            'authors': self.author,
+            'references': self.reference,
+            'figures': self.figure,
+            'documents': self.document,
+        }
+        self.editors = {
+            'authors': self.edit_author,
+            'references': self.edit_reference,
+            'figures': self.edit_figure,
+            'documents': self.edit_document,
+        }
+
+    def next_id(self):
+        self.counter += 1
+        return self.counter
+
+    def word(self):
+        return ''.join(self.rng.choice(_SYLLABLES) for _ in range(self.rng.randint(2, 4)))
+
+    def sentence(self, words):
+        return ' '.join(self.word() for _ in range(words)).capitalize()
+
+    def name(self):
+        return '%s, %s' % (self.word().capitalize(), self.word().capitalize())
+
+    def author(self):
+        number = self.next_id()
+        full_name = self.name()
+        author = {
+            'full_name': full_name,
+            'affiliations': [{'value': self.rng.choice(_INSTITUTIONS)}],
+            'raw_affiliations': [{'value': 'Department of Physics, %s' % self.rng.choice(_INSTITUTIONS)}],
+        }
+        if self.rng.random() < 0.6:
+            author['ids'] = [{
+                'schema': 'INSPIRE BAI',
+                'value': '%s.%d' % (full_name.replace(', ', '.'), number),
+            }]
+        if self.rng.random() < 0.3:
+            author.setdefault('ids', []).append({
+                'schema': 'ORCID',
+                'value': '0000-0002-%04d-%04d' % (number // 10000, number % 10000),
+            })
+        if self.rng.random() < 0.2:
+            author['emails'] = ['%s@example.org' % self.word()]
+        return author
+
+    def edit_author(self, author):
+        choice = self.rng.random()
+        if choice < 0.4:
+            last_name, first_name = author['full_name'].split(', ')
+            author['full_name'] = '%s, %s.' % (last_name, first_name[0])
+        elif choice < 0.8:
+            author['affiliations'] = [{'value': self.rng.choice(_INSTITUTIONS)}]
+        else:
+            author['emails'] = ['%s@example.org' % self.word()]
+
+    def reference(self):
+        number = self.next_id()
+        reference = {
+            'authors': [{'full_name': self.name()} for _ in range(self.rng.randint(1, 5))],
+            'title': {'title': self.sentence(6)},
+            'publication_info': {
+                'journal_title': self.rng.choice(_JOURNALS),
+                'journal_volume': str(self.rng.randint(1, 999)),
+                'page_start': str(self.rng.randint(1, 9999)),
+                'year': self.rng.randint(1970, 2021),
+            },
+        }
+        if self.rng.random() < 0.5:
+            reference['arxiv_eprint'] = '%04d.%05d' % (self.rng.randint(1001, 2112), number)
+        if self.rng.random() < 0.5:
+            reference['dois'] = ['10.1103/PhysRevD.%d.%06d' % (self.rng.randint(1, 99), number)]
+        entry = {
+            'reference': reference,
+            'raw_refs': [{'schema': 'text', 'source': self.source, 'value': self.sentence(12)}],
+        }
+        if self.rng.random() < 0.7:
+            entry['record'] = {'$ref': 'https://inspirehep.net/api/literature/%d' % number}
+        return entry
+
+    def edit_reference(self, reference):
+        if self.rng.random() < 0.5:
+            reference['record'] = {'$ref': 'https://inspirehep.net/api/literature/%d' % self.next_id()}
+            reference['curated_relation'] = True
+        else:
+            reference['reference']['title'] = {'title': self.sentence(6)}
+
+    def figure(self):
+        number = self.next_id()
+        return {
+            'key': 'figure%d.png' % number,
+            'url': 'https://inspirehep.net/files/figure%d.png' % number,
+            'caption': self.sentence(20),
+            'label': 'fig:%d' % number,
+            'source': self.source,
+        }
+
+    def edit_figure(self, figure):
+        figure['caption'] = self.sentence(20)
+
+    def document(self):
+        number = self.next_id()
+        return {
+            'key': 'document%d.pdf' % number,
+            'url': 'https://inspirehep.net/files/document%d.pdf' % number,
+            'description': self.sentence(4),
+            'fulltext': self.rng.random() < 0.5,
+            'source': self.source,
+        }
+
+    def edit_document(self, document):
+        document['description'] = self.sentence(4)
@@ -26,3 +26,7 @@ import os
 import sys
 
 sys.path.append(os.path.join(os.path.dirname(__file__), 'utils'))
+
+collect_ignore = []
+if sys.version_info < (3, 6):
+    collect_ignore.append(os.path.join('unit', 'test_aio.py'))
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2014-2017 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+from __future__ import absolute_import, division, print_function
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pytest
+from mock import patch
+
+from inspire_json_merger.aio import AsyncMerger, amerge, amerge_many
+from inspire_json_merger.api import merge
+from inspire_json_merger.config import ArxivOnArxivOperations
+from inspire_json_merger.instrumentation import STAGES, RecordingInstrumentation
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+async def collect(async_iterable):
+    return [item async for item in async_iterable]
+
+
+def _make_triple(number):
+    record = {
+        'titles': [{'title': 'Superconductivity %d' % number, 'source': 'arXiv'}],
+        'arxiv_eprints': [{'value': '1710.%05d' % number}],
+        'acquisition_source': {'source': 'arXiv'},
+    }
+    update = dict(record, number_of_pages=number)
+    return {}, record, update
+
+
+def test_amerge_gives_same_result_as_merge():
+    triple = _make_triple(1)
+    instrumentation = RecordingInstrumentation()
+
+    result = run(amerge(*triple, instrumentation=instrumentation))
+
+    assert result == merge(*triple)
+    assert instrumentation.configurations == [ArxivOnArxivOperations]
+    assert set(instrumentation.stages) == set(STAGES)
+    assert len(instrumentation.durations) == 1
+
+
+def test_amerge_many_preserves_order_and_isolates_failures():
+    errors = []
+
+    def on_error(index, triple, exception):
+        errors.append((index, type(exception)))
+
+    async def triples():
+        for number in range(6):
+            yield _make_triple(number) if number != 3 else ({}, {})
+
+    result = run(collect(amerge_many(triples(), on_error, max_concurrency=2, max_in_flight=3)))
+
+    assert result[3] == (None, None)
+    assert result[:3] + result[4:] == [
+        merge(*_make_triple(number)) for number in (0, 1, 2, 4, 5)
+    ]
+    assert errors == [(3, TypeError)]
+
+
+def test_async_merger_limits_concurrency():
+    lock = threading.Lock()
+    running = [0]
+    max_running = [0]
+
+    def slow_merge(*args):
+        with lock:
+            running[0] += 1
+            max_running[0] = max(max_running[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+        return {}, []
+
+    async def merge_all(merger):
+        return await asyncio.gather(*(merger.merge({}, {}, {}) for _ in range(8)))
+
+    merger = AsyncMerger(ThreadPoolExecutor(8), max_concurrency=2)
+    with patch('inspire_json_merger.aio.merge', slow_merge):
+        result = run(merge_all(merger))
+
+    assert result == [({}, [])] * 8
+    assert max_running[0] == 2
+
+
+def test_async_merger_times_out():
+    def slow_merge(*args):
+        time.sleep(0.2)
+        return {}, []
+
+    merger = AsyncMerger(timeout=0.01)
+    with patch('inspire_json_merger.aio.merge', slow_merge):
+        with pytest.raises(asyncio.TimeoutError):
+            run(merger.merge({}, {}, {}))
+    merger.shutdown()
+
+
+def test_async_merger_cancels_waiting_merges():
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def blocking_merge(root, *args):
+        calls.append(root)
+        started.set()
+        release.wait(1)
+        return root, []
+
+    async def merge_and_cancel(merger):
+        first = asyncio.ensure_future(merger.merge('first', {}, {}))
+        second = asyncio.ensure_future(merger.merge('second', {}, {}))
+        while not started.is_set():
+            await asyncio.sleep(0.001)
+        second.cancel()
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await second
+        return await first
+
+    merger = AsyncMerger(max_concurrency=1)
+    with patch('inspire_json_merger.aio.merge', blocking_merge):
+        result = run(merge_and_cancel(merger))
+    merger.shutdown()
+
+    assert result == ('first', [])
+    assert calls == ['first']
+
+
+def test_async_merger_on_process_pool_propagates_instrumentation():
+    triples = [_make_triple(number) for number in range(3)]
+    instrumentation = RecordingInstrumentation()
+    executor = ProcessPoolExecutor(2)
+
+    merger = AsyncMerger(executor, max_concurrency=2, instrumentation=instrumentation)
+    try:
+        result = run(collect(merger.merge_many(triples)))
+    finally:
+        executor.shutdown()
+
+    assert result == [merge(*triple) for triple in triples]
+    assert instrumentation.configurations == [ArxivOnArxivOperations] * 3
+    assert len(instrumentation.durations) == 3
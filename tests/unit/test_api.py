@@ -27,7 +27,9 @@ import operator
 import os
 from operator import itemgetter
 
+from mock import patch
 import pytest
+from json_merger.merger import MergeError, Merger
 
 from utils import validate_subschema, assert_ordered_conflicts
 
@@ -36,14 +38,21 @@ from inspire_json_merger.api import (
     get_configuration,
     get_head_source,
     merge,
+    merge_many,
 )
 from inspire_json_merger.config import (
     ArxivOnArxivOperations,
     ArxivOnPublisherOperations,
     PublisherOnArxivOperations,
     PublisherOnPublisherOperations,
-    ManualMergeOperations
+    ManualMergeOperations,
+    get_merge_plan,
 )
+from inspire_json_merger.postprocess import (
+    add_ordering_to_authors_head,
+    postprocess_results,
+)
+from inspire_json_merger.utils import copy_shared_values, filter_conflicts, filter_records
 
 
 def get_file(file_path):
@@ -366,6 +375,134 @@ def test_merger_handles_authors_with_correct_ordering():
     assert conflict.sort(key=itemgetter('path')) == expected_conflict.sort(key=itemgetter('path'))
 
 
+def test_merger_keeps_duplicated_head_authors():
+    root = {'authors': [{'full_name': 'Doe, J.'}, {'full_name': 'Smith, J.'}]}
+    head = {'authors': [{'full_name': 'Doe, J.'}, {'full_name': 'Doe, J.'}, {'full_name': 'Smith, J.'}]}
+    update = {'authors': [{'full_name': 'Doe, J.'}, {'full_name': 'Smith, J.'}]}
+
+    expected_merged = {'authors': [
+        {'full_name': 'Doe, J.'},
+        {'full_name': 'Doe, J.'},
+        {'full_name': 'Smith, J.'},
+    ]}
+    expected_conflicts = [
+        {'path': '/authors/0', 'op': 'replace', 'value': {'full_name': 'Doe, J.'}, '$type': 'SET_FIELD'},
+        {'path': '/authors/1', 'op': 'replace', 'value': {'full_name': 'Doe, J.'}, '$type': 'SET_FIELD'},
+    ]
+
+    merged, conflicts = merge(root, head, update, head_source='arxiv')
+
+    assert merged == expected_merged
+    assert sorted(conflicts, key=itemgetter('path')) == expected_conflicts
+
+
+def test_merger_keeps_duplicated_head_authors_changed_from_root():
+    root = {'authors': [{'full_name': 'Smith, J.'}, {'full_name': 'Smith, J.'}, {'full_name': 'Doe, J.'}]}
+    head = {'authors': [
+        {'full_name': 'Smith, J.'},
+        {'full_name': 'Smith, J.'},
+        {'full_name': 'Brout, R.'},
+        {'full_name': 'Doe, J.'},
+    ]}
+    update = {'authors': [{'full_name': 'Smith, J.'}, {'full_name': 'Doe, J.'}, {'full_name': 'Doe, J.'}]}
+
+    expected_merged = {'authors': [
+        {'full_name': 'Smith, J.'},
+        {'full_name': 'Smith, J.'},
+        {'full_name': 'Brout, R.'},
+        {'full_name': 'Doe, J.'},
+    ]}
+    expected_conflicts = [
+        {'path': '/authors/0', 'op': 'replace', 'value': {'full_name': 'Smith, J.'}, '$type': 'SET_FIELD'},
+        {'path': '/authors/1', 'op': 'replace', 'value': {'full_name': 'Smith, J.'}, '$type': 'SET_FIELD'},
+        {'path': '/authors/2', 'op': 'remove', 'value': None, '$type': 'REMOVE_FIELD'},
+        {'path': '/authors/3', 'op': 'replace', 'value': {'full_name': 'Doe, J.'}, '$type': 'SET_FIELD'},
+    ]
+
+    merged, conflicts = merge(root, head, update, head_source='arxiv')
+
+    assert merged == expected_merged
+    assert sorted(conflicts, key=itemgetter('path')) == expected_conflicts
+
+
+def test_merger_conflicts_on_authors_removed_in_update():
+    root = {'authors': [{'full_name': 'Doe, J.'}, {'full_name': 'Smith, J.'}]}
+    head = {'authors': [{'full_name': 'Doe, J.'}, {'full_name': 'Smith, J.'}]}
+    update = {}
+
+    expected_conflicts = [
+        {'path': '/authors', 'op': 'remove', 'value': None, '$type': 'REMOVE_FIELD'},
+    ]
+
+    merged, conflicts = merge(root, head, update, head_source='arxiv')
+
+    assert merged == head
+    assert conflicts == expected_conflicts
+
+
+def test_merger_conflicts_on_titles_removed_in_update_with_duplicates_in_root():
+    root = {
+        'titles': [
+            {'title': 'Foo', 'source': 'arXiv'},
+            {'title': 'Bar', 'source': 'arXiv'},
+            {'title': 'Foo', 'source': 'arXiv'},
+        ],
+    }
+    head = {
+        'titles': [
+            {'title': 'Foo', 'source': 'arXiv'},
+            {'title': 'Bar', 'source': 'arXiv'},
+        ],
+    }
+    update = {}
+
+    expected_conflicts = [
+        {'path': '/titles', 'op': 'remove', 'value': None, '$type': 'REMOVE_FIELD'},
+    ]
+
+    merged, conflicts = merge(root, head, update, head_source='arxiv')
+
+    assert merged == head
+    assert conflicts == expected_conflicts
+
+
+def test_merger_handles_authors_shared_in_root():
+    brout = {'full_name': 'Brout, R.', 'affiliations': [{'value': 'DESY'}]}
+    root = {'authors': [brout, {'full_name': 'Smith, J.'}, brout]}
+    head = {
+        'authors': [
+            {'full_name': 'Ellis, J.R.'},
+            {'full_name': 'Smith, J.'},
+            {'full_name': 'Brout, R.', 'affiliations': [{'value': 'DESY'}]},
+        ],
+    }
+    update = {}
+
+    expected_conflicts = [
+        {'path': '/authors', 'op': 'remove', 'value': None, '$type': 'REMOVE_FIELD'},
+    ]
+
+    merged, conflicts = merge(root, head, update, head_source='arxiv')
+
+    assert merged == head
+    assert conflicts == expected_conflicts
+
+
+def test_merge_shares_fields_not_merged_with_the_inputs():
+    root = {'titles': [{'title': 'Foo'}], 'keywords': [{'value': 'Bar'}]}
+    head = {'titles': [{'title': 'Foo'}], 'keywords': [{'value': 'Bar'}]}
+    update = {'titles': [{'title': 'Baz'}], 'keywords': [{'value': 'Bar'}]}
+
+    merged, conflicts = merge(root, head, update, head_source='arxiv')
+
+    assert merged['keywords'] is head['keywords']
+    assert merged['titles'] is not head['titles']
+
+    merged['keywords'][0]['value'] = 'Changed'
+
+    assert head['keywords'] == [{'value': 'Changed'}]
+
+
 @pytest.mark.xfail(
     reason="On python3 it fails as it's getting UUIDs of duplicated authors in different order than in python 2."
 )
@@ -383,3 +520,181 @@ def test_ordering_conflicts():
 
     assert sorted(merged['authors'], key=itemgetter('uuid')) == sorted(expected_merged['authors'], key=itemgetter('uuid'))
     assert_ordered_conflicts(conflicts, expected_conflicts)
+
+
+@pytest.fixture
+def arxiv_merge_record():
+    return {
+        'titles': [{'title': 'Superconductivity', 'source': 'arXiv'}],
+        'arxiv_eprints': [{'value': '1710.05832'}],
+        'acquisition_source': {'source': 'arXiv'},
+    }
+
+
+@pytest.fixture
+def publisher_merge_record():
+    return {
+        'titles': [{'title': 'Superconductivity', 'source': 'Elsevier'}],
+        'dois': [{'value': '10.1023/A:1026654312961'}],
+        'acquisition_source': {'source': 'Elsevier'},
+    }
+
+
+def test_merge_many_yields_same_results_as_merge(arxiv_merge_record, publisher_merge_record):
+    root = {}
+    triples = [
+        (root, arxiv_merge_record, arxiv_merge_record),
+        (root, publisher_merge_record, arxiv_merge_record, 'publisher'),
+        (root, arxiv_merge_record, publisher_merge_record),
+    ]
+
+    expected = [merge(*triple) for triple in triples]
+    result = list(merge_many(triples))
+
+    assert result == expected
+
+
+def test_merge_many_reports_failures_without_aborting(arxiv_merge_record):
+    errors = []
+
+    def on_error(index, triple, exception):
+        errors.append((index, type(exception)))
+
+    triples = [
+        ({}, arxiv_merge_record, arxiv_merge_record),
+        ({}, arxiv_merge_record),
+        ({}, arxiv_merge_record, arxiv_merge_record),
+    ]
+
+    result = list(merge_many(triples, on_error=on_error))
+
+    assert result[0] == merge({}, arxiv_merge_record, arxiv_merge_record)
+    assert result[1] == (None, None)
+    assert result[2] == merge({}, arxiv_merge_record, arxiv_merge_record)
+    assert errors == [(1, ValueError)]
+
+
+def test_merge_many_is_lazy(arxiv_merge_record):
+    def triples():
+        yield {}, arxiv_merge_record, arxiv_merge_record
+        raise AssertionError('Consumed more than needed')
+
+    results = merge_many(triples())
+
+    assert next(results) == merge({}, arxiv_merge_record, arxiv_merge_record)
+
+
+def _merge_whole_records(root, head, update, configuration):
+    conflicts = []
+    root, head, update = filter_records(root, head, update, filters=configuration.pre_filters)
+    merger = Merger(
+        root=root, head=head, update=update,
+        default_dict_merge_op=configuration.default_dict_merge_op,
+        default_list_merge_op=configuration.default_list_merge_op,
+        list_dict_ops=configuration.list_dict_ops,
+        list_merge_ops=configuration.list_merge_ops,
+        comparators=configuration.comparators,
+    )
+    for record in (merger.root, merger.head, merger.update):
+        copy_shared_values(record)
+    add_ordering_to_authors_head(merger)
+    try:
+        merger.merge()
+    except MergeError as e:
+        conflicts = e.content
+    conflicts = filter_conflicts(conflicts, configuration.conflict_filters)
+
+    return postprocess_results(merger.merged_root, conflicts)
+
+
+@pytest.mark.parametrize('configuration', [
+    ArxivOnArxivOperations,
+    ArxivOnPublisherOperations,
+    PublisherOnArxivOperations,
+    PublisherOnPublisherOperations,
+    ManualMergeOperations,
+])
+@pytest.mark.parametrize('records', [
+    ('root', 'head', 'update'),
+    ('root', 'root', 'update'),
+    ('root', 'head', 'root'),
+    ('head', 'head', 'update'),
+])
+def test_merge_gives_same_result_as_merging_whole_records(configuration, records):
+    root, head, update = [load_test_data('test_data/%s.json' % name) for name in records]
+
+    expected_merged, expected_conflicts = _merge_whole_records(root, head, update, configuration)
+    with patch('inspire_json_merger.api.get_configuration', return_value=configuration):
+        merged, conflicts = merge(root, head, update)
+
+    assert merged == expected_merged
+    assert sorted(conflicts, key=json.dumps) == sorted(expected_conflicts, key=json.dumps)
+
+
+@pytest.mark.parametrize('configuration', [
+    ArxivOnArxivOperations,
+    ManualMergeOperations,
+])
+@pytest.mark.parametrize('field,value', [
+    ('_collections', ['Literature', 'Literature']),
+    ('keywords', [{'value': 'foo'}, {'value': 'foo'}]),
+    ('dois', [{'value': '10.1000/1'}, {'value': '10.1000/1', 'material': 'erratum'}]),
+    ('authors', [{'full_name': 'Doe, J.'}, {'full_name': 'Doe, J.'}]),
+    ('authors', [{'full_name': 'Doe, J.', 'affiliations': [{'value': 'CERN'}, {'value': 'CERN'}]}]),
+])
+def test_merge_gives_same_result_as_merging_whole_records_with_matching_entries(configuration, field, value):
+    record = {
+        'acquisition_source': {'source': 'arXiv'},
+        'titles': [{'title': 'Superconductivity'}],
+        field: value,
+    }
+    root, head, update = [json.loads(json.dumps(record)) for _ in range(3)]
+
+    expected_merged, expected_conflicts = _merge_whole_records(root, head, update, configuration)
+    with patch('inspire_json_merger.api.get_configuration', return_value=configuration):
+        merged, conflicts = merge(root, head, update)
+
+    assert merged == expected_merged
+    assert sorted(conflicts, key=json.dumps) == sorted(expected_conflicts, key=json.dumps)
+
+
+@pytest.mark.parametrize('configuration', [
+    ArxivOnArxivOperations,
+    ArxivOnPublisherOperations,
+    PublisherOnArxivOperations,
+    PublisherOnPublisherOperations,
+    ManualMergeOperations,
+])
+@pytest.mark.parametrize('name', ['root', 'head', 'update'])
+def test_merge_gives_same_result_as_merging_whole_records_without_changes(configuration, name):
+    root, head, update = [load_test_data('test_data/%s.json' % name) for _ in range(3)]
+
+    expected_merged, expected_conflicts = _merge_whole_records(root, head, update, configuration)
+    with patch('inspire_json_merger.api.get_configuration', return_value=configuration):
+        merged, conflicts = merge(root, head, update)
+
+    assert merged == expected_merged
+    assert sorted(conflicts, key=json.dumps) == sorted(expected_conflicts, key=json.dumps)
+
+
+def test_get_merge_plan_is_cached():
+    plan = get_merge_plan(ArxivOnArxivOperations)
+
+    assert get_merge_plan(ArxivOnArxivOperations) is plan
+    assert plan.configuration is ArxivOnArxivOperations
+    assert plan.pre_filters == tuple(ArxivOnArxivOperations.pre_filters)
+    assert plan.list_merge_ops == ArxivOnArxivOperations.list_merge_ops
+    assert plan.list_merge_ops is not ArxivOnArxivOperations.list_merge_ops
+    assert plan.conflict_filters.paths == tuple(
+        tuple(field.split('.')) for field in ArxivOnArxivOperations.conflict_filters
+    )
+
+
+def test_merge_uses_merge_plan():
+    head = {'acquisition_source': {'source': 'arXiv'}, 'titles': [{'title': 'Head'}]}
+    update = {'acquisition_source': {'source': 'ejl'}, 'titles': [{'title': 'Update'}]}
+
+    with patch('inspire_json_merger.api.get_merge_plan', wraps=get_merge_plan) as mock_get_merge_plan:
+        merge({}, head, update)
+
+    mock_get_merge_plan.assert_called_once_with(get_configuration(head, update))
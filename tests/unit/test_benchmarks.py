@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2014-2017 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+from __future__ import absolute_import, division, print_function
+
+import pytest
+
+from inspire_json_merger.api import get_configuration
+from inspire_json_merger.instrumentation import STAGES
+
+from tests.benchmarks.benchmark_merge import find_regressions, run_benchmark
+from tests.benchmarks.generators import CONFIGURATION_PATHS, generate_triple
+
+
+@pytest.mark.parametrize('path', sorted(CONFIGURATION_PATHS))
+def test_generate_triple_uses_configuration_path(path):
+    root, head, update = generate_triple(
+        path, authors=20, references=10, figures=3, documents=2
+    )
+
+    assert get_configuration(head, update) == CONFIGURATION_PATHS[path][2]
+    assert len(root['authors']) == 20
+    assert len(update['references']) == 10
+
+
+def test_generate_triple_is_deterministic():
+    assert generate_triple('arxiv-on-arxiv', authors=10, seed=1) == \
+        generate_triple('arxiv-on-arxiv', authors=10, seed=1)
+
+
+def test_run_benchmark_reports_all_stages():
+    result = run_benchmark(
+        'publisher-on-arxiv', repeat=1, measure_memory=False,
+        authors=10, references=5, figures=2, documents=1,
+    )
+
+    assert result['path'] == 'publisher-on-arxiv'
+    assert sorted(result['stages']) == sorted(STAGES)
+    assert result['stages']['merger'] > 0
+    assert result['wall_time'] >= sum(result['stages'].values())
+    assert 'filter_curated_references' in result['pre_filters']
+
+
+def test_find_regressions():
+    baseline = [
+        {'path': 'arxiv-on-arxiv', 'parameters': {'authors': 10}, 'wall_time': 1.0},
+        {'path': 'manual-merge', 'parameters': {'authors': 10}, 'wall_time': 1.0},
+    ]
+    results = [
+        {'path': 'arxiv-on-arxiv', 'parameters': {'authors': 10}, 'wall_time': 1.1},
+        {'path': 'manual-merge', 'parameters': {'authors': 10}, 'wall_time': 1.5},
+        {'path': 'manual-merge', 'parameters': {'authors': 20}, 'wall_time': 3.0},
+    ]
+
+    assert find_regressions(results, baseline, 0.2) == [('manual-merge', 1.5, 1.0)]
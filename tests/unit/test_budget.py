@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2014-2017 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+from __future__ import absolute_import, division, print_function
+
+from inspire_json_merger.api import merge
+from inspire_json_merger.budget import (
+    BudgetTracker,
+    MergeBudget,
+    active_budget,
+    get_active_budget,
+)
+from inspire_json_merger.comparators import AuthorComparator, get_pk_comparator
+from inspire_json_merger.instrumentation import RecordingInstrumentation
+from inspire_json_merger.matching import (
+    blocked_distance_function_match,
+    match_by_position,
+)
+
+
+def distance(a, b):
+    return abs(a - b)
+
+
+def get_records():
+    root = {
+        'acquisition_source': {'source': 'arXiv'},
+        'arxiv_eprints': [{'value': '1710.05832'}],
+        'titles': [{'title': 'Root'}],
+        'authors': [
+            {'full_name': 'Smith, John'},
+            {'full_name': 'Doe, Jane'},
+        ],
+    }
+    head = dict(root)
+    update = dict(
+        root,
+        authors=[
+            {'full_name': 'Smith, Johm'},
+            {'full_name': 'Doe, Jane'},
+        ],
+    )
+    return root, head, update
+
+
+def test_match_by_position():
+    l1 = [1, 5, 10, 20]
+    l2 = [1.1, 30, 10, 2]
+
+    assert match_by_position(l1, l2, [0, 1, 2], [0, 1, 2], 0.5, distance) == [(0, 0), (2, 2)]
+
+
+def test_blocked_distance_function_match_matches_by_position_when_not_allowed():
+    l1 = [1, 2]
+    l2 = [2, 1]
+    calls = []
+
+    def allow_pairs(pairs):
+        calls.append(pairs)
+        return False
+
+    assert blocked_distance_function_match(l1, l2, 0.5, distance) == [(0, 1), (1, 0)]
+    assert blocked_distance_function_match(l1, l2, 0.5, distance, allow_pairs=allow_pairs) == []
+    assert calls == [4]
+
+
+def test_blocked_distance_function_match_checks_every_block():
+    l1 = [1, 2, 11, 12]
+    l2 = [12, 11, 2, 1]
+    calls = []
+
+    def allow_pairs(pairs):
+        calls.append(pairs)
+        return len(calls) == 1
+
+    matches = blocked_distance_function_match(
+        l1, l2, 0.5, distance, block_fn=lambda entry: entry // 10,
+        max_unblocked_pairs=0, allow_pairs=allow_pairs,
+    )
+
+    assert calls == [4, 4]
+    assert sorted(matches) == [(0, 3), (1, 2)]
+
+
+def test_budget_tracker_spends_author_pairs():
+    instrumentation = RecordingInstrumentation()
+    tracker = BudgetTracker(MergeBudget(max_author_pairs=10), instrumentation)
+
+    assert tracker.allow_author_matching(2, 3, 6)
+    assert not tracker.allow_author_matching(2, 3, 6)
+    assert tracker.allow_author_matching(2, 2, 4)
+    assert tracker.author_pairs == 10
+    assert instrumentation.degradations == [
+        ('max_author_pairs', {'path': None, 'l1_size': 2, 'l2_size': 3, 'pairs': 6}),
+    ]
+
+
+def test_budget_tracker_checks_list_size_and_duration():
+    instrumentation = RecordingInstrumentation()
+
+    tracker = BudgetTracker(MergeBudget(max_list_size=2), instrumentation)
+    assert tracker.allow_author_matching(2, 2, 4)
+    assert not tracker.allow_author_matching(2, 3, 6)
+
+    tracker = BudgetTracker(MergeBudget(max_duration=-1), instrumentation)
+    assert not tracker.allow_author_matching(1, 1, 1)
+
+    assert [reason for reason, _ in instrumentation.degradations] == [
+        'max_list_size', 'max_duration',
+    ]
+
+
+def test_author_comparator_uses_active_budget():
+    l1 = [{'full_name': 'Smith, John'}, {'full_name': 'Doe, Jane'}]
+    l2 = [{'full_name': 'Doe, Jane'}, {'full_name': 'Smith, Johm'}]
+    tracker = BudgetTracker(MergeBudget(max_author_pairs=0), RecordingInstrumentation())
+
+    with active_budget(tracker):
+        assert AuthorComparator(l1, l2).matches == {(1, 0)}
+    assert get_active_budget() is None
+    assert tracker.degradations == [
+        ('max_author_pairs', {'path': None, 'l1_size': 2, 'l2_size': 2, 'pairs': 1}),
+    ]
+
+
+def test_pk_comparator_stops_comparing_after_max_duration():
+    comparator = get_pk_comparator(['value'])
+    l1 = [{'source': 'a'}, {'source': 'b'}]
+    l2 = [{'source': 'b'}, {'source': 'a'}]
+    tracker = BudgetTracker(MergeBudget(max_duration=-1), RecordingInstrumentation())
+
+    assert comparator(l1, l2).matches == {(0, 1), (1, 0)}
+    with active_budget(tracker):
+        assert comparator(l1, l2).matches == set()
+    assert tracker.degradations == [
+        ('max_duration', {'path': None, 'l1_size': 2, 'l2_size': 2, 'pairs': 4}),
+    ]
+
+
+def test_merge_with_budget_reports_degradation():
+    root, head, update = get_records()
+    instrumentation = RecordingInstrumentation()
+
+    merged, conflicts = merge(
+        root, head, update,
+        instrumentation=instrumentation,
+        budget=MergeBudget(max_author_pairs=0),
+    )
+
+    assert 'authors' in merged
+    assert instrumentation.degradations
+    assert set(reason for reason, _ in instrumentation.degradations) == {'max_author_pairs'}
+    assert set(details['path'] for _, details in instrumentation.degradations) == {'/authors'}
+    assert get_active_budget() is None
+
+    degraded = [conflict for conflict in conflicts if conflict['$type'] == 'DEGRADED_MERGE']
+    assert degraded == [{
+        'path': '/authors',
+        'value': {'reason': 'max_author_pairs', 'l1_size': 2, 'l2_size': 2, 'pairs': 1},
+        '$type': 'DEGRADED_MERGE',
+    }]
+
+
+def test_merge_without_exceeding_budget_is_unchanged():
+    root, head, update = get_records()
+    instrumentation = RecordingInstrumentation()
+
+    result = merge(
+        root, head, update,
+        instrumentation=instrumentation,
+        budget=MergeBudget(max_duration=60, max_list_size=1000, max_author_pairs=1000),
+    )
+
+    assert result == merge(root, head, update)
+    assert instrumentation.degradations == []
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2014-2017 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+
+from __future__ import absolute_import, division, print_function
+
+from mock import patch
+
+from inspire_json_merger.api import merge
+from inspire_json_merger.budget import MergeBudget
+from inspire_json_merger.cache import (
+    DirectoryCacheBackend,
+    LRUCacheBackend,
+    MergeCache,
+    merge_cache_key,
+)
+from inspire_json_merger.config import (
+    ArxivOnArxivOperations,
+    PublisherOnArxivOperations,
+)
+
+
+def _make_records():
+    head = {
+        'titles': [{'title': 'Superconductivity', 'source': 'arXiv'}],
+        'arxiv_eprints': [{'value': '1710.05832'}],
+        'acquisition_source': {'source': 'arXiv'},
+    }
+    update = dict(head, number_of_pages=42)
+    return {}, head, update
+
+
+def test_merge_cache_key_is_independent_of_key_order():
+    first = merge_cache_key({'a': 1, 'b': 2}, {}, {}, ArxivOnArxivOperations)
+    second = merge_cache_key({'b': 2, 'a': 1}, {}, {}, ArxivOnArxivOperations)
+
+    assert first == second
+
+
+def test_merge_cache_key_depends_on_configuration():
+    first = merge_cache_key({}, {}, {}, ArxivOnArxivOperations)
+    second = merge_cache_key({}, {}, {}, PublisherOnArxivOperations)
+
+    assert first != second
+
+
+def test_merge_cache_key_depends_on_package_version():
+    with patch('inspire_json_merger.cache.get_package_version', return_value='1.0.0'):
+        first = merge_cache_key({}, {}, {}, ArxivOnArxivOperations)
+    with patch('inspire_json_merger.cache.get_package_version', return_value='1.1.0'):
+        second = merge_cache_key({}, {}, {}, ArxivOnArxivOperations)
+
+    assert first != second
+
+
+def test_merge_cache_key_depends_on_content_of_configuration():
+    class ChangedOperations(ArxivOnArxivOperations):
+        pass
+
+    first = merge_cache_key({}, {}, {}, ChangedOperations)
+    ChangedOperations.list_merge_ops = dict(
+        ArxivOnArxivOperations.list_merge_ops,
+        titles='KEEP_ONLY_UPDATE_ENTITIES',
+    )
+    # The description of a configuration is cached like its merge plan.
+    with patch.dict('inspire_json_merger.cache._configuration_descriptions', clear=True), \
+            patch.dict('inspire_json_merger.config._MERGE_PLANS', clear=True):
+        second = merge_cache_key({}, {}, {}, ChangedOperations)
+
+    assert first != second
+
+
+def test_merge_cache_key_depends_on_budget():
+    without_budget = merge_cache_key({}, {}, {}, ArxivOnArxivOperations)
+    first = merge_cache_key({}, {}, {}, ArxivOnArxivOperations, MergeBudget(max_list_size=10))
+    second = merge_cache_key({}, {}, {}, ArxivOnArxivOperations, MergeBudget(max_list_size=20))
+    same = merge_cache_key({}, {}, {}, ArxivOnArxivOperations, MergeBudget(max_list_size=20))
+
+    assert len({without_budget, first, second}) == 3
+    assert second == same
+
+
+def test_merge_cache_forwards_budget():
+    cache = MergeCache()
+    root, head, update = _make_records()
+    budget = MergeBudget(max_author_pairs=100)
+
+    with patch('inspire_json_merger.cache.merge', return_value=({}, [])) as fake_merge:
+        cache.merge(root, head, update, budget=budget)
+        cache.merge(root, head, update)
+
+    assert fake_merge.call_args_list[0][0][5] is budget
+    assert fake_merge.call_args_list[1][0][5] is None
+    assert cache.misses == 2
+
+
+def test_merge_cache_returns_stored_result_without_merging():
+    cache = MergeCache()
+    root, head, update = _make_records()
+    expected = merge(root, head, update)
+
+    assert cache.merge(root, head, update) == expected
+    with patch('inspire_json_merger.cache.merge') as fake_merge:
+        assert cache.merge(root, head, update) == expected
+        fake_merge.assert_not_called()
+
+    assert cache.hits == 1
+    assert cache.misses == 1
+    assert cache.hit_rate == 0.5
+
+
+def test_lru_cache_backend_evicts_least_recently_used():
+    backend = LRUCacheBackend(max_size=10)
+    backend.set('a', '1234')
+    backend.set('b', '1234')
+    backend.get('a')
+    backend.set('c', '1234')
+
+    assert backend.get('a') == '1234'
+    assert backend.get('b') is None
+    assert backend.get('c') == '1234'
+    assert backend.size == 8
+
+
+def test_lru_cache_backend_skips_results_bigger_than_max_size():
+    backend = LRUCacheBackend(max_size=3)
+    backend.set('a', '1234')
+
+    assert len(backend) == 0
+
+
+def test_directory_cache_backend(tmpdir):
+    backend = DirectoryCacheBackend(str(tmpdir))
+
+    assert backend.get('abcdef') is None
+    backend.set('abcdef', '{"merged": {}}')
+    assert backend.get('abcdef') == '{"merged": {}}'
+    assert DirectoryCacheBackend(str(tmpdir)).get('abcdef') == '{"merged": {}}'
+
+
+def test_merge_cache_with_directory_backend(tmpdir):
+    root, head, update = _make_records()
+    expected = merge(root, head, update)
+
+    MergeCache(DirectoryCacheBackend(str(tmpdir))).merge(root, head, update)
+    cache = MergeCache(DirectoryCacheBackend(str(tmpdir)))
+
+    assert cache.merge(root, head, update) == expected
+    assert cache.hits == 1
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2014-2017 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+from __future__ import absolute_import, division, print_function
+
+import os
+
+import pytest
+from six import StringIO
+
+from inspire_json_merger.api import merge
+from inspire_json_merger.capture import (
+    PeakMemoryTracer,
+    SlowMergeCapture,
+    load_case,
+    main,
+    replay_case,
+)
+
+
+def get_records():
+    root = {
+        'acquisition_source': {'source': 'arXiv'},
+        'arxiv_eprints': [{'value': '1710.05832'}],
+        'titles': [{'title': 'Root'}],
+        'authors': [{'full_name': 'Smith, J.'}],
+    }
+    head = dict(root, titles=[{'title': 'Head'}])
+    update = dict(root, authors=[{'full_name': 'Smith, John'}, {'full_name': 'Doe, J.'}])
+    return root, head, update
+
+
+def test_slow_merge_capture_saves_slow_merges(tmpdir):
+    root, head, update = get_records()
+    capture = SlowMergeCapture(str(tmpdir), min_duration=0)
+
+    result = capture.merge(root, head, update, head_source='arxiv')
+
+    assert result == merge(root, head, update, head_source='arxiv')
+    [path] = capture.captured
+    assert os.listdir(str(tmpdir)) == [os.path.basename(path)]
+    case = load_case(path)
+    assert case['root'] == root
+    assert case['head'] == head
+    assert case['update'] == update
+    assert case['head_source'] == 'arxiv'
+    assert case['configuration'] == 'ArxivOnArxivOperations'
+    assert case['duration'] >= case['stages']['merger']
+    assert case['conflicts'] == [len(result[1]), len(result[1])]
+
+
+def test_slow_merge_capture_skips_fast_merges(tmpdir):
+    capture = SlowMergeCapture(str(tmpdir.join('captures')), min_duration=3600)
+
+    capture.merge(*get_records())
+
+    assert capture.captured == []
+    assert not tmpdir.join('captures').check()
+
+
+def test_slow_merge_capture_by_memory(tmpdir):
+    pytest.importorskip('tracemalloc')
+    capture = SlowMergeCapture(str(tmpdir), min_memory=0)
+
+    capture.merge(*get_records())
+
+    [path] = capture.captured
+    assert load_case(path)['peak_memory'] > 0
+
+
+def test_peak_memory_tracer_stops_tracing_it_started():
+    tracemalloc = pytest.importorskip('tracemalloc')
+
+    with PeakMemoryTracer() as tracer:
+        allocated = bytearray(2 ** 20)
+
+    assert tracer.peak_memory >= len(allocated)
+    assert not tracemalloc.is_tracing()
+
+
+def test_peak_memory_tracer_ignores_memory_traced_before():
+    tracemalloc = pytest.importorskip('tracemalloc')
+    if not hasattr(tracemalloc, 'reset_peak'):
+        pytest.skip('tracemalloc.reset_peak needs Python 3.9')
+
+    tracemalloc.start()
+    try:
+        kept = bytearray(8 * 2 ** 20)
+        freed = bytearray(8 * 2 ** 20)
+        del freed
+        with PeakMemoryTracer() as tracer:
+            allocated = bytearray(2 ** 20)
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+
+    assert len(allocated) <= tracer.peak_memory < len(kept)
+
+
+def test_replay_case_reports_hot_functions(tmpdir):
+    capture = SlowMergeCapture(str(tmpdir), min_duration=0)
+    capture.merge(*get_records())
+    stream = StringIO()
+
+    recording = replay_case(load_case(capture.captured[0]), limit=5, stream=stream)
+
+    report = stream.getvalue()
+    assert 'Configuration: ArxivOnArxivOperations' in report
+    assert 'merger' in report
+    assert 'function calls' in report
+    assert len(recording.durations) == 1
+
+
+def test_main_replays_directory(tmpdir, capsys):
+    capture = SlowMergeCapture(str(tmpdir), min_duration=0)
+    capture.merge(*get_records())
+    capture.merge(*get_records())
+
+    assert main([str(tmpdir), '--limit', '1']) == 0
+
+    out, _ = capsys.readouterr()
+    assert out.count('=== ') == 2
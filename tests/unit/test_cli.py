@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2014-2017 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+
+from __future__ import absolute_import, division, print_function
+
+import json
+
+from mock import patch
+
+from inspire_json_merger.api import merge, merge_many
+from inspire_json_merger.cli import main
+
+
+def _make_line(number):
+    record = {
+        'titles': [{'title': 'Superconductivity', 'source': 'arXiv'}],
+        'arxiv_eprints': [{'value': '1710.05832'}],
+        'acquisition_source': {'source': 'arXiv'},
+    }
+    update = dict(record, number_of_pages=number)
+    return {'root': {}, 'head': record, 'update': update, 'head_source': 'arxiv'}
+
+
+def _expected_output(line):
+    merged, conflicts = merge(line['root'], line['head'], line['update'], line['head_source'])
+    return {'merged': merged, 'conflicts': conflicts}
+
+
+def _read_output(capsys):
+    stdout = capsys.readouterr()[0]
+    return [json.loads(line) for line in stdout.splitlines()]
+
+
+def test_main_merges_every_line(tmpdir, capsys):
+    lines = [_make_line(number) for number in range(3)]
+    input_file = tmpdir.join('records.jsonl')
+    input_file.write('\n'.join(json.dumps(line) for line in lines))
+
+    exit_status = main([str(input_file)])
+
+    output = _read_output(capsys)
+    assert exit_status == 0
+    assert output == [_expected_output(line) for line in lines]
+
+
+def test_main_reports_invalid_lines_in_place(tmpdir, capsys):
+    input_file = tmpdir.join('records.jsonl')
+    input_file.write('\n'.join([
+        json.dumps(_make_line(0)),
+        '{"head": {}}',
+        'not json',
+        json.dumps(_make_line(3)),
+    ]))
+
+    exit_status = main([str(input_file), '--workers', '2'])
+
+    output = _read_output(capsys)
+    assert exit_status == 1
+    assert output[0] == _expected_output(_make_line(0))
+    assert output[1]['merged'] is None
+    assert 'update' in output[1]['error']
+    assert output[2]['merged'] is None
+    assert 'Invalid input line' in output[2]['error']
+    assert output[3] == _expected_output(_make_line(3))
+
+
+def test_main_does_not_merge_invalid_lines(tmpdir, capsys):
+    input_file = tmpdir.join('records.jsonl')
+    input_file.write('\n'.join([
+        'not json',
+        json.dumps(_make_line(1)),
+        '{"head": {}}',
+        '[]',
+    ]))
+    merged_triples = []
+
+    def recording_merge_many(triples, **kwargs):
+        for triple in triples:
+            merged_triples.append(triple)
+            for result in merge_many([triple], **kwargs):
+                yield result
+
+    with patch('inspire_json_merger.cli.merge_many', recording_merge_many):
+        exit_status = main([str(input_file)])
+
+    output = _read_output(capsys)
+    assert exit_status == 1
+    assert len(merged_triples) == 1
+    assert output[1] == _expected_output(_make_line(1))
+    for line in (output[0], output[2], output[3]):
+        assert line['merged'] is None
+        assert line['error'].startswith('Invalid input line')
@@ -22,11 +22,30 @@
 
 from __future__ import absolute_import, division, print_function
 
+import pytest
+
 from inspire_schemas.api import load_schema, validate
 
+from json_merger.comparator import BaseComparator
 from json_merger.config import UnifierOps
+from json_merger.contrib.inspirehep.author_util import (
+    AuthorNameDistanceCalculator,
+    AuthorNameNormalizer,
+)
 
-from inspire_json_merger.comparators import IDNormalizer
+from inspire_json_merger.comparators import (
+    AuthorComparator,
+    DocumentComparator,
+    IDNormalizer,
+    LastNameInitialBlocker,
+    MemoizedAuthorNameDistanceCalculator,
+    MemoizedAuthorNameNormalizer,
+    author_tokenize,
+    get_pk_comparator,
+    get_pk_comparator_ignore_if_both_empty,
+    memoized_author_tokenize,
+)
+from inspire_json_merger.utils import LRUCache
 from inspire_json_merger.api import merge
 from inspire_json_merger.config import ArxivOnArxivOperations
 
@@ -131,3 +150,141 @@ def test_comparing_publication_info():
     assert merged == expected_merged
     assert_ordered_conflicts(conflict, expected_conflict)
     validate_subschema(merged)
+
+
+def test_last_name_initial_blocker():
+    blocker = LastNameInitialBlocker(author_tokenize)
+
+    assert blocker({'full_name': 'Ortín, Tomás'}) == 'o'
+    assert blocker({'full_name': 'Ortin, T.'}) == 'o'
+    assert blocker({'full_name': 'John Smith'}) == 's'
+    assert blocker({}) is None
+
+
+def test_author_comparator_matches_big_lists_in_blocks():
+    head = [
+        {'full_name': 'Wang, Y.', 'ids': [{'schema': 'ORCID', 'value': str(i)}]}
+        for i in range(100)
+    ]
+    head.extend({'full_name': 'Author%d, Name' % i} for i in range(100))
+    head.append({'full_name': 'Ortín, Tomás'})
+    head.append({'full_name': 'Smith, John'})
+    update = [
+        {'full_name': 'Wang, Y.', 'ids': [{'schema': 'ORCID', 'value': str(i)}]}
+        for i in reversed(range(100))
+    ]
+    update.extend({'full_name': 'Author%d, N.' % i} for i in range(100))
+    update.append({'full_name': 'Smyth, John'})
+    update.append({'full_name': 'Ortin, Tomas'})
+
+    class BlockedAuthorComparator(AuthorComparator):
+        distance_function = AuthorComparator.distance_function
+        max_unblocked_pairs = 0
+
+    class UnblockedAuthorComparator(AuthorComparator):
+        distance_function = AuthorComparator.distance_function
+        max_unblocked_pairs = None
+
+    matches = BlockedAuthorComparator(head, update).matches
+
+    expected = set((i, 99 - i) for i in range(100))
+    expected.update((i, i) for i in range(100, 200))
+    expected.add((200, 201))
+    expected.add((201, 200))
+    assert matches == expected
+    assert matches == UnblockedAuthorComparator(head, update).matches
+
+
+def test_author_comparator_blocks_do_not_match_different_last_name_initials():
+    head = [{'full_name': 'Smith, John'}, {'full_name': 'Kirk, James'}]
+    update = [{'full_name': 'Xmith, John'}, {'full_name': 'Kirk, J.'}]
+
+    class BlockedAuthorComparator(AuthorComparator):
+        distance_function = AuthorComparator.distance_function
+        max_unblocked_pairs = 0
+
+    assert AuthorComparator(head, update).matches == {(0, 0), (1, 1)}
+    assert BlockedAuthorComparator(head, update).matches == {(1, 1)}
+
+
+def test_author_comparator_get_matches():
+    head = [{'full_name': 'Smith, John'}, {'full_name': 'Kirk, James'}, {'full_name': 'Smith, J.'}]
+    update = [{'full_name': 'Kirk, J.'}, {'full_name': 'Smith, J.'}]
+
+    comparator = AuthorComparator(head, update)
+
+    for idx in range(len(head)):
+        assert comparator.get_matches('l1', idx) == BaseComparator.get_matches(comparator, 'l1', idx)
+    for idx in range(len(update)):
+        assert comparator.get_matches('l2', idx) == BaseComparator.get_matches(comparator, 'l2', idx)
+    assert comparator.get_matches('l2', 0) == [(1, {'full_name': 'Kirk, James'})]
+
+
+def test_memoized_author_name_normalizer():
+    cache = LRUCache()
+    normalizer = MemoizedAuthorNameNormalizer(
+        author_tokenize, first_names_number=1, asciify=True, cache=cache
+    )
+    ascii_normalizer = AuthorNameNormalizer(author_tokenize, first_names_number=1, asciify=True)
+    author = {'full_name': 'Ortín, Tomás Ramón'}
+
+    assert normalizer(author) == ascii_normalizer(author)
+    assert normalizer(author) == ('ortin', 'tomas')
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert normalizer({}) == ascii_normalizer({})
+
+
+def test_memoized_author_name_distance_calculator():
+    cache = LRUCache()
+    calculator = MemoizedAuthorNameDistanceCalculator(author_tokenize, cache=cache)
+    plain_calculator = AuthorNameDistanceCalculator(author_tokenize)
+    smith = {'full_name': 'Smith, John'}
+    other_smith = {'full_name': 'Smith, John', 'affiliations': [{'value': 'CERN'}]}
+    initials = {'full_name': 'J. D.'}
+
+    assert calculator(smith, other_smith) == plain_calculator(smith, other_smith) == 0.0
+    assert calculator(smith, smith) == 0.0
+    assert calculator(initials, initials) == plain_calculator(initials, initials) == 1.0
+    assert calculator(smith, {'full_name': 'Smith, J.'}) == \
+        plain_calculator(smith, {'full_name': 'Smith, J.'})
+    assert calculator({}, {}) == 1.0
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_memoized_author_tokenize():
+    assert memoized_author_tokenize('Smith, J.') == author_tokenize('Smith, J.')
+    assert memoized_author_tokenize('Smith, J.') is memoized_author_tokenize('Smith, J.')
+
+
+def _pairwise_matches(comparator):
+    return set(
+        (l1_idx, l2_idx)
+        for l1_idx, obj1 in enumerate(comparator.l1)
+        for l2_idx, obj2 in enumerate(comparator.l2)
+        if comparator.equal(obj1, obj2)
+    )
+
+
+@pytest.mark.parametrize('comparator_class', [
+    get_pk_comparator([['value', 'source']], {'value': lambda value: value.lower()}),
+    get_pk_comparator_ignore_if_both_empty([['value', 'source']], {'value': lambda value: value.lower()}),
+], ids=['pk', 'pk_ignore_if_both_empty'])
+def test_pk_comparator_matches_same_as_pairwise(comparator_class):
+    l1 = [{'value': 'A', 'source': 's'}, {'value': 'a'}, {}, {'source': 's'}, {'value': 'b', 'source': 's'}]
+    l2 = [{'value': 'a', 'source': 's'}, {'value': 'A', 'source': ''}, {}, {'value': 'a'}, {'value': 'c'}]
+
+    comparator = comparator_class(l1, l2)
+
+    assert comparator.matches == _pairwise_matches(comparator)
+    for idx in range(len(l1)):
+        assert comparator.get_matches('l1', idx) == BaseComparator.get_matches(comparator, 'l1', idx)
+
+
+def test_pk_comparator_compares_unhashable_keys_pairwise():
+    l1 = [{'source': {'name': 'arXiv'}, 'description': 'Article'}, {'source': 'arXiv', 'description': 'Fulltext'}]
+    l2 = [{'source': 'arXiv', 'description': 'Fulltext'}, {'source': {'name': 'arXiv'}, 'description': 'Article'}]
+
+    comparator = DocumentComparator(l1, l2)
+
+    assert comparator.matches == {(0, 1), (1, 0)}
+    assert comparator.matches == _pairwise_matches(comparator)
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2014-2017 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+from __future__ import absolute_import, division, print_function
+
+import pytest
+
+from inspire_json_merger.comparators import AuthorComparator, author_tokenize
+
+numpy = pytest.importorskip('numpy')
+
+from inspire_json_merger.distance_matrix import AuthorNameDistanceMatrix  # noqa: E402
+
+AUTHORS = [
+    {'full_name': 'Smith, John'},
+    {'full_name': 'Smith, J.'},
+    {'full_name': 'Smyth, John'},
+    {'full_name': 'John Smith'},
+    {'full_name': 'Ortín, Tomás'},
+    {'full_name': 'Ortin, T.'},
+    {'full_name': "O'Neil-Smith, J.-P."},
+    {'full_name': 'Smith Jr., John Karl Heinz'},
+    {'full_name': 'J., K.'},
+    {'full_name': ''},
+    {},
+]
+
+
+def test_author_name_distance_matrix_gives_same_distances_as_calculator():
+    distance_function = AuthorComparator.distance_function
+    expected = [
+        [distance_function(author1, author2) for author2 in AUTHORS]
+        for author1 in AUTHORS
+    ]
+
+    result = AuthorNameDistanceMatrix(author_tokenize)(AUTHORS, AUTHORS)
+
+    assert numpy.allclose(result, expected)
+
+
+def test_author_name_distance_matrix_falls_back_to_calculator_for_long_names():
+    authors = [{'full_name': 'Smith Jr., John Karl Heinz'}, {'full_name': 'Smith, J.'}]
+    distance_function = AuthorComparator.distance_function
+    expected = [
+        [distance_function(author1, author2) for author2 in authors]
+        for author1 in authors
+    ]
+
+    result = AuthorNameDistanceMatrix(author_tokenize, max_assignments=2)(authors, authors)
+
+    assert numpy.allclose(result, expected)
+
+
+def test_author_comparator_matches_with_distance_matrix():
+    head = [{'full_name': 'Author%d, Name' % i} for i in range(20)]
+    update = [{'full_name': 'Autor%d, N.' % i} for i in reversed(range(20))]
+
+    class MatrixAuthorComparator(AuthorComparator):
+        distance_function = AuthorComparator.distance_function
+        distance_matrix_function = AuthorNameDistanceMatrix(author_tokenize)
+        min_matrix_pairs = 0
+
+    class PairwiseAuthorComparator(AuthorComparator):
+        distance_function = AuthorComparator.distance_function
+        distance_matrix_function = None
+
+    matches = MatrixAuthorComparator(head, update).matches
+
+    assert matches == set((i, 19 - i) for i in range(20))
+    assert matches == PairwiseAuthorComparator(head, update).matches
@@ -25,7 +25,8 @@ from __future__ import absolute_import, division, print_function
 from json_merger.conflict import Conflict
 
 from inspire_json_merger.utils import filter_conflicts, \
-    filter_conflicts_by_path, is_to_delete, conflict_to_list
+    filter_conflicts_by_path, filter_conflicts_by_paths, is_to_delete, \
+    conflict_to_list, compile_conflict_filters, ConflictFilterTrie
 
 
 def test_conflict_to_list():
@@ -141,3 +142,41 @@ def test_filter_conflicts():
         'report_numbers'
     ]
     assert len(filter_conflicts(conflicts, fields)) == 4
+
+
+def test_compile_conflict_filters():
+    trie = compile_conflict_filters(['figures', 'authors.full_name'])
+
+    assert trie.paths == (
+        ('figures',),
+        ('authors', 'full_name'),
+    )
+    assert trie.matches(('figures', 0, 'key'))
+    assert trie.matches(('authors', 1, 'full_name'))
+    assert not trie.matches(('authors', 1, 'emails'))
+    assert not trie.matches(('authors',))
+
+
+def test_conflict_filter_trie_keeps_shortest_prefix():
+    trie = ConflictFilterTrie([('authors', 'affiliations', 'value'), ('authors', 'affiliations')])
+
+    assert trie.matches(('authors', 0, 'affiliations', 1, 'record'))
+    assert not trie.matches(('authors', 0, 'full_name'))
+    assert not compile_conflict_filters([])
+
+
+def test_filter_conflicts_by_paths():
+    conflicts = [
+        Conflict('SET_FIELD', ('figures', 0, 'key'), 'figure1.png'),
+        Conflict('SET_FIELD', ('authors', 0, 'full_name'), 'Smith, J.'),
+        Conflict('SET_FIELD', ('authors', 0, 'emails'), 'smith@cern.ch'),
+        Conflict('MANUAL_MERGE', ('figures',), ('a', 'b', 'c')),
+    ]
+    paths = compile_conflict_filters(['figures', 'authors.full_name'])
+
+    expected = [
+        Conflict('SET_FIELD', ('authors', 0, 'emails'), 'smith@cern.ch'),
+        Conflict('MANUAL_MERGE', ('figures',), ('a', 'b', 'c')),
+    ]
+
+    assert filter_conflicts_by_paths(conflicts, paths) == expected
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2014-2017 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+from __future__ import absolute_import, division, print_function
+
+from mock import patch
+
+from inspire_json_merger.api import merge, merge_many
+from inspire_json_merger.config import PublisherOnArxivOperations
+from inspire_json_merger.instrumentation import (
+    STAGES,
+    MergeInstrumentation,
+    RecordingInstrumentation,
+    StageTimer,
+    get_pre_filter_name,
+    get_record_sizes,
+)
+from inspire_json_merger.pre_filters import (
+    filter_curated_references,
+    filter_documents_same_source,
+)
+
+
+def get_records():
+    root = {
+        'acquisition_source': {'source': 'arXiv'},
+        'arxiv_eprints': [{'value': '1710.05832'}],
+        'titles': [{'title': 'Root'}],
+        'authors': [{'full_name': 'Smith, J.'}],
+    }
+    head = dict(root, titles=[{'title': 'Head'}])
+    update = {
+        'acquisition_source': {'source': 'ejl'},
+        'dois': [{'value': '10.1023/A:1026654312961'}],
+        'titles': [{'title': 'Update'}],
+        'authors': [{'full_name': 'Smith, John'}, {'full_name': 'Doe, J.'}],
+    }
+    return root, head, update
+
+
+def test_merge_reports_measurements():
+    root, head, update = get_records()
+    instrumentation = RecordingInstrumentation()
+
+    merge(root, head, update, instrumentation=instrumentation)
+
+    assert instrumentation.configurations == [PublisherOnArxivOperations]
+    assert instrumentation.sizes == [get_record_sizes(root, head, update)]
+    assert sorted(instrumentation.stages) == sorted(STAGES)
+    fields = set(root) | set(head) | set(update)
+    assert sorted(instrumentation.pre_filters) == sorted(
+        get_pre_filter_name(pre_filter) for pre_filter in PublisherOnArxivOperations.pre_filters
+        if pre_filter.fields & fields
+    )
+    [(unfiltered, filtered)] = instrumentation.conflicts
+    assert unfiltered >= filtered
+    [duration] = instrumentation.durations
+    assert duration >= sum(instrumentation.stages.values())
+
+
+def test_merge_many_reports_measurements_of_every_merge():
+    instrumentation = RecordingInstrumentation()
+
+    list(merge_many([get_records(), get_records()], instrumentation=instrumentation))
+
+    assert len(instrumentation.durations) == 2
+    assert instrumentation.configurations == [PublisherOnArxivOperations] * 2
+
+
+def test_merge_without_instrumentation_does_not_measure():
+    with patch.object(MergeInstrumentation, 'on_stage') as mock_on_stage, \
+            patch('inspire_json_merger.instrumentation.time') as mock_time:
+        merge(*get_records())
+
+    mock_on_stage.assert_not_called()
+    mock_time.time.assert_not_called()
+
+
+def test_stage_timer_reports_elapsed_time_per_stage():
+    instrumentation = RecordingInstrumentation()
+
+    with patch('inspire_json_merger.instrumentation.time') as mock_time:
+        mock_time.time.side_effect = [10.0, 11.0, 11.5, 12.0]
+        timer = StageTimer(instrumentation)
+        timer.stage('get_configuration')
+        timer.stage('pre_filters')
+        timer.finish()
+
+    assert instrumentation.stages == {'get_configuration': 1.0, 'pre_filters': 0.5}
+    assert instrumentation.durations == [2.0]
+
+
+def test_get_record_sizes():
+    root, head, update = get_records()
+
+    assert get_record_sizes(root, head, update)['update'] == {
+        'fields': 4,
+        'dois': 1,
+        'titles': 1,
+        'authors': 2,
+    }
+
+
+def test_get_pre_filter_name():
+    assert get_pre_filter_name(filter_curated_references) == 'filter_curated_references'
+    assert get_pre_filter_name(filter_documents_same_source) == \
+        "keep_only_update_source_in_field('documents')"
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2014-2017 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+
+from __future__ import absolute_import, division, print_function
+
+import os
+import time
+
+from inspire_json_merger.api import merge
+from inspire_json_merger.parallel import BrokenProcessPool, merge_parallel
+
+
+class _KillWorker(object):
+    """Kills the worker process unpickling it."""
+
+    def __reduce__(self):
+        return os._exit, (1,)
+
+
+class _HangWorker(object):
+    """Keeps busy for a minute the worker process unpickling it."""
+
+    def __reduce__(self):
+        return time.sleep, (60,)
+
+
+def _make_triple(number):
+    record = {
+        'titles': [{'title': 'Superconductivity %d' % number, 'source': 'arXiv'}],
+        'arxiv_eprints': [{'value': '1710.%05d' % number}],
+        'acquisition_source': {'source': 'arXiv'},
+    }
+    update = dict(record, number_of_pages=number)
+    return {}, record, update
+
+
+def test_merge_parallel_preserves_input_order():
+    triples = [_make_triple(number) for number in range(10)]
+
+    expected = [merge(*triple) for triple in triples]
+    result = list(merge_parallel(triples, processes=2, max_in_flight=3))
+
+    assert result == expected
+
+
+def test_merge_parallel_isolates_failures():
+    errors = []
+
+    def on_error(index, triple, exception):
+        errors.append((index, type(exception)))
+
+    triples = [_make_triple(0), ({}, {}), _make_triple(2)]
+
+    result = list(merge_parallel(triples, processes=2, on_error=on_error))
+
+    assert result[0] == merge(*triples[0])
+    assert result[1] == (None, None)
+    assert result[2] == merge(*triples[2])
+    assert errors == [(1, TypeError)]
+
+
+def test_merge_parallel_consumes_input_lazily():
+    consumed = []
+
+    def triples():
+        for number in range(100):
+            consumed.append(number)
+            yield _make_triple(number)
+
+    results = merge_parallel(triples(), processes=2, max_in_flight=4)
+    next(results)
+    results.close()
+
+    assert len(consumed) == 4
+
+
+def test_merge_parallel_reports_records_killing_their_worker():
+    errors = []
+
+    def on_error(index, triple, exception):
+        errors.append((index, type(exception)))
+
+    triples = [_make_triple(0), (_KillWorker(),), _make_triple(2)]
+
+    result = list(merge_parallel(triples, processes=1, max_in_flight=1, on_error=on_error))
+
+    assert result[0] == merge(*triples[0])
+    assert result[1] == (None, None)
+    assert result[2] == merge(*triples[2])
+    assert errors == [(1, BrokenProcessPool)]
+
+
+def test_merge_parallel_merges_again_records_on_broken_pool():
+    errors = []
+
+    def on_error(index, triple, exception):
+        errors.append((index, type(exception)))
+
+    triples = [_make_triple(number) for number in range(9)]
+    triples[3] = (_KillWorker(),)
+
+    result = list(merge_parallel(triples, processes=2, max_in_flight=8, on_error=on_error))
+
+    assert result[3] == (None, None)
+    for number in (0, 1, 2, 4, 5, 6, 7, 8):
+        assert result[number] == merge(*triples[number])
+    assert errors == [(3, BrokenProcessPool)]
+
+
+def test_merge_parallel_replaces_workers_of_timed_out_records():
+    errors = []
+
+    def on_error(index, triple, exception):
+        errors.append(index)
+
+    triples = [(_HangWorker(),), _make_triple(1), _make_triple(2)]
+
+    start = time.time()
+    result = list(merge_parallel(triples, processes=1, timeout=1, on_error=on_error))
+
+    assert time.time() - start < 30
+    assert result[0] == (None, None)
+    assert result[1] == merge(*triples[1])
+    assert result[2] == merge(*triples[2])
+    assert errors == [0]
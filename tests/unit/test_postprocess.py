@@ -21,7 +21,24 @@
 # or submit itself to any jurisdiction.
 from __future__ import absolute_import, division, print_function
 
-from inspire_json_merger.postprocess import _insert_to_list, _additem, _process_author_manual_merge_conflict
+import json
+
+from json_merger.config import DictMergerOps, UnifierOps
+from json_merger.conflict import Conflict
+from json_merger.merger import Merger
+
+from inspire_json_merger.postprocess import (
+    _additem,
+    _insert_to_list,
+    _OrderIndex,
+    _process_author_manual_merge_conflict,
+    _shift_positions,
+    add_ordering_to_authors_head,
+    conflict_to_json,
+    postprocess_conflicts,
+    remove_ordering_from_authors_merged,
+    remove_ordering_from_conflicts,
+)
 from inspire_json_merger.utils import ORDER_KEY
 
 
@@ -312,3 +329,125 @@ def test_process_author_manual_merge_conflict_when_head_in_conflict_is_none():
     output = _process_author_manual_merge_conflict(conflict, merged)
 
     assert output == expected_output
+
+
+def test_order_index_finds_same_position_as_insert_to_list():
+    objects_list = [
+        {"full_name": "First", ORDER_KEY: 3},
+        {"full_name": "Second"},
+        {"full_name": "Third", ORDER_KEY: 1},
+        {"full_name": "Fourth", ORDER_KEY: 5},
+        {"full_name": "Fifth"},
+    ]
+    index = _OrderIndex(element.get(ORDER_KEY) for element in objects_list)
+
+    for position in range(7):
+        expected_position, _ = _insert_to_list(
+            {ORDER_KEY: position}, list(objects_list)
+        )
+        found_position = index.find(position)
+        if found_position is None:
+            found_position = len(objects_list)
+        assert found_position == expected_position
+
+
+def test_shift_positions_as_successive_insertions():
+    positions = [0, 2, 2, 5, 1]
+    steps = [0, 0, 1, 2, 3]
+    insertions = [2, 0, 4]
+
+    expected = []
+    for position, step in zip(positions, steps):
+        for insertion in insertions[step:]:
+            if position >= insertion:
+                position += 1
+        expected.append(position)
+
+    assert _shift_positions(positions, steps, insertions) == expected
+
+
+def test_postprocess_conflicts_shifts_author_conflicts_after_insertions():
+    merged = {
+        "authors": [
+            {"full_name": "First", ORDER_KEY: 0},
+            {"full_name": "Second", ORDER_KEY: 1},
+            {"full_name": "Third", ORDER_KEY: 2},
+        ]
+    }
+    conflicts = [
+        Conflict("SET_FIELD", ("authors", 2, "full_name"), "Third, T."),
+        Conflict(
+            "MANUAL_MERGE",
+            ("authors",),
+            (None, {"full_name": "Head", ORDER_KEY: 0}, {"full_name": "Update"}),
+        ),
+        Conflict("ADD_BACK_TO_HEAD", ("authors",), {"full_name": "Back", ORDER_KEY: 1}),
+    ]
+
+    expected_conflicts = [
+        Conflict("SET_FIELD", ("authors", 4, "full_name"), "Third, T."),
+        Conflict("SET_FIELD", ("authors", 1), {"full_name": "Update"}),
+        Conflict("REMOVE_FIELD", ("authors", 3), None),
+    ]
+    expected_authors = [
+        {"full_name": "First", ORDER_KEY: 0},
+        {"full_name": "Head", ORDER_KEY: 0},
+        {"full_name": "Second", ORDER_KEY: 1},
+        {"full_name": "Back", ORDER_KEY: 1},
+        {"full_name": "Third", ORDER_KEY: 2},
+    ]
+    result_conflicts, result_merged = postprocess_conflicts(conflicts, merged)
+
+    assert result_conflicts == expected_conflicts
+    assert result_merged["authors"] == expected_authors
+
+
+def test_add_ordering_to_authors_head_stamps_copies_of_head_authors():
+    doe = {"full_name": "Doe, J."}
+    head = {"authors": [doe, {"full_name": "Doe, J."}, {"full_name": "Smith, J."}]}
+    merger = Merger(
+        {}, head, {},
+        DictMergerOps.FALLBACK_KEEP_HEAD,
+        UnifierOps.KEEP_UPDATE_AND_HEAD_ENTITIES_HEAD_FIRST,
+    )
+
+    add_ordering_to_authors_head(merger)
+
+    assert merger.head["authors"] == [
+        {"full_name": "Doe, J.", ORDER_KEY: 0},
+        {"full_name": "Doe, J.", ORDER_KEY: 1},
+        {"full_name": "Smith, J.", ORDER_KEY: 2},
+    ]
+    assert head == {
+        "authors": [doe, {"full_name": "Doe, J."}, {"full_name": "Smith, J."}]
+    }
+    assert doe == {"full_name": "Doe, J."}
+
+
+def test_remove_ordering_from_authors_merged_keeps_the_authors():
+    first = {"full_name": "Doe, J.", ORDER_KEY: 0}
+    second = {"full_name": "Smith, J."}
+    merged = {"authors": [first, second]}
+
+    result = remove_ordering_from_authors_merged(merged)
+
+    assert result["authors"] == [{"full_name": "Doe, J."}, {"full_name": "Smith, J."}]
+    assert result["authors"][0] is first
+    assert result["authors"][1] is second
+
+
+def test_conflict_to_json_same_as_json_roundtrip():
+    conflicts = [
+        Conflict(
+            "MANUAL_MERGE",
+            ("authors",),
+            (None, {"full_name": "Head", ORDER_KEY: 0}, {"full_name": "Update", "ids": ({"value": 1},)}),
+        ),
+        Conflict("SET_FIELD", ("authors", 1), {"full_name": "Update", ORDER_KEY: 1}),
+        Conflict("REMOVE_FIELD", ("authors", 3), None),
+        Conflict("INSERT", ("titles", 0), {"title": "Title", "keys": {1: [ORDER_KEY]}}),
+    ]
+
+    for conflict in conflicts:
+        expected = remove_ordering_from_conflicts(json.loads(conflict.to_json()))
+        assert conflict_to_json(conflict) == expected
@@ -22,10 +22,18 @@
 
 from __future__ import absolute_import, division, print_function
 
-from inspire_json_merger.utils import filter_records
+import pytest
+from inspire_utils.record import get_value
+from pyrsistent import freeze
+
+from inspire_json_merger.config import ArxivOnArxivOperations
+from inspire_json_merger.utils import CopyOnWriteRecord, compile_pre_filters, filter_records
 from inspire_json_merger.pre_filters import (filter_documents_same_source,
                                              filter_curated_references,
-                                             filter_publisher_references, filter_figures_same_source)
+                                             get_reference_fingerprint,
+                                             filter_publisher_references, filter_figures_same_source,
+                                             operates_on, peek_value, remove_duplicated_titles)
+from tests.benchmarks.generators import CONFIGURATION_PATHS, generate_triple
 
 
 def test_filter_documents_same_source():
@@ -552,3 +560,262 @@ def test_filter_missing_figures_on_update_are_properly_handled():
     assert new_root == expected_root
     assert new_head == expected_head
     assert new_update == expected_update
+
+
+def test_filter_records_passes_through_fields_not_used_by_filters():
+    root = {'abstracts': [{'value': 'root'}]}
+    head = {'abstracts': [{'value': 'head'}], 'references': [{'reference': {'title': {'title': 'Foo'}}}]}
+    update = {'abstracts': [{'value': 'update'}]}
+
+    result = filter_records(root, head, update, filters=[filter_publisher_references])
+
+    assert result == (root, head, update)
+    assert result[0]['abstracts'] is root['abstracts']
+    assert result[1]['abstracts'] is head['abstracts']
+    assert result[1]['references'] is head['references']
+    assert result[2]['abstracts'] is update['abstracts']
+
+
+def test_filter_records_passes_only_declared_fields_to_filters():
+    received = []
+
+    @operates_on('titles')
+    def fake_filter(root, head, update):
+        received.append(set(head))
+        return root, head.remove('titles'), update
+
+    head = {'titles': [{'title': 'Foo'}], 'abstracts': [{'value': 'Bar'}]}
+
+    result = filter_records({}, head, {}, filters=[fake_filter])
+
+    assert received == [{'titles'}]
+    assert result == ({}, {'abstracts': [{'value': 'Bar'}]}, {})
+
+
+def test_filter_records_exposes_whole_records_to_undeclared_filters():
+    received = []
+
+    def fake_filter(root, head, update):
+        received.append(set(head))
+        return root, head, update
+
+    head = {'titles': [{'title': 'Foo'}], 'abstracts': [{'value': 'Bar'}]}
+
+    result = filter_records({}, head, {}, filters=[filter_publisher_references, fake_filter])
+
+    assert received == [{'titles', 'abstracts'}]
+    assert result == ({}, head, {})
+    assert result[1]['abstracts'] is head['abstracts']
+
+
+def test_filter_records_copies_only_changed_fields():
+    root = {'documents': [{'source': 'arXiv', 'key': 'old.pdf'}], 'titles': [{'title': 'Foo'}]}
+    head = {'documents': [{'source': 'arXiv', 'key': 'old.pdf'}], 'titles': [{'title': 'Foo'}]}
+    update = {'documents': [{'source': 'arXiv', 'key': 'new.pdf'}], 'titles': [{'title': 'Foo'}]}
+
+    result = filter_records(root, head, update, filters=[filter_documents_same_source])
+
+    expected_root = {'documents': [], 'titles': [{'title': 'Foo'}]}
+    expected_head = {'documents': [], 'titles': [{'title': 'Foo'}]}
+
+    assert result == (expected_root, expected_head, update)
+    assert result[1]['titles'] is head['titles']
+    assert result[2]['documents'] is update['documents']
+    assert head['documents'] == [{'source': 'arXiv', 'key': 'old.pdf'}]
+
+
+def test_get_reference_fingerprint_ignores_fields_not_curated():
+    ref = {'reference': {'arxiv_eprint': '1810.12345'}}
+    same_ref = {
+        'record': {'$ref': 'http://localhost:5000/api/literature/1'},
+        'curated_relation': False,
+        'raw_refs': [{'schema': 'text', 'value': 'foo 1810.12345'}],
+        'reference': {'arxiv_eprint': '1810.12345', 'misc': ['foo'], 'authors': [{'full_name': 'Smith, J.'}]},
+    }
+    curated_ref = {'reference': {'arxiv_eprint': '1810.12345'}, 'curated_relation': True}
+
+    assert get_reference_fingerprint(ref) == get_reference_fingerprint(same_ref)
+    assert get_reference_fingerprint(ref) == get_reference_fingerprint(freeze(same_ref))
+    assert get_reference_fingerprint(ref) != get_reference_fingerprint(curated_ref)
+    assert get_reference_fingerprint({}) == get_reference_fingerprint({'reference': {}})
+
+
+def test_compile_pre_filters_groups_filters_by_fields():
+    pipeline = compile_pre_filters(ArxivOnArxivOperations.pre_filters)
+
+    assert sorted(pipeline.groups, key=lambda group: sorted(group[0])) == [
+        (frozenset(['acquisition_source', 'documents', 'figures']),
+         (filter_documents_same_source, filter_figures_same_source)),
+        (frozenset(['references']), (filter_curated_references,)),
+        (frozenset(['titles']), (remove_duplicated_titles,)),
+    ]
+
+
+def test_compile_pre_filters_does_not_group_undeclared_filters():
+    def fake_filter(root, head, update):
+        return root, head, update
+
+    pipeline = compile_pre_filters([filter_publisher_references, fake_filter])
+
+    assert pipeline.fields is None
+    assert pipeline.groups is None
+
+
+def test_filter_records_skips_filters_of_missing_fields():
+    received = []
+
+    @operates_on('titles')
+    def titles_filter(root, head, update):
+        received.append('titles')
+        return root, head, update
+
+    @operates_on('abstracts')
+    def abstracts_filter(root, head, update):
+        received.append(set(head))
+        return root, head.remove('abstracts'), update
+
+    head = {'abstracts': [{'value': 'Bar'}], 'dois': [{'value': '10.1234/foo'}]}
+
+    result = filter_records({}, head, {}, filters=[titles_filter, abstracts_filter])
+
+    assert received == [{'abstracts'}]
+    assert result == ({}, {'dois': [{'value': '10.1234/foo'}]}, {})
+    assert result[1]['dois'] is head['dois']
+
+
+@pytest.mark.parametrize('path', sorted(CONFIGURATION_PATHS))
+def test_filter_records_gives_same_result_as_filters_in_turn(path):
+    def undeclared_filter(root, head, update):
+        return root, head, update
+
+    root, head, update = generate_triple(path, authors=20, references=10, figures=5, documents=5)
+    filters = CONFIGURATION_PATHS[path][2].pre_filters
+
+    expected = filter_records(root, head, update, filters=list(filters) + [undeclared_filter])
+
+    assert filter_records(root, head, update, filters=filters) == expected
+
+
+@pytest.mark.parametrize('path', [
+    'documents.source',
+    'documents.key',
+    'documents.missing',
+    'documents',
+    'acquisition_source.source',
+    'acquisition_source.missing',
+    'titles.title',
+    'missing.source',
+])
+def test_peek_value_gives_same_value_as_get_value(path):
+    record = {
+        'acquisition_source': {'source': 'arXiv'},
+        'documents': [{'source': 'arXiv', 'key': 'file1.pdf'}, {'key': 'file2.pdf'}],
+        'titles': 'not a list',
+    }
+    expected = get_value(record, path, 'default')
+
+    assert peek_value(record, path, 'default') == expected
+    assert peek_value(freeze(record), path, 'default') == expected
+    assert peek_value(CopyOnWriteRecord(record), path, 'default') == expected
+
+
+def test_filter_documents_same_source_does_not_copy_unchanged_fields():
+    root = {'documents': [{'source': 'publisher', 'key': 'file1.pdf'}]}
+    head = {'documents': [{'source': 'publisher', 'key': 'file1.pdf'}, {'source': 'arXiv', 'key': 'file2.pdf'}]}
+    update = {'documents': [{'source': 'arXiv', 'key': 'file3.pdf'}]}
+
+    result = filter_records(root, head, update, filters=[filter_documents_same_source])
+
+    assert result == (root, {'documents': [{'source': 'publisher', 'key': 'file1.pdf'}]}, update)
+    assert result[0]['documents'] is root['documents']
+    assert result[2]['documents'] is update['documents']
+
+
+def test_remove_duplicated_titles_prefers_titles_not_from_arxiv(capsys):
+    head = {
+        'titles': [
+            {'title': 'Foo', 'source': 'arXiv'},
+            {'title': 'Bar', 'source': 'arXiv'},
+            {'title': 'Foo', 'source': 'publisher'},
+            {'title': 'Bar', 'source': 'arXiv'},
+            {'title': 'Foo', 'subtitle': 'Baz', 'source': 'arXiv'},
+        ],
+    }
+    expected_head = {
+        'titles': [
+            {'title': 'Foo', 'source': 'publisher'},
+            {'title': 'Bar', 'source': 'arXiv'},
+            {'title': 'Foo', 'subtitle': 'Baz', 'source': 'arXiv'},
+        ],
+    }
+
+    result = filter_records({}, head, {}, filters=[remove_duplicated_titles])
+
+    assert result == ({}, expected_head, {})
+    assert capsys.readouterr() == ('', '')
+
+
+def test_remove_duplicated_titles_keeps_records_without_duplicates():
+    root = {'titles': [{'title': 'Foo', 'source': 'arXiv'}]}
+    head = {'titles': [{'title': 'Foo', 'source': 'arXiv'}, {'title': 'Foo', 'source': 'arXiv'}]}
+    update = {'titles': [{'title': 'Foo', 'source': 'arXiv'}, {'title': 'Bar', 'source': 'arXiv'}]}
+
+    result = filter_records(root, head, update, filters=[remove_duplicated_titles])
+
+    assert result == (root, {'titles': [{'title': 'Foo', 'source': 'arXiv'}]}, update)
+    assert result[0]['titles'] is root['titles']
+    assert result[2]['titles'] is update['titles']
+
+
+def _remove_duplicated_titles_by_value(titles):
+    """The removal of the duplicated titles as done before the single pass."""
+    titles = freeze(titles)
+    titles_dict = dict()
+    to_delete = []
+    for title in titles:
+        title_data = (title['title'], title.get('subtitle'))
+        if title_data not in titles_dict:
+            titles_dict[title_data] = title
+        elif title['source'].lower() != 'arxiv':
+            to_delete.append(titles_dict[title_data])
+            titles_dict[title_data] = title
+        else:
+            to_delete.append(title)
+    for object_to_remove in to_delete:
+        titles = titles.remove(object_to_remove)
+    return titles
+
+
+@pytest.mark.parametrize('titles', [
+    [
+        {'title': 'Foo', 'source': 'arXiv'},
+        {'title': 'Foo', 'source': 'publisher'},
+    ],
+    [
+        {'title': 'Foo', 'source': 'publisher'},
+        {'title': 'Foo', 'source': 'arXiv'},
+    ],
+    [
+        {'title': 'Foo', 'source': 'arXiv'},
+        {'title': 'Bar', 'source': 'arXiv'},
+        {'title': 'Foo', 'source': 'publisher'},
+        {'title': 'Foo', 'source': 'arXiv'},
+    ],
+    [
+        {'title': 'Foo', 'source': 'publisher'},
+        {'title': 'Bar', 'source': 'arXiv'},
+        {'title': 'Foo', 'source': 'arXiv'},
+        {'title': 'Foo', 'source': 'publisher'},
+    ],
+    [
+        {'title': 'Foo', 'source': 'arXiv'},
+        {'title': 'Bar', 'source': 'arXiv'},
+        {'title': 'Foo', 'source': 'arXiv'},
+    ],
+])
+def test_remove_duplicated_titles_same_as_removing_them_by_value(titles):
+    expected_head = {'titles': _remove_duplicated_titles_by_value(titles)}
+
+    result = filter_records({}, {'titles': titles}, {}, filters=[remove_duplicated_titles])
+
+    assert result == ({}, expected_head, {})
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2014-2017 CERN.
+#
+# INSPIRE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE. If not, see <http://www.gnu.org/licenses/>.
+#
+# In applying this license, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+
+from __future__ import absolute_import, division, print_function
+
+from pyrsistent import pvector
+
+from inspire_json_merger.comparators import AuthorComparator, ValueComparator
+from inspire_json_merger.utils import (
+    CopyOnWriteRecord,
+    LRUCache,
+    copy_shared_values,
+    split_unchanged_fields,
+)
+
+
+def test_split_unchanged_fields_resolves_fields_equal_everywhere():
+    root = {'authors': [{'full_name': 'Smith, J.'}], 'titles': [{'title': 'Foo'}]}
+    head = {'authors': [{'full_name': 'Smith, J.'}], 'titles': [{'title': 'Foo'}]}
+    update = {'authors': [{'full_name': 'Smith, J.'}], 'titles': [{'title': 'Bar'}]}
+
+    resolved, root, head, update = split_unchanged_fields(root, head, update)
+
+    assert resolved == {'authors': [{'full_name': 'Smith, J.'}]}
+    assert root == {'titles': [{'title': 'Foo'}]}
+    assert head == {'titles': [{'title': 'Foo'}]}
+    assert update == {'titles': [{'title': 'Bar'}]}
+
+
+def test_split_unchanged_fields_keeps_lists_with_matching_entries():
+    record = {
+        'keywords': [{'value': 'foo'}, {'value': 'foo', 'schema': 'INSPIRE'}],
+        'authors': [{'full_name': 'Smith, J.'}, {'full_name': 'Smith, J.'}],
+        'titles': [{'title': 'Foo'}, {'title': 'Foo'}],
+    }
+    comparators = {'keywords': ValueComparator, 'authors': AuthorComparator}
+
+    resolved, root, head, update = split_unchanged_fields(record, record, record, comparators=comparators)
+
+    assert resolved == {'authors': record['authors']}
+    assert sorted(root) == sorted(head) == sorted(update) == ['keywords', 'titles']
+
+
+def test_split_unchanged_fields_keeps_authors_which_can_match_each_other():
+    record = {
+        'authors': [
+            {'full_name': 'Smith, J.', 'affiliations': [{'value': 'DESY'}]},
+            {'full_name': 'Smith, J.', 'affiliations': [{'value': 'CERN'}]},
+        ],
+    }
+    comparators = {'authors': AuthorComparator}
+
+    resolved, root, head, update = split_unchanged_fields(record, record, record, comparators=comparators)
+
+    assert resolved == {}
+    assert root == head == update == record
+
+
+def test_split_unchanged_fields_resolves_authors_told_apart_by_their_names():
+    record = {
+        'authors': [
+            {'full_name': 'Smith, J.', 'ids': [{'schema': 'INSPIRE BAI', 'value': 'J.Smith.1'}]},
+            {'full_name': 'Doe, J.', 'ids': [{'schema': 'INSPIRE BAI', 'value': 'J.Smith.1'}]},
+        ],
+    }
+    comparators = {'authors': AuthorComparator}
+
+    resolved, root, head, update = split_unchanged_fields(record, record, record, comparators=comparators)
+
+    assert resolved == record
+    assert root == head == update == {}
+
+
+def test_split_unchanged_fields_keeps_ordered_fields_changed_on_one_side():
+    root = {'authors': [{'full_name': 'Smith, J.'}], 'titles': [{'title': 'Foo'}]}
+    head = {'authors': [{'full_name': 'Smith, J.'}], 'titles': [{'title': 'Foo'}]}
+    update = {'titles': [{'title': 'Foo'}]}
+
+    result = split_unchanged_fields(root, head, update, ordered_fields=('authors',))
+
+    assert result == (
+        {'titles': [{'title': 'Foo'}]},
+        {'authors': [{'full_name': 'Smith, J.'}]},
+        {'authors': [{'full_name': 'Smith, J.'}]},
+        {},
+    )
+
+
+def test_split_unchanged_fields_resolves_fields_changed_on_one_side():
+    root = {'core': False, 'citeable': False, 'preprint_date': '2017'}
+    head = {'core': True, 'citeable': False, 'curated': True}
+    update = {'core': False, 'citeable': True, 'curated': True, 'preprint_date': '2017'}
+
+    resolved, root, head, update = split_unchanged_fields(root, head, update)
+
+    assert resolved == {'core': True, 'citeable': True, 'curated': True}
+    assert root == {}
+    assert head == {}
+    assert update == {}
+
+
+def test_split_unchanged_fields_keeps_diverged_fields():
+    root = {'core': False, 'dois': [{'value': '10.1000/1'}]}
+    head = {'core': True, 'dois': [{'value': '10.1000/1'}]}
+    update = {'core': None, 'dois': [{'value': '10.1000/2'}]}
+
+    resolved, root, head, update = split_unchanged_fields(root, head, update)
+
+    assert resolved == {}
+    assert root == {'core': False, 'dois': [{'value': '10.1000/1'}]}
+    assert head == {'core': True, 'dois': [{'value': '10.1000/1'}]}
+    assert update == {'core': None, 'dois': [{'value': '10.1000/2'}]}
+
+
+def test_split_unchanged_fields_does_not_resolve_lists_changed_on_one_side():
+    root = {'_collections': ['Literature']}
+    head = {'_collections': ['Literature']}
+    update = {'_collections': ['Literature', 'Fermilab']}
+
+    resolved, root, head, update = split_unchanged_fields(root, head, update)
+
+    assert resolved == {}
+    assert update == {'_collections': ['Literature', 'Fermilab']}
+
+
+def test_split_unchanged_fields_resolves_lists_missing_on_one_side():
+    root = {}
+    head = {}
+    update = {'references': [{'reference': {'title': {'title': 'Foo'}}}]}
+
+    resolved, root, head, update = split_unchanged_fields(root, head, update)
+
+    assert resolved == {'references': [{'reference': {'title': {'title': 'Foo'}}}]}
+    assert update == {}
+
+
+def test_copy_on_write_record_shares_unchanged_fields():
+    record = {'titles': [{'title': 'Foo'}], 'abstracts': [{'value': 'Bar'}], 'core': True}
+    view = CopyOnWriteRecord(record)
+
+    changed = view.set('titles', pvector()).remove('core')
+
+    assert view['titles'] == pvector([{'title': 'Foo'}])
+    assert 'core' in view
+    assert 'core' not in changed
+    assert sorted(changed) == ['abstracts', 'titles']
+    assert changed.to_dict() == {'titles': [], 'abstracts': [{'value': 'Bar'}]}
+    assert changed.to_dict()['abstracts'] is record['abstracts']
+    assert record == {'titles': [{'title': 'Foo'}], 'abstracts': [{'value': 'Bar'}], 'core': True}
+
+
+def test_copy_on_write_record_exposes_only_given_fields():
+    record = {'titles': [{'title': 'Foo'}], 'abstracts': [{'value': 'Bar'}]}
+    view = CopyOnWriteRecord(record, fields={'titles'})
+
+    assert list(view) == ['titles']
+    assert 'abstracts' not in view
+    assert view.get('abstracts') is None
+    assert view.remove('titles').to_dict() == {'abstracts': [{'value': 'Bar'}]}
+
+
+def test_lru_cache_computes_values_once():
+    cache = LRUCache(max_size=2)
+    computed = []
+
+    def compute(value):
+        computed.append(value)
+        return value.upper()
+
+    assert cache.get_or_compute('a', lambda: compute('a')) == 'A'
+    assert cache.get_or_compute('a', lambda: compute('a')) == 'A'
+    assert computed == ['a']
+    assert (cache.hits, cache.misses, cache.hit_rate) == (1, 1, 0.5)
+
+
+def test_lru_cache_drops_least_recently_used_values():
+    cache = LRUCache(max_size=2)
+    cache.get_or_compute('a', lambda: 1)
+    cache.get_or_compute('b', lambda: 2)
+    cache.get_or_compute('a', lambda: 1)
+    cache.get_or_compute('c', lambda: 3)
+
+    assert len(cache) == 2
+    assert cache.get_or_compute('a', lambda: None) == 1
+    assert cache.get_or_compute('b', lambda: None) is None
+
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.hit_rate == 0.0
+
+
+def test_copy_on_write_record_peek_does_not_freeze():
+    record = {'titles': [{'title': 'Foo'}], 'abstracts': [{'value': 'Bar'}]}
+    view = CopyOnWriteRecord(record, fields={'titles'})
+
+    assert view.peek('titles') is record['titles']
+    assert view.peek('abstracts') is None
+    assert view.set('titles', pvector()).peek('titles') == pvector()
+    assert view.remove('titles').peek('titles', []) == []
+
+
+def test_copy_shared_values_copies_values_found_twice():
+    affiliations = [{'value': 'DESY'}]
+    brout = {'full_name': 'Brout, R.', 'affiliations': affiliations}
+    record = {'authors': [brout, {'full_name': 'Smith, J.'}, brout]}
+
+    copy_shared_values(record)
+
+    assert record == {
+        'authors': [
+            {'full_name': 'Brout, R.', 'affiliations': [{'value': 'DESY'}]},
+            {'full_name': 'Smith, J.'},
+            {'full_name': 'Brout, R.', 'affiliations': [{'value': 'DESY'}]},
+        ],
+    }
+    first, _, second = record['authors']
+    assert first is not second
+    assert first['affiliations'] is not second['affiliations']
+    assert first['affiliations'][0] is not second['affiliations'][0]